@@ -0,0 +1,166 @@
+"""Measures handler CPU on sweep fill bursts with and without batching.
+
+Each sweep sends a set of IOC orders which the venue acks, fills in two
+parts and expires, arriving back to back through FixMarketAdapter.fromApp
+with a quiet gap between sweeps. The strategy applies each event to its
+positions and then re-evaluates its state, which costs far more than
+applying the event. A per-event handler re-evaluates on every callback; a
+BatchingOrderHandler re-evaluates once per batch. Time spent in the
+handler is reported for the per-event handler and for batching with and
+without coalescing.
+
+Run from the repository root:
+    python bench/bench_batching.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'fix_gateway'))
+
+import quickfix as fix
+
+from batching import BatchingOrderHandler
+from fix_market_gateway import FixMarketAdapter, OrderHandler, OrderType, \
+    Side, TimeInForce
+from metrics import clock
+from simple_order import Order
+
+SWEEPS = 200
+ORDERS_PER_SWEEP = 20
+QUIET_GAP = 0.005
+INSTRUMENTS = 2000
+
+
+class Strategy(object):
+
+    def __init__(self):
+        self.positions = dict.fromkeys(range(INSTRUMENTS), 0)
+        self.filled = 0
+        self.events = 0
+        self.evaluations = 0
+        self.busy = 0.0
+
+    def apply(self, callback, args):
+        self.events += 1
+        if callback == 'on_execution':
+            self.filled += args[1].last_qty
+
+    def evaluate(self):
+        self.evaluations += 1
+        return sum(self.positions.values()) + self.filled
+
+
+class PerEventHandler(OrderHandler):
+
+    def __init__(self, strategy):
+        self.strategy = strategy
+
+    def _handle(self, callback, *args):
+        start = clock()
+        self.strategy.apply(callback, args)
+        self.strategy.evaluate()
+        self.strategy.busy += clock() - start
+
+    def on_execution(self, order, execution):
+        self._handle('on_execution', order, execution)
+
+    def on_new_ack(self, order):
+        self._handle('on_new_ack', order)
+
+    def on_expired(self, order):
+        self._handle('on_expired', order)
+
+
+class BatchingHandler(BatchingOrderHandler):
+
+    def __init__(self, strategy, coalesce):
+        super(BatchingHandler, self).__init__(coalesce=coalesce)
+        self.strategy = strategy
+        self.batches = 0
+
+    def on_events(self, batch):
+        start = clock()
+        for callback, args in batch:
+            self.strategy.apply(callback, args)
+        self.strategy.evaluate()
+        self.strategy.busy += clock() - start
+        self.batches += 1
+
+
+def _order(order_id):
+    order = Order()
+    order.order_id = order_id
+    order.symbol = 'TEST'
+    order.side = Side.BUY
+    order.qty = 10
+    order.type = OrderType.LIMIT
+    order.price = 45.6
+    order.currency = 'GBP'
+    order.time_in_force = TimeInForce.IMMEDIATE_OR_CANCEL
+    return order
+
+
+def _message(text):
+    return fix.Message(text.replace('|', '\x01'), False)
+
+
+def _sweep_messages(order_id):
+    return [
+        _message('35=8|11={0}_1|17=A{0}|37=O{0}|39=0|55=TEST|150=0|'
+                 .format(order_id)),
+        _message('35=8|11={0}_1|14=4|17=F{0}|31=45.6|32=4|37=O{0}|39=1'
+                 '|54=1|55=TEST|60=20121105-23:25:25.123|150=F|151=6|'
+                 .format(order_id)),
+        _message('35=8|11={0}_1|14=7|17=G{0}|31=45.6|32=3|37=O{0}|39=1'
+                 '|54=1|55=TEST|60=20121105-23:25:25.124|150=F|151=3|'
+                 .format(order_id)),
+        _message('35=8|11={0}_1|14=7|17=E{0}|37=O{0}|39=C|55=TEST|150=C'
+                 '|151=0|'.format(order_id)),
+    ]
+
+
+def run(name, strategy, handler):
+    adapter = FixMarketAdapter(handler, reconcile_on_logon=False)
+    adapter._send_message = lambda message: None
+
+    sweeps = []
+    for sweep in range(SWEEPS):
+        orders = [_order('{}-{}'.format(sweep, i))
+                  for i in range(ORDERS_PER_SWEEP)]
+        messages = []
+        for order in orders:
+            messages.extend(_sweep_messages(order.order_id))
+        sweeps.append((orders, messages))
+
+    for orders, messages in sweeps:
+        for order in orders:
+            adapter.send_new(order)
+        for message in messages:
+            adapter.fromApp(message, None)
+        time.sleep(QUIET_GAP)
+
+    batches = ''
+    if isinstance(handler, BatchingOrderHandler):
+        handler.stop()
+        batches = '  {} batches'.format(handler.batches)
+
+    print('{:<18} handler {:>6.1f}ms  {} events  {} evaluations{}'.format(
+        name, strategy.busy * 1e3, strategy.events, strategy.evaluations,
+        batches))
+
+
+def main():
+    strategy = Strategy()
+    run('per event', strategy, PerEventHandler(strategy))
+
+    strategy = Strategy()
+    run('batched', strategy, BatchingHandler(strategy, False))
+
+    strategy = Strategy()
+    run('batched coalesced', strategy, BatchingHandler(strategy, True))
+
+
+if __name__ == '__main__':
+    main()
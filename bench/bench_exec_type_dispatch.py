@@ -0,0 +1,115 @@
+"""Measures the cost of dispatching ExecutionReports by ExecType.
+
+Compares the dispatch table used by FixMarketAdapter against the if/elif
+chain it replaced for the common NEW and TRADE ExecTypes, then times the
+full _process_execution_report path for both.
+
+Run from the repository root:
+    python bench/bench_exec_type_dispatch.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'fix_gateway'))
+
+import quickfix as fix
+
+from fix_market_gateway import ExecType_REPLACED, FixMarketAdapter, \
+    OrderHandler, OrdStatus
+from simple_order import Order
+
+DISPATCH_ITERATIONS = 200000
+PROCESS_ITERATIONS = 5000
+
+# The order of the branches in the original if/elif chain
+EXEC_TYPE_CHAIN = [
+    fix.ExecType_NEW,
+    fix.ExecType_DONE_FOR_DAY,
+    fix.ExecType_CANCELED,
+    ExecType_REPLACED,
+    fix.ExecType_PENDING_CANCEL,
+    fix.ExecType_STOPPED,
+    fix.ExecType_REJECTED,
+    fix.ExecType_SUSPENDED,
+    fix.ExecType_PENDING_NEW,
+    fix.ExecType_CALCULATED,
+    fix.ExecType_EXPIRED,
+    fix.ExecType_RESTATED,
+    fix.ExecType_PENDING_REPLACE,
+    fix.ExecType_TRADE,
+    fix.ExecType_TRADE_CORRECT,
+    fix.ExecType_TRADE_CANCEL,
+    fix.ExecType_ORDER_STATUS,
+]
+
+
+class NullOrderHandler(OrderHandler):
+
+    def __getattr__(self, name):
+        return self._ignore
+
+    @staticmethod
+    def _ignore(*args):
+        pass
+
+
+def _noop(order, message):
+    pass
+
+
+def chain_dispatch(exec_type):
+    for candidate in EXEC_TYPE_CHAIN:
+        if exec_type == candidate:
+            return _noop
+    return None
+
+
+def table_dispatch(table, exec_type):
+    return table.get(exec_type)
+
+
+def _bench(label, func, iterations):
+    elapsed = min(timeit.repeat(func, number=iterations, repeat=3))
+    print('{:<40} {:>10.1f} ns/op'.format(label, elapsed / iterations * 1e9))
+
+
+def main():
+    table = dict((exec_type, _noop) for exec_type in EXEC_TYPE_CHAIN)
+
+    for name, exec_type in (('NEW', fix.ExecType_NEW),
+                            ('TRADE', fix.ExecType_TRADE)):
+        _bench('if/elif chain {}'.format(name),
+               lambda: chain_dispatch(exec_type), DISPATCH_ITERATIONS)
+        _bench('dispatch table {}'.format(name),
+               lambda: table_dispatch(table, exec_type),
+               DISPATCH_ITERATIONS)
+
+    adapter = FixMarketAdapter(NullOrderHandler())
+    order = Order()
+    order.order_id = '12345'
+    order.qty = 10
+    adapter.order_store.update_order_maps('12345_1', order)
+
+    new_ack = fix.Message(
+        '35=8|11=12345_1|17=54321|37=123|55=TEST|150=0|'.replace('|', '\x01'),
+        False)
+    fill = fix.Message(
+        '35=8|6=0|11=12345_1|14=5|17=123|31=45.6|32=5|37=Order1|38=10'
+        '|39=1|54=1|55=TEST|60=20121105-23:25:25|150=F|151=5'
+        '|'.replace('|', '\x01'), False)
+
+    def process_new_ack():
+        order.status = OrdStatus.PENDING_NEW
+        adapter._process_execution_report(new_ack)
+
+    _bench('_process_execution_report NEW', process_new_ack,
+           PROCESS_ITERATIONS)
+    _bench('_process_execution_report TRADE',
+           lambda: adapter._process_execution_report(fill),
+           PROCESS_ITERATIONS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Measures fixed-point price encode/decode cost and notional accuracy.
+
+Times writing a price to its FIX decimal string and reading it back as a
+float, as a scaled integer, and as a Decimal. It then sums the notional of
+a run of fills at prices which are not exact in binary, comparing the float
+sum and the fixed-point sum against the exact Decimal sum.
+
+Run from the repository root:
+    python bench/bench_fixed_point.py
+"""
+from decimal import Decimal
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'fix_gateway'))
+
+import quickfix as fix
+
+from fixed_point import decode_decimal, encode_decimal
+
+ITERATIONS = 200000
+FILLS = 1000000
+PRICE_SCALE = 4
+
+
+def bench_codec():
+    float_price = 123.4567
+    fixed_price = 1234567
+    text = '123.4567'
+
+    for label, func in (
+            ('encode float', lambda: str(float_price)),
+            ('encode fix.Price', lambda: fix.Price(float_price)),
+            ('encode fixed', lambda: encode_decimal(fixed_price,
+                                                    PRICE_SCALE)),
+            ('encode Decimal', lambda: str(Decimal(text))),
+            ('decode float', lambda: float(text)),
+            ('decode fixed', lambda: decode_decimal(text, PRICE_SCALE)),
+            ('decode Decimal', lambda: Decimal(text))):
+        elapsed = min(timeit.repeat(func, number=ITERATIONS, repeat=3))
+        print('{:<18} {:>8.1f} ns/op'.format(
+            label, elapsed / ITERATIONS * 1e9))
+
+
+def bench_notional():
+    random.seed(1)
+    fills = [('{}.{:04d}'.format(random.randint(1, 500),
+                                 random.randint(0, 9999)),
+              str(random.randint(1, 1000))) for _ in range(FILLS)]
+
+    float_notional = sum(float(price) * float(qty) for price, qty in fills)
+    fixed_notional = sum(decode_decimal(price, PRICE_SCALE) *
+                         decode_decimal(qty, 0) for price, qty in fills)
+    exact_notional = sum(Decimal(price) * Decimal(qty) for price, qty in fills)
+
+    fixed_as_decimal = Decimal(fixed_notional).scaleb(-PRICE_SCALE)
+    print('notional of {} fills'.format(FILLS))
+    print('exact: {}'.format(exact_notional))
+    print('fixed: {}  error {}'.format(fixed_as_decimal,
+                                       fixed_as_decimal - exact_notional))
+    print('float: {!r}  error {}'.format(
+        float_notional, Decimal(float_notional) - exact_notional))
+
+
+def main():
+    bench_codec()
+    bench_notional()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Measures tail latency of the order path with and without low-latency mode.
+
+Builds a store holding many long-lived orders, as a gateway does after a
+day's trading, then sends orders and feeds back their acks and fills in
+bursts separated by short quiet gaps. Each send_new and fromApp call is
+timed and the percentiles reported for a default FixMarketAdapter and for
+one created with low_latency=True, where fields and messages are pooled,
+the long-lived objects are frozen out of the collector and collections
+run in the quiet gaps.
+
+Run from the repository root:
+    python bench/bench_low_latency.py
+"""
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'fix_gateway'))
+
+import quickfix as fix
+
+from fix_market_gateway import FixMarketAdapter, OrderHandler, OrderType, \
+    OrdStatus, Side, TimeInForce
+from metrics import clock
+from simple_order import Order
+
+STORED_ORDERS = 200000
+BURSTS = 100
+BURST_SIZE = 100
+QUIET_GAP = 0.01
+
+
+def _order(order_id, status=None):
+    order = Order()
+    order.order_id = order_id
+    order.symbol = 'TEST'
+    order.side = Side.BUY
+    order.qty = 10
+    order.type = OrderType.LIMIT
+    order.price = 45.6
+    order.currency = 'GBP'
+    order.time_in_force = TimeInForce.DAY
+    order.status = status
+    return order
+
+
+def _message(text):
+    return fix.Message(text.replace('|', '\x01'), False)
+
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def run(low_latency):
+    adapter = FixMarketAdapter(OrderHandler(), reconcile_on_logon=False,
+                               low_latency=low_latency)
+
+    def send(message):
+        adapter.last_activity = clock()
+    adapter._send_message = send
+
+    for i in range(STORED_ORDERS):
+        adapter.order_store.update_order_maps(
+            'S{}_1'.format(i), _order('S{}'.format(i), OrdStatus.FULLY_FILLED))
+
+    bursts = []
+    for burst in range(BURSTS):
+        work = []
+        for i in range(BURST_SIZE):
+            order_id = '{}-{}'.format(burst, i)
+            work.append((
+                _order(order_id),
+                _message('35=8|11={0}_1|17=A{0}|37=O{0}|39=0|55=TEST|150=0'
+                         '|'.format(order_id)),
+                _message('35=8|11={0}_1|14=10|17=F{0}|31=45.6|32=10|37=O{0}'
+                         '|39=2|54=1|55=TEST|60=20121105-23:25:25.123|150=F'
+                         '|151=0|'.format(order_id))))
+        bursts.append(work)
+
+    gc.collect()
+    adapter.onLogon(None)
+    latencies = []
+
+    for work in bursts:
+        for order, ack, fill in work:
+            start = clock()
+            adapter.send_new(order)
+            latencies.append(clock() - start)
+
+            start = clock()
+            adapter.fromApp(ack, None)
+            latencies.append(clock() - start)
+
+            start = clock()
+            adapter.fromApp(fill, None)
+            latencies.append(clock() - start)
+        time.sleep(QUIET_GAP)
+
+    adapter.onLogout(None)
+    latencies.sort()
+
+    print('{:<12} p50 {:>7.1f}us  p99 {:>7.1f}us  p99.9 {:>8.1f}us  '
+          'max {:>8.1f}us'.format(
+              'low latency' if low_latency else 'default',
+              _percentile(latencies, 0.5) * 1e6,
+              _percentile(latencies, 0.99) * 1e6,
+              _percentile(latencies, 0.999) * 1e6,
+              latencies[-1] * 1e6))
+
+
+def main():
+    run(False)
+    run(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Measures incremental market data throughput into the order books.
+
+Feeds pre-parsed MarketDataIncrementalRefresh messages, as QuickFIX hands
+them to the application, through FixMarketAdapter.fromApp and reports
+entries applied per second, alongside the cost of OrderBook.apply alone and
+of a top of book read. It then attaches a handler which takes 1ms per
+callback and reports how many callbacks conflation delivered for the
+updates applied.
+
+Run from the repository root:
+    python bench/bench_market_data.py
+"""
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'fix_gateway'))
+
+import quickfix as fix
+
+from fix_market_gateway import FixMarketAdapter, OrderHandler
+from market_data import MarketDataHandler, OrderBook
+
+SPEC = os.path.join(os.path.dirname(__file__), '..', 'spec', 'FIX44.xml')
+SYMBOLS = ['SYM{}'.format(i) for i in range(10)]
+MESSAGES = 20000
+ENTRIES_PER_MESSAGE = 4
+DEPTH = 10
+
+
+class CountingHandler(MarketDataHandler):
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.callbacks = 0
+
+    def on_book_update(self, book):
+        self.callbacks += 1
+        if self.delay:
+            time.sleep(self.delay)
+
+    def on_market_data_reject(self, md_req_id, reason, text):
+        pass
+
+
+def _incrementals(count):
+    data_dictionary = fix.DataDictionary(SPEC)
+    random.seed(1)
+    messages = []
+
+    for _ in range(count):
+        entries = []
+        symbol = random.choice(SYMBOLS)
+        for _ in range(ENTRIES_PER_MESSAGE):
+            entries.append('279={}|269={}|55={}|270={:.2f}|271={}'.format(
+                random.choice('001112'), random.choice('01'), symbol,
+                100 + random.randint(-DEPTH, DEPTH) * 0.01,
+                random.randint(1, 10) * 100))
+        messages.append(fix.Message(
+            '8=FIX.4.4|9=0|35=X|262=MD_1|268={}|{}|10=000|'.format(
+                ENTRIES_PER_MESSAGE, '|'.join(entries))
+            .replace('|', '\x01'), data_dictionary, False))
+
+    return messages
+
+
+def bench_book():
+    book = OrderBook('TEST', DEPTH)
+    random.seed(1)
+    updates = [(random.choice('001112'), random.choice('01'),
+                100 + random.randint(-DEPTH, DEPTH) * 0.01,
+                random.randint(1, 10) * 100) for _ in range(100000)]
+
+    start = time.time()
+    for update in updates:
+        book.apply(*update)
+    elapsed = time.time() - start
+    print('OrderBook.apply:    {:>10.0f} updates/s'.format(
+        len(updates) / elapsed))
+
+    book._publish_top()
+    elapsed = timeit.timeit(lambda: book.top[0], number=1000000)
+    print('top of book read:   {:>10.1f} ns'.format(elapsed * 1e3))
+
+
+def bench_adapter(conflate):
+    adapter = FixMarketAdapter(OrderHandler())
+    adapter._send_message = lambda message: None
+    adapter.market_data.conflate = conflate
+    handler = CountingHandler(0.001 if conflate else 0)
+    adapter.market_data.subscribe(SYMBOLS, handler, depth=DEPTH)
+
+    messages = _incrementals(MESSAGES)
+    start = time.time()
+    for message in messages:
+        adapter.fromApp(message, None)
+    elapsed = time.time() - start
+    adapter.market_data.stop()
+
+    label = 'fromApp, conflated' if conflate else 'fromApp, direct'
+    print('{:<20}{:>10.0f} entries/s'.format(
+        label + ':', MESSAGES * ENTRIES_PER_MESSAGE / elapsed))
+    if conflate:
+        print('slow handler:       {:>10} callbacks for {} messages'.format(
+            handler.callbacks, MESSAGES))
+
+
+def main():
+    bench_book()
+    bench_adapter(False)
+    bench_adapter(True)
+
+
+if __name__ == '__main__':
+    main()
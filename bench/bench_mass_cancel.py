@@ -0,0 +1,118 @@
+"""Measures time-to-all-cancelled for 10k open orders.
+
+Times how long it takes to find the orders to cancel with the store
+indexes against a scan of order_store. It then times a full kill-switch
+cycle with an OrderMassCancelRequest and with the per-order cancel burst
+fallback, feeding back one cancel ExecutionReport per order as the venue
+would. The fallback is also paced by the venue rate limit, which is
+reported separately since it is a property of the venue, not the
+gateway.
+
+Run from the repository root:
+    python bench/bench_mass_cancel.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'fix_gateway'))
+
+import quickfix as fix
+
+from fix_market_gateway import FixMarketAdapter, OrderHandler, OrdStatus, \
+    Side, TERMINAL_ORD_STATUSES
+from simple_order import Order
+
+OPEN_ORDERS = 10000
+SYMBOLS = 100
+VENUE_MESSAGES_PER_SECOND = 500
+
+
+def _create_adapter(mass_cancel_supported):
+    adapter = FixMarketAdapter(OrderHandler(),
+                               mass_cancel_supported=mass_cancel_supported,
+                               max_messages_per_second=1e9)
+    adapter._send_message = lambda message: None
+
+    for i in range(OPEN_ORDERS):
+        order = Order()
+        order.order_id = str(i)
+        order.symbol = 'SYM{}'.format(i % SYMBOLS)
+        order.side = Side.BUY if i % 2 else Side.SELL
+        order.qty = 100
+        order.status = OrdStatus.NEW
+        adapter.order_store.update_order_maps('{}_1'.format(i), order)
+
+    return adapter
+
+
+def _cancel_acks(adapter, orders):
+    cl_ord_ids = adapter.order_store.order_id_to_cl_ord_id_map
+    return [fix.Message(
+        '35=8|11={}|37=M{}|39=4|55={}|150=4|'.format(
+            cl_ord_ids[order.order_id], order.order_id, order.symbol)
+        .replace('|', '\x01'), False) for order in orders]
+
+
+def bench_lookup():
+    adapter = _create_adapter(True)
+    store = adapter.order_store
+
+    start = time.time()
+    for i in range(SYMBOLS):
+        store.find_open_orders(symbol='SYM{}'.format(i))
+    indexed = (time.time() - start) / SYMBOLS
+
+    start = time.time()
+    for i in range(SYMBOLS):
+        symbol = 'SYM{}'.format(i)
+        [order for order in store.order_store.values()
+         if order.symbol == symbol and
+         order.status not in TERMINAL_ORD_STATUSES]
+    scanned = (time.time() - start) / SYMBOLS
+
+    print('find orders for one symbol, index: {:>10.1f} us'
+          .format(indexed * 1e6))
+    print('find orders for one symbol, scan:  {:>10.1f} us'
+          .format(scanned * 1e6))
+
+
+def bench_kill_switch(mass_cancel_supported):
+    adapter = _create_adapter(mass_cancel_supported)
+    sent_messages = []
+    adapter._send_message = sent_messages.append
+
+    start = time.time()
+    orders = adapter.send_mass_cancel()
+    # The cancel burst is sent from a background thread
+    expected = 1 if mass_cancel_supported else len(orders)
+    while len(sent_messages) < expected:
+        time.sleep(0.0001)
+    sent = time.time() - start
+
+    acks = _cancel_acks(adapter, orders)
+    start = time.time()
+    for message in acks:
+        adapter.fromApp(message, None)
+    acked = time.time() - start
+
+    assert not adapter.order_store.open_order_ids
+
+    label = 'OrderMassCancelRequest' if mass_cancel_supported \
+        else 'cancel burst'
+    print('{:<24} send {:>8.3f}s  acks {:>8.3f}s  total {:>8.3f}s'
+          .format(label, sent, acked, sent + acked))
+
+
+def main():
+    bench_lookup()
+    bench_kill_switch(True)
+    bench_kill_switch(False)
+    print('cancel burst lower bound at {} msg/s: {:.3f}s'.format(
+        VENUE_MESSAGES_PER_SECOND,
+        float(OPEN_ORDERS) / VENUE_MESSAGES_PER_SECOND))
+
+
+if __name__ == '__main__':
+    main()
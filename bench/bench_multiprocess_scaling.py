@@ -0,0 +1,160 @@
+"""Measures fill throughput of GatewayEngine across 1, 2, 4 and 8 workers.
+
+Each order takes the engine's full path: the adapter builds and stores
+it, and a loopback venue thread standing in for the session acknowledges
+and fills it with ExecutionReports fed back through fromApp. Only the
+socket is left out. Each fill costs the strategy a fixed amount of CPU
+before it sends its next order.
+
+The engine is first run with no strategy work, which gives the most
+fills per second it can handle. The workers are then given enough work
+per fill that strategy CPU, not the engine, limits a single worker, so
+the speedup across worker counts shows what running strategies in their
+own processes buys, until the engine's ceiling or the number of cores is
+reached.
+
+Run from the repository root:
+    python bench/bench_multiprocess_scaling.py
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'fix_gateway'))
+
+import quickfix as fix
+
+from fix_market_gateway import OrderType, Side, TimeInForce
+from multiprocess_gateway import GatewayEngine, StrategyWorker
+from simple_order import Order
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+ENGINE_ORDERS = 8000
+ORDERS = 800
+WINDOW = 16
+# Around 15ms of CPU per fill, far above the engine's cost per order
+STRATEGY_WORK = 200000
+
+
+class LoopbackEngine(GatewayEngine):
+
+    def __init__(self, workers):
+        super(LoopbackEngine, self).__init__(None, workers)
+        self.venue_orders = Queue()
+        self.venue_thread = None
+        self.adapter._send_message = self._to_venue
+
+    def _to_venue(self, message):
+        self.venue_orders.put(message.getField(fix.ClOrdID().getField()))
+
+    def start(self):
+        super(LoopbackEngine, self).start()
+        self.venue_thread = threading.Thread(target=self._run_venue)
+        self.venue_thread.daemon = True
+        self.venue_thread.start()
+
+    def stop(self, timeout=5):
+        self.venue_orders.put(None)
+        self.venue_thread.join(timeout)
+        super(LoopbackEngine, self).stop(timeout)
+
+    def _run_venue(self):
+        while True:
+            cl_ord_id = self.venue_orders.get()
+            if cl_ord_id is None:
+                return
+            for text in _VENUE_REPORTS:
+                self.adapter.fromApp(_message(text.format(cl_ord_id)), None)
+
+
+_VENUE_REPORTS = (
+    '35=8|11={0}|17=A{0}|37=O{0}|39=0|55=TEST|150=0|',
+    '35=8|11={0}|14=100|17=F{0}|31=10.0|32=100|37=O{0}|39=2|54=1|55=TEST'
+    '|60=20121105-23:25:25.123|150=F|151=0|')
+
+
+def _message(text):
+    return fix.Message(text.replace('|', '\x01'), False)
+
+
+class BusyStrategy(StrategyWorker):
+
+    def __init__(self, orders, work, finished):
+        super(BusyStrategy, self).__init__()
+        self.orders = orders
+        self.work = work
+        self.finished = finished
+        self.sent = 0
+        self.filled = 0
+
+    def on_start(self):
+        for _ in range(min(WINDOW, self.orders)):
+            self._send_next()
+
+    def on_execution(self, order, execution):
+        sum(i * i for i in range(self.work))
+
+        self.filled += 1
+        if self.sent < self.orders:
+            self._send_next()
+        elif self.filled == self.orders:
+            with self.finished.get_lock():
+                self.finished.value += 1
+
+    def _send_next(self):
+        order = Order()
+        order.order_id = '{}-{}'.format(self.worker_id, self.sent)
+        order.symbol = 'TEST'
+        order.side = Side.BUY
+        order.qty = 100
+        order.type = OrderType.LIMIT
+        order.price = 10.0
+        order.currency = 'GBP'
+        order.time_in_force = TimeInForce.DAY
+        self.sent += 1
+        self.send_new(order)
+
+
+def run(worker_count, orders, work):
+    finished = multiprocessing.Value('i', 0)
+    workers = [BusyStrategy(orders // worker_count, work, finished)
+               for _ in range(worker_count)]
+    engine = LoopbackEngine(workers)
+
+    start = time.time()
+    engine.start()
+    while finished.value < worker_count:
+        time.sleep(0.001)
+    elapsed = time.time() - start
+    engine.stop()
+
+    return elapsed
+
+
+def main():
+    worker_counts = (1, 2, 4, 8)
+    print('{} CPUs'.format(multiprocessing.cpu_count()))
+
+    elapsed = run(max(worker_counts), ENGINE_ORDERS, 0)
+    print('Engine ceiling, no strategy work: {:.0f} fills/sec\n'
+          .format(ENGINE_ORDERS / elapsed))
+
+    print('{:>8} {:>10} {:>12} {:>8}'.format('workers', 'seconds',
+                                             'fills/sec', 'speedup'))
+    single = None
+    for worker_count in worker_counts:
+        elapsed = run(worker_count, ORDERS, STRATEGY_WORK)
+        single = single or elapsed
+        print('{:>8} {:>10.3f} {:>12.0f} {:>7.1f}x'.format(
+            worker_count, elapsed, ORDERS / elapsed, single / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Measures holding order requests while logged out and flushing them.
+
+Queues new orders on a FixMarketAdapter whose session is down, timing
+each send_new and reporting the queue depth and oldest age, then logs on
+and times the paced flush of the queue through the adapter's rate limit.
+
+Run from the repository root:
+    python bench/bench_outbound_queue.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'fix_gateway'))
+
+from fix_market_gateway import FixMarketAdapter, OrderHandler, OrderType, \
+    Side, TimeInForce
+from metrics import clock
+from outbound_queue import OutboundQueue
+from simple_order import Order
+
+ORDERS = 5000
+MAX_MESSAGES_PER_SECOND = 2000
+
+
+def _order(order_id):
+    order = Order()
+    order.order_id = order_id
+    order.symbol = 'TEST'
+    order.side = Side.BUY
+    order.qty = 10
+    order.type = OrderType.LIMIT
+    order.price = 45.6
+    order.currency = 'GBP'
+    order.time_in_force = TimeInForce.DAY
+    return order
+
+
+def main():
+    queue = OutboundQueue(ttl=60, max_depth=ORDERS)
+    adapter = FixMarketAdapter(
+        OrderHandler(), reconcile_on_logon=False,
+        max_messages_per_second=MAX_MESSAGES_PER_SECOND,
+        outbound_queue=queue)
+    sent = []
+    adapter._send_message = sent.append
+
+    orders = [_order(str(i)) for i in range(ORDERS)]
+    start = clock()
+    for order in orders:
+        adapter.send_new(order)
+    elapsed = clock() - start
+    time.sleep(0.1)
+
+    print('queued {} orders in {:.3f}s ({:.1f}us per send_new)'.format(
+        ORDERS, elapsed, elapsed / ORDERS * 1e6))
+    print('depth {}  oldest age {:.3f}s'.format(queue.depth(),
+                                                queue.oldest_age()))
+
+    # Flush on this thread rather than the one onLogon starts, so the
+    # flush alone is timed
+    queue.on_logon()
+    start = clock()
+    adapter._flush_outbound_queue()
+    elapsed = clock() - start
+
+    print('flushed {} orders in {:.3f}s ({:.0f}/s against a limit of '
+          '{}/s after the initial burst)'.format(
+              len(sent), elapsed, len(sent) / elapsed,
+              MAX_MESSAGES_PER_SECOND))
+    print('depth {}  oldest age {:.3f}s'.format(queue.depth(),
+                                                queue.oldest_age()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Measures logon reconciliation time for 100k open orders.
+
+Fills the order store with open orders, starts a reconciliation and feeds
+back one status ExecutionReport per order, as a venue would in reply to an
+OrderMassStatusRequest. A small fraction of the reports disagree with the
+store so the discrepancy path is exercised too.
+
+Run from the repository root:
+    python bench/bench_reconciliation.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'fix_gateway'))
+
+import quickfix as fix
+
+from fix_market_gateway import FixMarketAdapter, OrderHandler, OrdStatus, \
+    Side
+from simple_order import Order
+
+OPEN_ORDERS = 100000
+MISMATCH_EVERY = 1000
+
+
+class ReportingOrderHandler(OrderHandler):
+
+    def __init__(self):
+        self.report = None
+
+    def on_reconciliation_complete(self, report):
+        self.report = report
+
+
+def main():
+    handler = ReportingOrderHandler()
+    adapter = FixMarketAdapter(handler)
+    adapter._send_message = lambda message: None
+
+    for i in range(OPEN_ORDERS):
+        order = Order()
+        order.order_id = str(i)
+        order.symbol = 'TEST'
+        order.side = Side.BUY
+        order.status = OrdStatus.NEW
+        adapter.order_store.update_order_maps('{}_1'.format(i), order)
+
+    reports = []
+    for i in range(OPEN_ORDERS):
+        executed_qty = 1 if i % MISMATCH_EVERY == 0 else 0
+        last = '912=Y|' if i == OPEN_ORDERS - 1 else ''
+        reports.append(fix.Message(
+            '35=8|11={}_1|14={}|37=M{}|39=0|55=TEST|150=I|{}'.format(
+                i, executed_qty, i, last).replace('|', '\x01'), False))
+
+    # Reports only count towards the round whose MassStatusReqID they
+    # carry, which start generates, so they are tagged once it is known
+    # and the round is timed from when they begin to arrive
+    adapter.reconciler.start()
+    mass_status_req_id = fix.MassStatusReqID(
+        adapter.reconciler.mass_status_req_id)
+    for message in reports:
+        message.setField(mass_status_req_id)
+
+    start = adapter.reconciler.started = time.time()
+    for message in reports:
+        adapter.fromApp(message, None)
+    elapsed = time.time() - start
+
+    report = handler.report
+    print('open orders:          {}'.format(report.orders_checked))
+    print('reports received:     {}'.format(report.reports_received))
+    print('discrepancies:        {}'.format(len(report.discrepancies)))
+    print('reconciliation time:  {:.3f}s'.format(report.elapsed))
+    print('including decode:     {:.3f}s'.format(elapsed))
+
+
+if __name__ == '__main__':
+    main()
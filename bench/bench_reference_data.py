@@ -0,0 +1,85 @@
+"""Measures reference data load and lookup cost over 100k instruments.
+
+Writes a file of 100k instruments, then times loading and reloading it
+and, with random symbols drawn from it, find, validate, intern and
+symbol_id, in float and fixed-point modes. For comparison it times the
+same lookups on a symbol which is not in the cache.
+
+Run from the repository root:
+    python bench/bench_reference_data.py
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'fix_gateway'))
+
+from fixed_point import FixedPointCodec
+from metrics import clock
+from reference_data import ReferenceDataCache
+
+INSTRUMENTS = 100000
+ITERATIONS = 200000
+CURRENCIES = ('GBP', 'USD', 'EUR', 'JPY')
+
+
+def _write_instruments(path):
+    with open(path, 'w') as reference_file:
+        reference_file.write('symbol,currency,tick_size,lot_size\n')
+        for i in range(INSTRUMENTS):
+            reference_file.write('SYM{:06d},{},{},{}\n'.format(
+                i, CURRENCIES[i % len(CURRENCIES)],
+                ('0.01', '0.005', '0.0001')[i % 3], (1, 10, 100)[i % 3]))
+
+
+def bench(path, label, fixed_point=None):
+    start = clock()
+    cache = ReferenceDataCache(path, fixed_point=fixed_point)
+    loaded = clock() - start
+    start = clock()
+    cache.reload()
+    reloaded = clock() - start
+    print('{}: loaded {} instruments in {:.0f}ms, reloaded in {:.0f}ms'
+          .format(label, len(cache), loaded * 1e3, reloaded * 1e3))
+
+    random.seed(1)
+    symbols = ['SYM{:06d}'.format(random.randrange(INSTRUMENTS))
+               for _ in range(ITERATIONS)]
+    orders = []
+    for symbol in symbols:
+        instrument = cache.find(symbol)
+        price = 1000 * instrument.tick
+        orders.append((symbol, 10 * instrument.lot, price,
+                       instrument.currency))
+
+    for name, func in (
+            ('find', lambda: [cache.find(symbol) for symbol in symbols]),
+            ('validate', lambda: [cache.validate(*order)
+                                  for order in orders]),
+            ('intern', lambda: [cache.intern(symbol) for symbol in symbols]),
+            ('symbol_id', lambda: [cache.symbol_id(symbol)
+                                   for symbol in symbols]),
+            ('validate unknown', lambda: [cache.validate('OTHER', 10, 1.0)
+                                          for _ in symbols])):
+        elapsed = min(timeit.repeat(func, number=1, repeat=3))
+        print('  {:<18} {:>8.1f} ns/op'.format(
+            name, elapsed / ITERATIONS * 1e9))
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'instruments.csv')
+        _write_instruments(path)
+        bench(path, 'float')
+        bench(path, 'fixed point', FixedPointCodec(default_price_scale=4))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Measures UTCTimestamp parsing and formatting against the stdlib.
+
+Parses TransactTime strings at second, millisecond, microsecond and
+nanosecond precision to epoch nanoseconds with UtcTimestampCodec, and
+compares it with time.strptime plus calendar.timegm and with
+datetime.strptime, neither of which can parse nanoseconds. Formatting is
+compared with datetime.strftime for the outbound direction.
+
+Run from the repository root:
+    python bench/bench_timestamps.py
+"""
+import calendar
+from datetime import datetime
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'fix_gateway'))
+
+from timestamps import UtcTimestampCodec
+
+ITERATIONS = 100000
+
+TIMESTAMPS = (
+    ('s', '20121105-23:25:25'),
+    ('ms', '20121105-23:25:25.123'),
+    ('us', '20121105-23:25:25.123456'),
+    ('ns', '20121105-23:25:25.123456789'),
+)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _time_strptime(text):
+    seconds, _, fraction = text.partition('.')
+    nanos = calendar.timegm(time.strptime(seconds, '%Y%m%d-%H:%M:%S')) * \
+        10 ** 9
+    if fraction:
+        nanos += int(fraction) * 10 ** (9 - len(fraction))
+    return nanos
+
+
+def _datetime_strptime(text):
+    parsed = datetime.strptime(text, '%Y%m%d-%H:%M:%S.%f' if '.' in text
+                               else '%Y%m%d-%H:%M:%S')
+    delta = parsed - EPOCH
+    return ((delta.days * 86400 + delta.seconds) * 10 ** 6 +
+            delta.microseconds) * 1000
+
+
+def _report(label, func):
+    elapsed = min(timeit.repeat(func, number=ITERATIONS, repeat=3))
+    print('{:<28} {:>8.1f} ns/op'.format(label,
+                                         elapsed / ITERATIONS * 1e9))
+
+
+def main():
+    codec = UtcTimestampCodec()
+
+    for precision, text in TIMESTAMPS:
+        expected = _time_strptime(text)
+        assert codec.parse(text) == expected
+
+        _report('parse {:<2} codec'.format(precision),
+                lambda: codec.parse(text))
+        _report('parse {:<2} time.strptime'.format(precision),
+                lambda: _time_strptime(text))
+        if precision != 'ns':
+            assert _datetime_strptime(text) == expected
+            _report('parse {:<2} datetime.strptime'.format(precision),
+                    lambda: _datetime_strptime(text))
+
+    nanos = codec.parse('20121105-23:25:25.123456789')
+    moment = datetime.utcfromtimestamp(nanos // 10 ** 9)
+    _report('format ms codec', lambda: codec.format(nanos))
+    _report('format ms datetime.strftime',
+            lambda: moment.strftime('%Y%m%d-%H:%M:%S.%f')[:-3])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import logging
+import threading
+
+from fix_market_gateway import OrderHandler
+from metrics import NullMetricsRegistry, clock
+
+# Callbacks which only report an order's new status. The order itself
+# already carries its latest status, so with coalescing only the last of
+# these per order in a batch is delivered. Rejects are left out, as a
+# handler needs to know a request failed even once the order has moved on.
+STATUS_CALLBACKS = frozenset((
+    'on_new_ack', 'on_replace_ack', 'on_cancel_ack', 'on_expired',
+    'on_done_for_day', 'on_restated'))
+
+
+class BatchingOrderHandler(OrderHandler):
+    """Delivers order events to on_events in batches.
+
+    The session hands over inbound messages one at a time, so a sweep
+    filling many orders arrives as a burst of separate callbacks. Here the
+    on_* callbacks only record each event as a (callback, args) tuple, and
+    a dispatcher thread passes everything recorded to on_events once no
+    event has arrived for quiet_period. A batch is also closed once it is
+    max_delay old or holds max_batch events, so a steady stream of events
+    is still delivered. The dispatcher is started by the first event.
+    Without threaded, no dispatcher is started and the owner calls flush
+    instead, for example after each message it feeds the adapter. Events
+    arriving after stop are logged and dropped.
+
+    With coalesce set, a status event for an order replaces any earlier
+    status event for it still in the batch, so a handler sees only the
+    latest, for example on_cancel_ack rather than on_new_ack followed by
+    on_cancel_ack. Rejects, executions, corrections and busts are always
+    delivered.
+
+    Subclasses override on_events, and send_new, send_replace, send_cancel,
+    process_request and publish_response as for any OrderHandler.
+    """
+
+    def __init__(self, quiet_period=0.0005, max_delay=0.01, max_batch=1000,
+                 coalesce=False, threaded=True, metrics=None):
+        self.quiet_period = quiet_period
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.coalesce = coalesce
+        self.threaded = threaded
+        self.metrics = metrics if metrics is not None \
+            else NullMetricsRegistry()
+
+        self.events = []
+        self.status_events = {}
+        self.first_event = None
+        self.last_event = None
+        self.condition = threading.Condition()
+        self.dispatcher = None
+        self.running = False
+        self.stopped = False
+        self.log = logging.getLogger(__name__)
+
+    def on_events(self, batch):
+        """Called with the list of (callback, args) events in a batch, in
+        the order they happened.
+        """
+        pass
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+            self.stopped = False
+        self.dispatcher = threading.Thread(target=self._dispatch)
+        self.dispatcher.daemon = True
+        self.dispatcher.start()
+
+    def stop(self):
+        """Stops the dispatcher once it has delivered the events recorded
+        so far.
+        """
+        with self.condition:
+            self.running = False
+            self.stopped = True
+            self.condition.notify()
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+            self.dispatcher = None
+
+    def flush(self):
+        """Delivers the events recorded so far on the calling thread."""
+        with self.condition:
+            events = self.events
+            self.events = []
+            self.status_events = {}
+            self.first_event = None
+
+        batch = [event for event in events if event is not None]
+        if not batch:
+            return
+
+        self.metrics.increment('fix_handler_batches_total')
+        self.metrics.increment('fix_handler_batched_events_total',
+                               value=len(batch))
+        try:
+            self.on_events(batch)
+        except Exception:
+            self.log.exception('Handler failed on a batch of {} events'
+                               .format(len(batch)))
+
+    def _record(self, callback, order, *args):
+        now = clock()
+        with self.condition:
+            if self.stopped:
+                self.metrics.increment('fix_handler_dropped_events_total')
+                self.log.warn('Dropping {} for order [order id: {}] after '
+                              'stop'.format(callback, order.order_id))
+                return
+
+            if self.coalesce and callback in STATUS_CALLBACKS:
+                index = self.status_events.get(id(order))
+                if index is not None:
+                    self.events[index] = None
+                    self.metrics.increment('fix_handler_coalesced_total')
+                self.status_events[id(order)] = len(self.events)
+
+            if not self.events:
+                self.first_event = now
+            self.events.append((callback, (order,) + args))
+            self.last_event = now
+            self.condition.notify()
+
+        if self.threaded and not self.running:
+            self.start()
+
+    def _dispatch(self):
+        while True:
+            with self.condition:
+                while self.running and not self.events:
+                    self.condition.wait()
+                # Events recorded before stop are still delivered
+                if not self.events:
+                    return
+                self._wait_for_batch()
+            self.flush()
+
+    def _wait_for_batch(self):
+        # Called with the condition held; wakes on each new event to check
+        # whether the batch is complete
+        while self.running and len(self.events) < self.max_batch:
+            now = clock()
+            timeout = min(self.last_event + self.quiet_period,
+                          self.first_event + self.max_delay) - now
+            if timeout <= 0:
+                return
+            self.condition.wait(timeout)
+
+    def on_execution(self, order, execution):
+        self._record('on_execution', order, execution)
+
+    def on_execution_correct(self, order, execution):
+        self._record('on_execution_correct', order, execution)
+
+    def on_execution_cancel(self, order, execution):
+        self._record('on_execution_cancel', order, execution)
+
+    def on_new_ack(self, order):
+        self._record('on_new_ack', order)
+
+    def on_new_rej(self, order):
+        self._record('on_new_rej', order)
+
+    def on_replace_ack(self, order):
+        self._record('on_replace_ack', order)
+
+    def on_replace_rej(self, order):
+        self._record('on_replace_rej', order)
+
+    def on_cancel_ack(self, order):
+        self._record('on_cancel_ack', order)
+
+    def on_cancel_rej(self, order):
+        self._record('on_cancel_rej', order)
+
+    def on_expired(self, order):
+        self._record('on_expired', order)
+
+    def on_done_for_day(self, order):
+        self._record('on_done_for_day', order)
+
+    def on_restated(self, order):
+        self._record('on_restated', order)
+
+    def on_reconciliation_complete(self, report):
+        pass
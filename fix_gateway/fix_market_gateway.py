@@ -1,10 +1,31 @@
 from abc import abstractmethod
+from collections import defaultdict
+import itertools
 import logging
+import threading
 import time
 import quickfix as fix
 
+from fixed_point import ExcessPrecisionError, decode_decimal, \
+    encode_decimal
+from low_latency import FieldPool, GcScheduler, MessagePool, \
+    NullFieldPool, NullMessagePool
+from market_data import MarketDataManager
+from metrics import MetricsRegistry, MetricsServer, MetricsSnapshotWriter, \
+    NullMetricsRegistry, clock
+from order_state import OrderStateMachine, Transition
+from outbound_queue import OutboundQueue, QueueResult
+from profiling import ProfilingHooks
+from reconciliation import OrderReconciler
+from reference_data import ReferenceDataCache
+from throttle import RateLimiter
+from timestamps import format_utc_timestamp, parse_utc_timestamp, time_ns
 from simple_order import Execution
 
+# Older QuickFIX bindings name ExecType 5 REPLACE rather than REPLACED
+ExecType_REPLACED = getattr(fix, 'ExecType_REPLACED', None) or \
+    getattr(fix, 'ExecType_REPLACE')
+
 # TODO: Convert to enums on Python 3
 class Side(object):
     BUY = '1'
@@ -27,6 +48,104 @@ class OrdStatus(object):
     CANCEL_REJECT = '11'
     PARTIALLY_FILLED = '1'
     FULLY_FILLED = '2'
+    DONE_FOR_DAY = '3'
+    EXPIRED = 'C'
+
+
+TERMINAL_ORD_STATUSES = frozenset([
+    OrdStatus.NEW_REJECT,
+    OrdStatus.CANCELED,
+    OrdStatus.FULLY_FILLED,
+    OrdStatus.EXPIRED,
+])
+
+# Statuses in which an order awaits the venue's answer to a request, so
+# reports may still arrive ahead of their predecessor
+PENDING_ORD_STATUSES = frozenset([
+    OrdStatus.PENDING_NEW,
+    OrdStatus.PENDING_REPLACE,
+    OrdStatus.PENDING_CANCEL,
+])
+
+_LIVE_ORD_STATUS_TRANSITIONS = [
+    OrdStatus.PENDING_REPLACE,
+    OrdStatus.PENDING_CANCEL,
+    OrdStatus.PARTIALLY_FILLED,
+    OrdStatus.FULLY_FILLED,
+    OrdStatus.CANCELED,
+    OrdStatus.EXPIRED,
+    OrdStatus.DONE_FOR_DAY,
+]
+
+# Legal OrdStatus transitions, anything not listed is either deferred or
+# illegal (see OrderStateMachine)
+ORD_STATUS_TRANSITIONS = {
+    OrdStatus.PENDING_NEW: [
+        OrdStatus.NEW,
+        OrdStatus.NEW_REJECT,
+        OrdStatus.PENDING_REPLACE,
+        OrdStatus.PENDING_CANCEL,
+        OrdStatus.PARTIALLY_FILLED,
+        OrdStatus.FULLY_FILLED,
+        OrdStatus.CANCELED,
+        OrdStatus.EXPIRED,
+    ],
+    OrdStatus.NEW: _LIVE_ORD_STATUS_TRANSITIONS,
+    OrdStatus.REPLACED: _LIVE_ORD_STATUS_TRANSITIONS,
+    OrdStatus.REPLACE_REJECT: _LIVE_ORD_STATUS_TRANSITIONS,
+    OrdStatus.CANCEL_REJECT: _LIVE_ORD_STATUS_TRANSITIONS,
+    OrdStatus.PARTIALLY_FILLED: _LIVE_ORD_STATUS_TRANSITIONS,
+    OrdStatus.PENDING_REPLACE: [
+        OrdStatus.NEW,
+        OrdStatus.REPLACED,
+        OrdStatus.REPLACE_REJECT,
+        OrdStatus.PENDING_REPLACE,
+        OrdStatus.PENDING_CANCEL,
+        OrdStatus.PARTIALLY_FILLED,
+        OrdStatus.FULLY_FILLED,
+        OrdStatus.CANCELED,
+        OrdStatus.EXPIRED,
+    ],
+    OrdStatus.PENDING_CANCEL: [
+        OrdStatus.NEW,
+        OrdStatus.CANCELED,
+        OrdStatus.CANCEL_REJECT,
+        OrdStatus.PENDING_CANCEL,
+        OrdStatus.PARTIALLY_FILLED,
+        OrdStatus.FULLY_FILLED,
+        OrdStatus.EXPIRED,
+    ],
+    OrdStatus.DONE_FOR_DAY: [
+        OrdStatus.NEW,
+        OrdStatus.PENDING_CANCEL,
+        OrdStatus.CANCELED,
+        OrdStatus.EXPIRED,
+    ],
+    OrdStatus.NEW_REJECT: [],
+    OrdStatus.CANCELED: [],
+    OrdStatus.FULLY_FILLED: [],
+    OrdStatus.EXPIRED: [],
+}
+
+# Answers to a replace or cancel request. A fill, or the ack for an earlier
+# request, while the request is outstanding moves the order on from its
+# pending status, but the answer must still be applied when it arrives.
+REQUEST_ANSWERS = {
+    OrdStatus.PENDING_REPLACE: frozenset([
+        OrdStatus.REPLACED,
+        OrdStatus.REPLACE_REJECT,
+    ]),
+    OrdStatus.PENDING_CANCEL: frozenset([
+        OrdStatus.CANCELED,
+        OrdStatus.CANCEL_REJECT,
+    ]),
+}
+
+# Status changes only a trade correction or bust may make, on top of
+# ORD_STATUS_TRANSITIONS, since they take back executed quantity
+CORRECTION_ORD_STATUS_TRANSITIONS = {
+    OrdStatus.PARTIALLY_FILLED: frozenset([OrdStatus.NEW]),
+}
 
 
 class RequestType(object):
@@ -34,6 +153,14 @@ class RequestType(object):
     AMEND = '1'
     CANCEL = '2'
 
+# Pending status a request puts an order in, and the status it takes if
+# the request is rejected locally
+LOCAL_REJECTS = {
+    RequestType.NEW: (OrdStatus.PENDING_NEW, OrdStatus.NEW_REJECT),
+    RequestType.AMEND: (OrdStatus.PENDING_REPLACE, OrdStatus.REPLACE_REJECT),
+    RequestType.CANCEL: (OrdStatus.PENDING_CANCEL, OrdStatus.CANCEL_REJECT),
+}
+
 OrdRejReason = {
     0: 'Broker / Exchange option',
     1: 'Unknown symbol',
@@ -82,21 +209,99 @@ class TimeInForce(object):
 
 class FixMarketAdapter(fix.Application):
 
-    def __init__(self, order_handler):
+    def __init__(self, order_handler, reconcile_on_logon=False,
+                 mass_status_supported=True, mass_cancel_supported=True,
+                 max_messages_per_second=500, metrics=None,
+                 fixed_point=None, low_latency=False, outbound_queue=None,
+                 reference_data=None, mass_cancel_timeout=30):
         super(FixMarketAdapter, self).__init__()
         self.order_handler = order_handler
-        self.order_store = FixOrderStore()
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.order_store = FixOrderStore(self.metrics)
+        self.fixed_point = fixed_point
+        self.last_activity = clock()
+        if low_latency:
+            self.field_pool = FieldPool()
+            self.message_pool = MessagePool()
+            self.gc_scheduler = GcScheduler(lambda: self.last_activity,
+                                            metrics=self.metrics)
+        else:
+            self.field_pool = NullFieldPool()
+            self.message_pool = NullMessagePool()
+            self.gc_scheduler = None
+        self.market_data = MarketDataManager(self)
+        self.exec_type_handlers = self._create_exec_type_handlers()
+        self.state_machine = OrderStateMachine(ORD_STATUS_TRANSITIONS,
+                                               PENDING_ORD_STATUSES)
+        self._replaying_deferred = False
+        self.session_id = None
+        self.reconcile_on_logon = reconcile_on_logon
+        self.reconciler = OrderReconciler(
+            self, TERMINAL_ORD_STATUSES,
+            mass_status_supported=mass_status_supported)
+        self.mass_cancel_supported = mass_cancel_supported
+        self.mass_cancels = {}
+        self.mass_cancel_timeout = mass_cancel_timeout
+        self.rate_limiter = RateLimiter(max_messages_per_second)
+        self.outbound_queue = outbound_queue
+        self.reference_data = reference_data
+        self.outbound_expiry = None
+        self.outbound_flush = None
+        # Held while processing inbound messages and while sending,
+        # expiring or cancelling requests, from whichever thread, so only one
+        # of them changes the store at a time. Reentrant as handlers may send
+        # from within their callbacks.
+        self.outbound_lock = threading.RLock()
         self.log = logging.getLogger(__name__)
 
+        self.metrics.set_gauge('fix_logged_on', 0)
+        self.metrics.register_gauge(
+            'fix_illegal_status_transitions',
+            lambda: sum(self.state_machine.illegal_transitions.values()))
+        self.metrics.register_gauge(
+            'fix_orders_with_deferred_events',
+            lambda: len(self.state_machine.deferred))
+        if outbound_queue is not None:
+            self.metrics.register_gauge('fix_outbound_queue_depth',
+                                        outbound_queue.depth)
+            self.metrics.register_gauge(
+                'fix_outbound_queue_oldest_age_seconds',
+                outbound_queue.oldest_age)
+        if reference_data is not None:
+            self.metrics.register_gauge('fix_reference_data_instruments',
+                                        reference_data.__len__)
+
     def onCreate(self, sessionID):
         return
 
     def onLogon(self, sessionID):
         self.log.info("Connected")
+        self.session_id = sessionID
+        self.metrics.increment('fix_logons_total')
+        self.metrics.set_gauge('fix_logged_on', 1)
+
+        if self.reconcile_on_logon:
+            self.reconciler.start()
+        self.market_data.resubscribe()
+        if self.gc_scheduler is not None:
+            self.gc_scheduler.start()
+        if self.outbound_queue is not None:
+            self.outbound_queue.on_logon()
+            self._start_outbound_flush()
         return
 
     def onLogout(self, sessionID):
         self.log.info("Disconnected")
+        self.session_id = None
+        self.metrics.increment('fix_logouts_total')
+        self.metrics.set_gauge('fix_logged_on', 0)
+        self.reconciler.finish(complete=False)
+        self._expire_mass_cancels(all_pending=True)
+        self.market_data.clear_books()
+        if self.gc_scheduler is not None:
+            self.gc_scheduler.stop()
+        if self.outbound_queue is not None:
+            self.outbound_queue.on_logout()
         return
 
     def toAdmin(self, sessionID, message):
@@ -106,15 +311,46 @@ class FixMarketAdapter(fix.Application):
         return
 
     def fromApp(self, message, sessionID):
+        start = clock()
 
-        msgType = message.getHeader().getField(fix.MsgType())
+        self.last_activity = start
+        msgType = self.field_pool.get(message.getHeader(), fix.MsgType)
+        labels = (('msg_type', msgType),)
+        self.metrics.increment('fix_messages_received_total', labels)
 
-        if msgType == fix.MsgType_ExecutionReport:
-            self._process_execution_report(message)
-        elif msgType == fix.MsgType_OrderCancelReject:
-            self._process_order_cancel_reject(message)
-        else:
-            self.log.warn('Unsupported msgType value: {}'.format(msgType))
+        self.outbound_lock.acquire()
+        try:
+            if msgType == fix.MsgType_ExecutionReport:
+                self._process_execution_report(message)
+            elif msgType == fix.MsgType_OrderCancelReject:
+                self._process_order_cancel_reject(message)
+            elif msgType == fix.MsgType_OrderMassCancelReport:
+                self._process_order_mass_cancel_report(message)
+            elif msgType == fix.MsgType_BusinessMessageReject:
+                self._process_business_message_reject(message)
+            elif msgType == fix.MsgType_MarketDataIncrementalRefresh:
+                self.market_data.on_incremental(message)
+            elif msgType == fix.MsgType_MarketDataSnapshotFullRefresh:
+                self.market_data.on_snapshot(message)
+            elif msgType == fix.MsgType_MarketDataRequestReject:
+                self.market_data.on_request_reject(message)
+            else:
+                self.metrics.increment('fix_unsupported_messages_total',
+                                       labels)
+                self.log.warn('Unsupported msgType value: {}'.format(msgType))
+        except StoreException:
+            self.metrics.increment('fix_store_exceptions_total', labels)
+            raise
+        except InvalidValueException as e:
+            # A value which can't be parsed at all, so the message can't be
+            # applied
+            self.metrics.increment('fix_invalid_messages_total', labels)
+            self.log.error('Dropping message with an invalid value [{}], '
+                           'exception: {}'.format(message, e))
+        finally:
+            self.outbound_lock.release()
+            self.metrics.observe('fix_from_app_seconds', clock() - start,
+                                 labels)
 
         return
 
@@ -123,165 +359,655 @@ class FixMarketAdapter(fix.Application):
         return
 
     def send_new(self, order):
-        order.status = OrdStatus.PENDING_NEW
-
-        message = fix.Message()
-        message.getHeader().setField(fix.MsgType(fix.MsgType_NewOrderSingle))
-
-        message.setField(fix.Symbol(order.symbol))
-        message.setField(fix.Side(order.side))
-        message.setField(fix.OrderQty(order.qty))
+        with self.outbound_lock:
+            if not self._transition_outbound(order, OrdStatus.PENDING_NEW):
+                return
+            if not self._validate(RequestType.NEW, order):
+                return
+            if not self._hold(RequestType.NEW, order):
+                self._send_new(order)
+
+    def _send_new(self, order):
+        message = self.message_pool.acquire(fix.MsgType_NewOrderSingle)
+
+        price_scale, qty_scale = self._scales(order.symbol)
+        fields = self.field_pool
+        fields.set(message, fix.Symbol, order.symbol)
+        fields.set(message, fix.Side, order.side)
+        self._set_decimal_field(message, fix.OrderQty, order.qty, qty_scale)
 
         if order.type is not OrderType.MARKET:
-            message.setField(fix.Price(order.price))
-            message.setField(fix.Currency(order.currency))
+            self._set_decimal_field(message, fix.Price, order.price,
+                                    price_scale)
+            fields.set(message, fix.Currency, order.currency)
 
-        message.setField(fix.OrdType(order.type))
-        message.setField(fix.TimeInForce(order.time_in_force))
+        fields.set(message, fix.OrdType, order.type)
+        fields.set(message, fix.TimeInForce, order.time_in_force)
 
         cl_ord_id = self.order_store.generate_new_cl_ord_id(order.order_id)
-        message.setField(fix.ClOrdID(cl_ord_id))
+        fields.set(message, fix.ClOrdID, cl_ord_id)
+        self._set_timestamp_field(message, fix.TransactTime, time_ns())
 
         self.order_store.update_order_maps(cl_ord_id, order)
-        self._send_message(message)
+        sent = self._send_message(message)
+        self.message_pool.release(message)
+        return sent
 
     def send_replace(self, order):
-        order.status = OrdStatus.PENDING_REPLACE
-
-        message = fix.Message()
-        message.getHeader().setField(
-            fix.MsgType(fix.MsgType_OrderCancelReplaceRequest))
-
-        message.setField(fix.Symbol(order.symbol))
-        message.setField(fix.Side(order.side))
-        message.setField(fix.OrderQty(order.qty))
+        with self.outbound_lock:
+            if not self._transition_outbound(order, OrdStatus.PENDING_REPLACE):
+                return
+            if not self._validate(RequestType.AMEND, order):
+                return
+            if not self._hold(RequestType.AMEND, order):
+                self._send_replace(order)
+
+    def _send_replace(self, order):
+        message = self.message_pool.acquire(
+            fix.MsgType_OrderCancelReplaceRequest)
+
+        price_scale, qty_scale = self._scales(order.symbol)
+        fields = self.field_pool
+        fields.set(message, fix.Symbol, order.symbol)
+        fields.set(message, fix.Side, order.side)
+        self._set_decimal_field(message, fix.OrderQty, order.qty, qty_scale)
 
         if order.type is not OrderType.MARKET:
-            message.setField(fix.Price(order.price))
+            self._set_decimal_field(message, fix.Price, order.price,
+                                    price_scale)
 
-        message.setField(fix.OrdType(order.type))
-        message.setField(fix.TimeInForce(order.time_in_force))
+        fields.set(message, fix.OrdType, order.type)
+        fields.set(message, fix.TimeInForce, order.time_in_force)
 
         cl_ord_id = self.order_store.generate_next_cl_ord_id(order.order_id)
-        message.setField(fix.ClOrdID(cl_ord_id))
+        fields.set(message, fix.ClOrdID, cl_ord_id)
+        self._set_timestamp_field(message, fix.TransactTime, time_ns())
 
         self.order_store.update_order_maps(cl_ord_id, order)
-        self._send_message(message)
+        sent = self._send_message(message)
+        self.message_pool.release(message)
+        return sent
 
     def send_cancel(self, order):
-        order.status = OrdStatus.PENDING_CANCEL
+        with self.outbound_lock:
+            if not self._transition_outbound(order, OrdStatus.PENDING_CANCEL):
+                return
+            if not self._hold(RequestType.CANCEL, order):
+                self._send_cancel(order)
 
-        message = fix.Message()
-        message.getHeader().setField(
-            fix.MsgType(fix.MsgType_OrderCancelRequest))
+    def _send_cancel(self, order):
+        message = self.message_pool.acquire(fix.MsgType_OrderCancelRequest)
 
-        message.setField(fix.Symbol(order.symbol))
-        message.setField(fix.Side(order.side))
-        message.setField(fix.OrderQty(order.qty))
+        _, qty_scale = self._scales(order.symbol)
+        fields = self.field_pool
+        fields.set(message, fix.Symbol, order.symbol)
+        fields.set(message, fix.Side, order.side)
+        self._set_decimal_field(message, fix.OrderQty, order.qty, qty_scale)
 
         cl_ord_id = self.order_store.generate_next_cl_ord_id(order.order_id)
-        message.setField(fix.ClOrdID(cl_ord_id))
+        fields.set(message, fix.ClOrdID, cl_ord_id)
+        self._set_timestamp_field(message, fix.TransactTime, time_ns())
 
         self.order_store.update_order_maps(cl_ord_id, order)
+        sent = self._send_message(message)
+        self.message_pool.release(message)
+        return sent
+
+    def _validate(self, request_type, order):
+        """Returns False, having rejected the request locally, if the order
+        fails the reference data checks for its symbol.
+        """
+        if self.reference_data is None:
+            return True
+
+        if order.type is OrderType.MARKET:
+            price = currency = None
+        else:
+            price = order.price
+            currency = order.currency if request_type == RequestType.NEW \
+                else None
+        reason = self.reference_data.validate(order.symbol, order.qty, price,
+                                              currency)
+        if reason is None:
+            if request_type == RequestType.NEW:
+                # One string per symbol is then shared by every order in the
+                # store and its indexes
+                order.symbol = self.reference_data.intern(order.symbol)
+            return True
+
+        ord_rej_reason, text = reason
+        self.metrics.increment('fix_local_rejects_total',
+                               (('reason', str(ord_rej_reason)),))
+        self.log.error('Request for order [order id: {}] rejected locally, '
+                       '({}) {}'.format(order.order_id, ord_rej_reason, text))
+        self._reject_locally(request_type, order)
+        return False
+
+    def _hold(self, request_type, order):
+        """Returns True if the outbound queue held or refused the request,
+        rather than it being sent now.
+        """
+        if self.outbound_queue is None:
+            return False
+
+        result = self.outbound_queue.offer(request_type, order)
+        if result == QueueResult.SEND:
+            return False
+
+        labels = (('request_type', request_type),)
+        if result == QueueResult.QUEUED:
+            self.metrics.increment('fix_outbound_queued_total', labels)
+            self._start_outbound_expiry()
+        else:
+            self.metrics.increment('fix_outbound_refused_total', labels)
+            self.log.warn('Session down, refusing request for order '
+                          '[order id: {}]'.format(order.order_id))
+            self._reject_locally(request_type, order)
+        return True
+
+    def _start_outbound_flush(self):
+        with self.outbound_lock:
+            if self.outbound_flush is not None:
+                # The running flush goes on to send anything queued since
+                return
+            self.outbound_flush = threading.Thread(
+                target=self._flush_outbound_queue)
+            self.outbound_flush.daemon = True
+            self.outbound_flush.start()
+
+    def _flush_outbound_queue(self):
+        sent = 0
+        send = {
+            RequestType.NEW: self._send_new,
+            RequestType.AMEND: self._send_replace,
+            RequestType.CANCEL: self._send_cancel,
+        }
+
+        while True:
+            with self.outbound_lock:
+                entry = self.outbound_queue.take()
+                if entry is None:
+                    self.outbound_flush = None
+                    break
+
+                _, request_type, order = entry
+                if self.outbound_queue.is_expired(entry):
+                    self._expire_outbound(entry)
+                    continue
+
+            self.rate_limiter.acquire()
+            with self.outbound_lock:
+                if send[request_type](order):
+                    sent += 1
+                else:
+                    # The session went down after the request was taken
+                    self._reject_locally(request_type, order)
+
+        self.metrics.increment('fix_outbound_flushed_total', value=sent)
+        self.log.info('Sent {} queued requests'.format(sent))
+
+    def _start_outbound_expiry(self):
+        with self.outbound_lock:
+            if self.outbound_expiry is not None:
+                return
+            self.outbound_expiry = threading.Thread(
+                target=self._expire_outbound_periodically)
+            self.outbound_expiry.daemon = True
+            self.outbound_expiry.start()
+
+    def _expire_outbound_periodically(self):
+        while True:
+            time.sleep(self.outbound_queue.expiry_interval)
+            with self.outbound_lock:
+                for entry in self.outbound_queue.expire():
+                    self._expire_outbound(entry)
+
+                if not self.outbound_queue.depth():
+                    self.outbound_expiry = None
+                    return
+
+    def _expire_outbound(self, entry):
+        enqueued_at, request_type, order = entry
+        self.metrics.increment('fix_outbound_expired_total',
+                               (('request_type', request_type),))
+        self.log.error('Request for order [order id: {}] expired after '
+                       '{:.1f}s in the outbound queue'.format(
+                           order.order_id,
+                           self.outbound_queue.clock() - enqueued_at))
+        self._reject_locally(request_type, order)
+
+    def _reject_locally(self, request_type, order):
+        pending_status, reject_status = LOCAL_REJECTS[request_type]
+        if request_type != RequestType.NEW and order.status != pending_status:
+            # A later request for the order has superseded this one
+            self.log.info('Not rejecting superseded request for order '
+                          '[order id: {}] with status {}'
+                          .format(order.order_id, order.status))
+            return
+
+        self.order_store.set_status(order, reject_status)
+        if request_type == RequestType.NEW:
+            # The order never reached the venue, so nothing else held for it
+            # can be sent
+            if self.outbound_queue is not None:
+                self.outbound_queue.discard(order)
+            self.order_handler.on_new_rej(order)
+        elif request_type == RequestType.AMEND:
+            self.order_handler.on_replace_rej(order)
+        else:
+            self.order_handler.on_cancel_rej(order)
+
+    def register_exec_type_handler(self, exec_type, handler):
+        """Override the handler used for an ExecType value.
+
+        The handler is called with the order the report refers to and the
+        ExecutionReport message.
+        """
+        self.exec_type_handlers[exec_type] = handler
+
+    def _create_exec_type_handlers(self):
+        return {
+            fix.ExecType_NEW: self._on_exec_new,
+            fix.ExecType_DONE_FOR_DAY: self._on_exec_done_for_day,
+            fix.ExecType_CANCELED: self._on_exec_canceled,
+            ExecType_REPLACED: self._on_exec_replace,
+            fix.ExecType_PENDING_CANCEL: self._on_exec_pending_cancel,
+            fix.ExecType_STOPPED: self._on_exec_ignored,
+            fix.ExecType_REJECTED: self._on_exec_rejected,
+            fix.ExecType_SUSPENDED: self._on_exec_ignored,
+            fix.ExecType_PENDING_NEW: self._on_exec_pending_new,
+            fix.ExecType_CALCULATED: self._on_exec_ignored,
+            fix.ExecType_EXPIRED: self._on_exec_expired,
+            fix.ExecType_RESTATED: self._on_exec_restated,
+            fix.ExecType_PENDING_REPLACE: self._on_exec_pending_replace,
+            fix.ExecType_TRADE: self._on_exec_trade,
+            fix.ExecType_TRADE_CORRECT: self._on_exec_trade_correct,
+            fix.ExecType_TRADE_CANCEL: self._on_exec_trade_cancel,
+            fix.ExecType_ORDER_STATUS: self._on_exec_order_status,
+        }
+
+    def send_mass_cancel(self, symbol=None, side=None):
+        """Cancels every open order on the session, or only those for a
+        symbol and/or side.
+
+        An OrderMassCancelRequest is sent if the venue supports it, otherwise
+        an OrderCancelRequest per order is sent from a background thread,
+        paced to the adapter's message rate limit. Returns the orders being
+        cancelled.
+        """
+        if self.mass_cancel_supported:
+            self.rate_limiter.acquire()
+
+        # Reports change the store and its indexes on the session thread
+        with self.outbound_lock:
+            # Orders of a mass cancel which has gone unanswered are resolved
+            # first, so they can be targeted again
+            self._expire_mass_cancels()
+            orders = self.order_store.find_open_orders(symbol=symbol,
+                                                       side=side)
+            orders = [order for order in orders
+                      if order.status != OrdStatus.PENDING_CANCEL]
+
+            if self.mass_cancel_supported:
+                self._send_order_mass_cancel_request(orders, symbol, side)
+
+        if not self.mass_cancel_supported:
+            thread = threading.Thread(target=self._send_cancels,
+                                      args=(orders,))
+            thread.daemon = True
+            thread.start()
+
+        return orders
+
+    def _send_cancels(self, orders):
+        for order in orders:
+            self.rate_limiter.acquire()
+            with self.outbound_lock:
+                # Skip orders which have been done or cancelled since
+                if order.status not in TERMINAL_ORD_STATUSES and \
+                        order.status != OrdStatus.PENDING_CANCEL:
+                    self.send_cancel(order)
+
+    def _send_order_mass_cancel_request(self, orders, symbol, side):
+        message = fix.Message()
+        message.getHeader().setField(
+            fix.MsgType(fix.MsgType_OrderMassCancelRequest))
+
+        cl_ord_id = self.order_store.generate_mass_cancel_id()
+        message.setField(fix.ClOrdID(cl_ord_id))
+
+        if symbol is not None:
+            message.setField(fix.MassCancelRequestType(
+                fix.MassCancelRequestType_CANCEL_ORDERS_FOR_A_SECURITY))
+            message.setField(fix.Symbol(symbol))
+        else:
+            message.setField(fix.MassCancelRequestType(
+                fix.MassCancelRequestType_CANCEL_ALL_ORDERS))
+
+        if side is not None:
+            message.setField(fix.Side(side))
+
+        self._set_timestamp_field(message, fix.TransactTime, time_ns())
+
+        self.mass_cancels[cl_ord_id] = (time.time(), [
+            order for order in orders
+            if self._transition_outbound(order, OrdStatus.PENDING_CANCEL)])
         self._send_message(message)
 
+        # Expire the mass cancel even if nothing else is sent or received
+        timer = threading.Timer(self.mass_cancel_timeout,
+                                self._expire_mass_cancel, [cl_ord_id])
+        timer.daemon = True
+        timer.start()
+
+    def _expire_mass_cancels(self, all_pending=False):
+        """Stops waiting for OrderMassCancelReports which have not arrived
+        within mass_cancel_timeout, or for any of them on logout.
+
+        Their orders are treated as if the mass cancel had been rejected,
+        so they can be cancelled or replaced again.
+        """
+        expire_before = time.time() - self.mass_cancel_timeout
+        with self.outbound_lock:
+            for cl_ord_id, (sent_at, _) in list(self.mass_cancels.items()):
+                if all_pending or sent_at <= expire_before:
+                    self._expire_mass_cancel(cl_ord_id)
+
+    def _expire_mass_cancel(self, cl_ord_id):
+        with self.outbound_lock:
+            if cl_ord_id not in self.mass_cancels:
+                # Answered or already expired
+                return
+
+            _, orders = self.mass_cancels.pop(cl_ord_id)
+            self.metrics.increment('fix_mass_cancels_expired_total')
+            self.log.warn('No report for mass cancel [ClOrdId: {}, {} '
+                          'orders]'.format(cl_ord_id, len(orders)))
+            self._reject_mass_cancel(orders)
+
+    def _reject_mass_cancel(self, orders):
+        for order in orders:
+            if order.status == OrdStatus.PENDING_CANCEL:
+                self.order_store.set_status(order, OrdStatus.CANCEL_REJECT)
+                self.order_handler.on_cancel_rej(order)
+
     def _process_execution_report(self, message):
-        cl_ord_id = self._extract_field(fix.ClOrdID(), message)
-        exec_type = self._extract_field(fix.ExecType(), message)
-        market_order_id = self._extract_optional_field(fix.OrderID(), message)
+        fields = self.field_pool
+        cl_ord_id = fields.get(message, fix.ClOrdID)
+        exec_type = fields.get(message, fix.ExecType)
+        market_order_id = fields.get_optional(message, fix.OrderID)
 
-        order = self.order_store.find_order(cl_ord_id, market_order_id)
+        try:
+            order = self.order_store.find_order(cl_ord_id, market_order_id)
+        except StoreException:
+            if exec_type == fix.ExecType_ORDER_STATUS:
+                # The venue knows of an order we don't
+                self.reconciler.on_unknown_order(cl_ord_id, market_order_id,
+                                                 message)
+                return
+            raise
 
         # We only update the market order if it's changed
         self.order_store.store_market_order_id(market_order_id, order.order_id)
 
-        order.order_id = self.order_store.find_order_id(cl_ord_id)
+        handler = self.exec_type_handlers.get(exec_type)
+        if handler is not None:
+            start = clock()
+            handler(order, message)
+            self.metrics.observe('fix_exec_type_handler_seconds',
+                                 clock() - start,
+                                 (('exec_type', exec_type),))
+            self._replay_deferred(order)
+        else:
+            self.log.error('Unknown execType: {}'.format(exec_type))
 
-        if exec_type == fix.ExecType_NEW:
-            order.status = OrdStatus.NEW
+    def _on_exec_new(self, order, message):
+        if self._transition(order, OrdStatus.NEW, message,
+                            self._process_execution_report):
             self.order_handler.on_new_ack(order)
 
-        elif exec_type == fix.ExecType_DONE_FOR_DAY:
-            pass
+    def _on_exec_done_for_day(self, order, message):
+        if self._transition(order, OrdStatus.DONE_FOR_DAY, message,
+                            self._process_execution_report):
+            self.order_handler.on_done_for_day(order)
 
-        elif exec_type == fix.ExecType_CANCELED:
-            order.status = OrdStatus.CANCELED
+    def _on_exec_canceled(self, order, message):
+        if self._transition(order, OrdStatus.CANCELED, message,
+                            self._process_execution_report):
             self.order_handler.on_cancel_ack(order)
 
-        elif exec_type == fix.ExecType_REPLACE:
-            order.status = OrdStatus.REPLACED
+    def _on_exec_replace(self, order, message):
+        if self._transition(order, OrdStatus.REPLACED, message,
+                            self._process_execution_report):
             self.order_handler.on_replace_ack(order)
 
-        elif exec_type == fix.ExecType_PENDING_CANCEL:
-            self.log.info('Received pending cancel for order [order id: {}]'
-                         .format(order.order_id))
-
-        elif exec_type == fix.ExecType_STOPPED:
-            pass
+    def _on_exec_pending_cancel(self, order, message):
+        self.log.info('Received pending cancel for order [order id: {}]'
+                      .format(order.order_id))
 
-        elif exec_type == fix.ExecType_REJECTED:
-            ord_rej_reason = self._extract_field(fix.OrdRejReason(), message)
-            self.log.error('Submission rejected, ({}) {}'.format(
-                OrdRejReason[ord_rej_reason], ord_rej_reason))
-            order.status = OrdStatus.NEW_REJECT
+    def _on_exec_rejected(self, order, message):
+        ord_rej_reason = self._extract_field(fix.OrdRejReason(), message)
+        self.log.error('Submission rejected, ({}) {}'.format(
+            OrdRejReason[ord_rej_reason], ord_rej_reason))
+        if self._transition(order, OrdStatus.NEW_REJECT, message,
+                            self._process_execution_report):
             self.order_handler.on_new_rej(order)
 
-        elif exec_type == fix.ExecType_SUSPENDED:
-            pass
-
-        elif exec_type == fix.ExecType_PENDING_NEW:
-            self.log.info('Received pending new for order [order id: {}]'
-                         .format(order.order_id))
-
-        elif exec_type == fix.ExecType_CALCULATED:
-            pass
-
-        elif exec_type == fix.ExecType_EXPIRED:
-            pass
-
-        elif exec_type == fix.ExecType_RESTATED:
-            pass
-
-        elif exec_type == fix.ExecType_PENDING_REPLACE:
-            self.log.info('Received pending replace for order [order id: {}]'
-                         .format(order.order_id))
-
-        elif exec_type == fix.ExecType_TRADE:
-            exec_id = self._extract_field(fix.ExecID(), message)
-            transact_time = self._extract_date_field(fix.TransactTime(),
-                                                     message)
-            remaining_qty = self._extract_field(fix.LeavesQty(), message)
-            executed_qty = self._extract_field(fix.CumQty(), message)
-            last_qty = self._extract_field(fix.LastQty(), message)
-            last_px = self._extract_field(fix.LastPx(), message)
-
+    def _on_exec_pending_new(self, order, message):
+        self.log.info('Received pending new for order [order id: {}]'
+                      .format(order.order_id))
+
+    def _on_exec_expired(self, order, message):
+        if self._transition(order, OrdStatus.EXPIRED, message,
+                            self._process_execution_report):
+            self.order_handler.on_expired(order)
+
+    def _on_exec_restated(self, order, message):
+        price_scale, qty_scale = self._scales(order.symbol)
+        leaves_qty = self._extract_optional_decimal_field(
+            fix.LeavesQty, message, qty_scale)
+        executed_qty = self._extract_optional_decimal_field(
+            fix.CumQty, message, qty_scale)
+        price = self._extract_optional_decimal_field(fix.Price, message,
+                                                     price_scale)
+
+        if executed_qty is not None:
             order.executed_qty = executed_qty
-
-            execution = Execution(order.order_id)
-            execution.exec_id = exec_id
-            execution.transact_time = transact_time
-            execution.last_price = last_px
-            execution.last_qty = last_qty
-
-            if remaining_qty == 0:
-                order.status = OrdStatus.FULLY_FILLED
+        if leaves_qty is not None:
+            order.qty = order.executed_qty + leaves_qty
+        if price is not None:
+            order.price = price
+
+        self.order_handler.on_restated(order)
+
+    def _on_exec_pending_replace(self, order, message):
+        self.log.info('Received pending replace for order [order id: {}]'
+                      .format(order.order_id))
+
+    def _on_exec_trade(self, order, message):
+        exec_id = self.field_pool.get(message, fix.ExecID)
+        transact_time = self._extract_timestamp_field(fix.TransactTime,
+                                                      message)
+        price_scale, qty_scale = self._scales(order.symbol)
+        remaining_qty = self._extract_decimal_field(fix.LeavesQty, message,
+                                                    qty_scale)
+        executed_qty = self._extract_decimal_field(fix.CumQty, message,
+                                                   qty_scale)
+        last_qty = self._extract_decimal_field(fix.LastQty, message,
+                                               qty_scale)
+        last_px = self._extract_decimal_field(fix.LastPx, message,
+                                              price_scale)
+
+        if remaining_qty == 0:
+            status = OrdStatus.FULLY_FILLED
+        else:
+            status = OrdStatus.PARTIALLY_FILLED
+
+        if not self._transition(order, status, message,
+                                self._process_execution_report):
+            return
+
+        order.executed_qty = executed_qty
+
+        execution = Execution(order.order_id)
+        execution.exec_id = exec_id
+        execution.transact_time = transact_time
+        execution.last_price = last_px
+        execution.last_qty = last_qty
+
+        self.order_store.store_exec_id(exec_id, execution)
+        self.order_store.add_execution_notional(execution)
+        self.order_handler.on_execution(order, execution)
+
+    def _on_exec_trade_correct(self, order, message):
+        execution = self._find_referenced_execution(message)
+        price_scale, qty_scale = self._scales(order.symbol)
+        last_qty = self._extract_decimal_field(fix.LastQty, message,
+                                               qty_scale)
+        last_px = self._extract_decimal_field(fix.LastPx, message,
+                                              price_scale)
+
+        self._adjust_executed_qty(order, last_qty - execution.last_qty,
+                                  message)
+
+        self.order_store.remove_execution_notional(execution)
+        execution.last_qty = last_qty
+        execution.last_price = last_px
+        self.order_store.add_execution_notional(execution)
+        self._rekey_execution(execution, message)
+
+        self.order_handler.on_execution_correct(order, execution)
+
+    def _on_exec_trade_cancel(self, order, message):
+        execution = self._find_referenced_execution(message)
+
+        self._adjust_executed_qty(order, -execution.last_qty, message)
+
+        self.order_store.remove_execution_notional(execution)
+        execution.last_qty = 0
+        self._rekey_execution(execution, message)
+
+        self.order_handler.on_execution_cancel(order, execution)
+
+    def _on_exec_order_status(self, order, message):
+        self.log.debug('Received order status for order [order id: {}]'
+                       .format(order.order_id))
+        self.reconciler.on_status_report(order, message)
+
+    def _on_exec_ignored(self, order, message):
+        self.log.debug('Ignoring execType: {} for order [order id: {}]'
+                       .format(self._extract_field(fix.ExecType(), message),
+                               order.order_id))
+
+    def _transition(self, order, status, message, process):
+        """Applies an inbound status change if the state machine allows it.
+
+        Changes which arrive ahead of their predecessor while the order is
+        pending are held back and replayed through process once the order
+        has moved on, unless process is None. Stale changes are counted and
+        dropped.
+        """
+        result = self.state_machine.check(order.status, status)
+        if result == Transition.ILLEGAL and \
+                order.status not in TERMINAL_ORD_STATUSES and \
+                self.order_store.awaits_answer(order, status):
+            # The venue answering a request which a fill or an ack for an
+            # earlier request overtook
+            result = Transition.LEGAL
+
+        if result == Transition.LEGAL:
+            self.order_store.set_status(order, status)
+            return True
+        elif result == Transition.DEFERRED and process is not None:
+            # The engine owns the message passed to fromApp, so keep a copy
+            self.state_machine.defer(
+                order.order_id, order.status, status,
+                (process, fix.Message(message.toString(), False)))
+        else:
+            self.state_machine.record_illegal(order.order_id, order.status,
+                                              status)
+        return False
+
+    def _transition_outbound(self, order, status):
+        if self.state_machine.check(order.status, status) == \
+                Transition.LEGAL:
+            self.order_store.set_status(order, status)
+            return True
+        else:
+            self.state_machine.record_illegal(order.order_id, order.status,
+                                              status)
+            self.log.error('Not sending request for order [order id: {}] '
+                           'with status {}'.format(order.order_id,
+                                                   order.status))
+            return False
+
+    def _replay_deferred(self, order):
+        if self._replaying_deferred or \
+                not self.state_machine.has_deferred(order.order_id):
+            return
+
+        self._replaying_deferred = True
+        try:
+            progressed = True
+            while progressed and \
+                    self.state_machine.has_deferred(order.order_id):
+                status = order.status
+                for process, message in \
+                        self.state_machine.pop_deferred(order.order_id):
+                    process(message)
+                progressed = order.status != status
+        finally:
+            self._replaying_deferred = False
+
+        if order.status in TERMINAL_ORD_STATUSES:
+            self.state_machine.discard_deferred(order.order_id, order.status)
+
+    def _find_referenced_execution(self, message):
+        exec_ref_id = self._extract_field(fix.ExecRefID(), message)
+        return self.order_store.find_execution(exec_ref_id)
+
+    def _rekey_execution(self, execution, message):
+        # Corrections and busts carry their own ExecID, subsequent
+        # corrections will reference that rather than the original
+        exec_id = self._extract_field(fix.ExecID(), message)
+        execution.exec_id = exec_id
+        self.order_store.store_exec_id(exec_id, execution)
+
+    def _adjust_executed_qty(self, order, qty_delta, message):
+        # Prefer the venue's view of the order when it is supplied
+        _, qty_scale = self._scales(order.symbol)
+        executed_qty = self._extract_optional_decimal_field(
+            fix.CumQty, message, qty_scale)
+        if executed_qty is None:
+            executed_qty = order.executed_qty + qty_delta
+        order.executed_qty = executed_qty
+
+        status = self.field_pool.get_optional(message, fix.OrdStatus)
+        if status is None:
+            remaining_qty = self._extract_optional_decimal_field(
+                fix.LeavesQty, message, qty_scale)
+            if remaining_qty is None:
+                remaining_qty = order.qty - executed_qty
+
+            if remaining_qty == 0 and executed_qty > 0:
+                status = OrdStatus.FULLY_FILLED
+            elif executed_qty > 0:
+                status = OrdStatus.PARTIALLY_FILLED
             else:
-                order.status = OrdStatus.PARTIALLY_FILLED
-
-            self.order_store.store_exec_id(exec_id, execution)
-            self.order_handler.on_execution(order, execution)
-
-        elif exec_type == fix.ExecType_TRADE_CORRECT:
-            pass
-
-        elif exec_type == fix.ExecType_TRADE_CANCEL:
-            pass
-
-        elif exec_type == fix.ExecType_ORDER_STATUS:
-            pass
-
+                status = OrdStatus.NEW
+
+        if status == order.status:
+            return
+        if order.status in TERMINAL_ORD_STATUSES:
+            # A done order is never reopened, only its quantities corrected
+            self.state_machine.record_illegal(order.order_id, order.status,
+                                              status)
+            return
+        if status in CORRECTION_ORD_STATUS_TRANSITIONS.get(order.status, ()):
+            self.order_store.set_status(order, status)
         else:
-            self.log.error('Unknown execType: {}'.format(exec_type))
+            # Corrections are applied once, so they are never deferred
+            self._transition(order, status, message, None)
 
     def _process_order_cancel_reject(self, message):
         cl_ord_id = self._extract_field(fix.ClOrdID(), message)
@@ -293,21 +1019,107 @@ class FixMarketAdapter(fix.Application):
 
         if cxl_rej_response_to == \
                 CxlRejResponseTo.ORDER_CANCEL_REPLACE_REQUEST:
-            order.status = OrdStatus.REPLACE_REJECT
-            self.order_handler.on_replace_rej(order)
+            if self._transition(order, OrdStatus.REPLACE_REJECT, message,
+                                self._process_order_cancel_reject):
+                self.order_handler.on_replace_rej(order)
         elif cxl_rej_response_to == CxlRejResponseTo.ORDER_CANCEL_REQUEST:
-            order.status = OrdStatus.CANCEL_REJECT
-            self.order_handler.on_cancel_rej(order)
+            if self._transition(order, OrdStatus.CANCEL_REJECT, message,
+                                self._process_order_cancel_reject):
+                self.order_handler.on_cancel_rej(order)
         else:
             self.log.error('Unknown CxlRejResponseTo value: {}'
                            .format(cxl_rej_response_to))
+            return
+
+        self._replay_deferred(order)
+
+    def _process_order_mass_cancel_report(self, message):
+        cl_ord_id = self._extract_field(fix.ClOrdID(), message)
+        response = self._extract_field(fix.MassCancelResponse(), message)
+        _, orders = self.mass_cancels.pop(cl_ord_id, (None, []))
+
+        if response != fix.MassCancelResponse_CANCEL_REQUEST_REJECTED:
+            self.log.info('Mass cancel accepted [ClOrdId: {}, {} orders]'
+                          .format(cl_ord_id, len(orders)))
+            return
+
+        reason = self._extract_optional_field(fix.MassCancelRejectReason(),
+                                              message)
+        self.log.error('Mass cancel rejected [ClOrdId: {}], reason: {}'
+                       .format(cl_ord_id, reason))
+
+        self._reject_mass_cancel(orders)
+
+    def _process_business_message_reject(self, message):
+        ref_msg_type = self._extract_field(fix.RefMsgType(), message)
+        text = self._extract_optional_field(fix.Text(), message)
+
+        if ref_msg_type == fix.MsgType_OrderMassStatusRequest:
+            self.reconciler.on_mass_status_rejected()
+        else:
+            self.log.warn('Business message reject for msgType: {}, {}'
+                          .format(ref_msg_type, text))
 
     def _send_message(self, message):
+        """Returns False if the message could not be sent as there is no
+        session.
+        """
+        self.last_activity = clock()
         try:
-            fix.Session.sendToTarget(message)
+            if self.session_id is not None:
+                fix.Session.sendToTarget(message, self.session_id)
+            else:
+                fix.Session.sendToTarget(message)
+            self.metrics.increment('fix_messages_sent_total')
+            return True
         except fix.SessionNotFound as e:
+            self.metrics.increment('fix_session_not_found_total')
             self.log.error('Unable to send message [{}], exception: {}'
                            .format(message, e))
+            return False
+
+    def _scales(self, symbol):
+        """Returns the (price, quantity) scales for a symbol in fixed-point
+        mode, or (None, None) when prices and quantities are floats.
+        """
+        if self.fixed_point is None:
+            return None, None
+        return (self.fixed_point.price_scale(symbol),
+                self.fixed_point.qty_scale(symbol))
+
+    def _set_decimal_field(self, message, field_type, value, scale):
+        if scale is None:
+            self.field_pool.set(message, field_type, value)
+        else:
+            self.field_pool.set_string(message, field_type,
+                                       encode_decimal(value, scale))
+
+    def _extract_decimal_field(self, field_type, message, scale):
+        if scale is None:
+            return self.field_pool.get(message, field_type)
+        text = self.field_pool.get_string(message, field_type)
+        try:
+            return decode_decimal(text, scale)
+        except ExcessPrecisionError:
+            # The venue sent more decimal places than the symbol's scale
+            # holds, which needs the scale fixing, but the report is still
+            # applied rather than lost
+            tag = field_type().getField()
+            self.metrics.increment('fix_decimals_rounded_total',
+                                   (('tag', str(tag)),))
+            self.log.error('Rounding {}={} to {} decimal places'
+                           .format(tag, text, scale))
+            return decode_decimal(text, scale, round_excess=True)
+        except ValueError as e:
+            raise InvalidValueException(str(e))
+
+    def _extract_optional_decimal_field(self, field_type, message, scale):
+        if scale is None:
+            return self.field_pool.get_optional(message, field_type)
+        if message.isSetField(field_type().getField()):
+            return self._extract_decimal_field(field_type, message, scale)
+        else:
+            return None
 
     @staticmethod
     def _extract_field(field, message):
@@ -326,14 +1138,47 @@ class FixMarketAdapter(fix.Application):
         message.getField(field)
         return field.getString()
 
+    def _extract_timestamp_field(self, field_type, message):
+        """Returns a UTCTimestamp field as integer epoch nanoseconds."""
+        try:
+            return parse_utc_timestamp(self.field_pool.get_string(message,
+                                                                  field_type))
+        except ValueError as e:
+            raise InvalidValueException(str(e))
+
+    def _set_timestamp_field(self, message, field_type, nanos):
+        self.field_pool.set_string(message, field_type,
+                                   format_utc_timestamp(nanos))
+
 
 class FixOrderStore:
-    def __init__(self):
+    def __init__(self, metrics=None):
         self.cl_ord_id_to_order_id_map = {}
         self.order_id_to_cl_ord_id_map = {}
         self.market_order_id_map = {}
         self.exec_id_map = {}
         self.order_store = {}
+        self.executed_notional = defaultdict(int)
+
+        # Secondary indexes, kept up to date by store_order and set_status
+        self.index_keys = {}
+        self.orders_by_status = defaultdict(set)
+        self.open_order_ids = set()
+        self.open_orders_by_symbol = defaultdict(set)
+        self.open_orders_by_side = defaultdict(set)
+        # Pending statuses of the replace and cancel requests still awaiting
+        # an answer per order, also kept up to date by set_status
+        self.outstanding_requests = {}
+        self.mass_cancel_ids = itertools.count(1)
+
+        self.metrics = metrics if metrics is not None \
+            else NullMetricsRegistry()
+        self.metrics.register_gauge('fix_orders_stored',
+                                    lambda: len(self.order_store))
+        self.metrics.register_gauge('fix_open_orders',
+                                    lambda: len(self.open_order_ids))
+        self.metrics.register_gauge('fix_executions_stored',
+                                    lambda: len(self.exec_id_map))
 
         self.log = logging.getLogger(__name__)
 
@@ -395,8 +1240,95 @@ class FixOrderStore:
                 '[ClOrdId: {}, MarketOrderId: {}'
                 .format(cl_ord_id, market_order_id))
 
+    def generate_mass_cancel_id(self):
+        return 'MC_{}_{}'.format(int(time.time()), next(self.mass_cancel_ids))
+
     def store_order(self, order):
         self.order_store[order.order_id] = order
+        self._index_order(order)
+
+    def set_status(self, order, status):
+        """Updates an order's status, keeping the indexes in step."""
+        order.status = status
+        self._track_request(order.order_id, status)
+        if order.order_id in self.order_store:
+            self._index_order(order)
+
+    def _track_request(self, order_id, status):
+        if status in REQUEST_ANSWERS:
+            self.outstanding_requests.setdefault(order_id, set()).add(status)
+            return
+
+        pending = self.outstanding_requests.get(order_id)
+        if pending is None:
+            return
+
+        if status in TERMINAL_ORD_STATUSES:
+            pending.clear()
+        else:
+            for pending_status in list(pending):
+                if status in REQUEST_ANSWERS[pending_status]:
+                    pending.discard(pending_status)
+        if not pending:
+            del self.outstanding_requests[order_id]
+
+    def awaits_answer(self, order, status):
+        """Returns True if status answers a replace or cancel request still
+        outstanding for the order.
+        """
+        return any(status in REQUEST_ANSWERS[pending_status]
+                   for pending_status in
+                   self.outstanding_requests.get(order.order_id, ()))
+
+    def _index_order(self, order):
+        order_id = order.order_id
+        self._unindex_order(order_id)
+
+        self.index_keys[order_id] = (order.symbol, order.side, order.status)
+        self.orders_by_status[order.status].add(order_id)
+
+        if order.status not in TERMINAL_ORD_STATUSES:
+            self.open_order_ids.add(order_id)
+            self.open_orders_by_symbol[order.symbol].add(order_id)
+            self.open_orders_by_side[order.side].add(order_id)
+
+    def _unindex_order(self, order_id):
+        if order_id not in self.index_keys:
+            return
+
+        symbol, side, status = self.index_keys.pop(order_id)
+        self.orders_by_status[status].discard(order_id)
+        self.open_order_ids.discard(order_id)
+        self.open_orders_by_symbol[symbol].discard(order_id)
+        self.open_orders_by_side[side].discard(order_id)
+
+    def open_orders(self):
+        return [self.order_store[order_id]
+                for order_id in self.open_order_ids]
+
+    def find_open_orders(self, symbol=None, side=None, status=None):
+        """Returns the open orders matching every filter given.
+
+        Starts from the smallest matching index so the cost is proportional
+        to the number of candidates rather than the size of the store.
+        """
+        candidates = [self.open_order_ids]
+        if symbol is not None:
+            candidates.append(self.open_orders_by_symbol.get(symbol, set()))
+        if side is not None:
+            candidates.append(self.open_orders_by_side.get(side, set()))
+        if status is not None:
+            candidates.append(self.orders_by_status.get(status, set()))
+
+        candidates.sort(key=len)
+        smallest, others = candidates[0], candidates[1:]
+
+        return [self.order_store[order_id] for order_id in smallest
+                if all(order_id in other for other in others)]
+
+    def find_orders_by_status(self, status):
+        return [self.order_store[order_id]
+                for order_id in self.orders_by_status.get(status, ())]
 
     def store_market_order_id(self, market_order_id, order_id):
         if market_order_id not in self.market_order_id_map:
@@ -405,11 +1337,39 @@ class FixOrderStore:
     def store_exec_id(self, exec_id, execution):
         self.exec_id_map[exec_id] = execution
 
+    def add_execution_notional(self, execution):
+        self.executed_notional[execution.order_id] += \
+            execution.last_price * execution.last_qty
+
+    def remove_execution_notional(self, execution):
+        self.executed_notional[execution.order_id] -= \
+            execution.last_price * execution.last_qty
+
+    def find_executed_notional(self, order_id):
+        """Returns the sum of price * quantity over an order's fills.
+
+        In fixed-point mode this is an exact integer at the sum of the price
+        and quantity scales.
+        """
+        return self.executed_notional.get(order_id, 0)
+
+    def find_execution(self, exec_id):
+        if exec_id in self.exec_id_map:
+            return self.exec_id_map[exec_id]
+        else:
+            raise StoreException('Unable to find execution for ExecId: {}'
+                                 .format(exec_id))
+
 
 class StoreException(Exception):
     pass
 
 
+class InvalidValueException(ValueError):
+    """Raised when a field of an inbound message can't be decoded."""
+    pass
+
+
 class OrderHandler(object):
 
     @abstractmethod
@@ -428,6 +1388,14 @@ class OrderHandler(object):
     def on_execution(self, order, execution):
         pass
 
+    @abstractmethod
+    def on_execution_correct(self, order, execution):
+        pass
+
+    @abstractmethod
+    def on_execution_cancel(self, order, execution):
+        pass
+
     @abstractmethod
     def on_new_ack(self, order):
         pass
@@ -452,6 +1420,22 @@ class OrderHandler(object):
     def on_cancel_rej(self, order):
         pass
 
+    @abstractmethod
+    def on_expired(self, order):
+        pass
+
+    @abstractmethod
+    def on_done_for_day(self, order):
+        pass
+
+    @abstractmethod
+    def on_restated(self, order):
+        pass
+
+    @abstractmethod
+    def on_reconciliation_complete(self, report):
+        pass
+
     @abstractmethod
     def process_request(self, request_type, order):
         pass
@@ -463,29 +1447,71 @@ class OrderHandler(object):
 
 class FixMarketGateway(OrderHandler):
 
-    def __init__(self, config_file):
+    def __init__(self, config_file, low_latency=False,
+                 reference_data_file=None, reconcile_on_logon=False,
+                 metrics_port=None, metrics_snapshot_path=None,
+                 metrics_snapshot_interval=10):
         self.order_store = FixOrderStore()
+        # Orders are checked against the instruments in the file, if given,
+        # which is reloaded whenever it changes
+        self.reference_data = None
+        if reference_data_file is not None:
+            self.reference_data = ReferenceDataCache(reference_data_file)
+            self.reference_data.start()
+        # Requests made while the session is down are held until logon
+        self.adapter = FixMarketAdapter(self, low_latency=low_latency,
+                                        outbound_queue=OutboundQueue(),
+                                        reference_data=self.reference_data,
+                                        reconcile_on_logon=reconcile_on_logon)
+        # The adapter's metrics are served over local HTTP and/or written
+        # to a file, if asked for, while the gateway is running
+        self.metrics_server = None
+        if metrics_port is not None:
+            self.metrics_server = MetricsServer(self.adapter.metrics,
+                                                metrics_port)
+        self.metrics_snapshot_writer = None
+        if metrics_snapshot_path is not None:
+            self.metrics_snapshot_writer = MetricsSnapshotWriter(
+                self.adapter.metrics, metrics_snapshot_path,
+                metrics_snapshot_interval)
+        self.profiling = ProfilingHooks(self.adapter)
         self.initiator = self._create_fix_socket(config_file)
         self.log = logging.getLogger(__name__)
 
     def _create_fix_socket(self, config_file):
         settings = fix.SessionSettings(config_file)
-        gateway = FixMarketAdapter(self)
         store_factory = fix.FileStoreFactory(settings)
         log_factory = fix.ScreenLogFactory(settings)
-        return fix.SocketInitiator(gateway, store_factory, settings,
+        return fix.SocketInitiator(self.adapter, store_factory, settings,
                                    log_factory)
 
     def start(self):
+        if self.metrics_server is not None:
+            # Profiling can then be started with a GET to /profile/cpu or
+            # /profile/memory
+            self.metrics_server.register_admin_commands(
+                self.profiling.admin_commands())
+            self.metrics_server.start()
+        if self.metrics_snapshot_writer is not None:
+            self.metrics_snapshot_writer.start()
         self.initiator.start()
 
+    def stop(self):
+        self.initiator.stop()
+        if self.reference_data is not None:
+            self.reference_data.stop()
+        if self.metrics_snapshot_writer is not None:
+            self.metrics_snapshot_writer.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+
     def process_request(self, request_type, order):
         if request_type == RequestType.NEW:
-            self.gateway.send_new(order)
+            self.adapter.send_new(order)
         elif request_type == RequestType.AMEND:
-            self.gateway.send_replace(order)
+            self.adapter.send_replace(order)
         elif request_type == RequestType.CANCEL:
-            self.gateway.send_cancel(order)
+            self.adapter.send_cancel(order)
         else:
             self.log.error('Invalid request type specified: {}'
                     .format(request_type))
@@ -505,6 +1531,12 @@ class FixMarketGateway(OrderHandler):
     def on_execution(self, order, execution):
         pass
 
+    def on_execution_correct(self, order, execution):
+        pass
+
+    def on_execution_cancel(self, order, execution):
+        pass
+
     def on_new_ack(self, order):
         pass
 
@@ -523,10 +1555,24 @@ class FixMarketGateway(OrderHandler):
     def on_cancel_rej(self, order):
         pass
 
+    def on_expired(self, order):
+        pass
+
+    def on_done_for_day(self, order):
+        pass
+
+    def on_restated(self, order):
+        pass
+
+    def on_reconciliation_complete(self, report):
+        pass
+
 
 def main():
     try:
-        gateway = FixMarketGateway('../config/client.cfg')
+        gateway = FixMarketGateway('../config/client.cfg', metrics_port=9100)
+        # SIGUSR1 profiles the adapter for 10s, SIGUSR2 tracks allocations
+        gateway.profiling.install_signal_handlers()
         gateway.start()
 
         while 1:
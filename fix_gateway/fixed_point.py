@@ -0,0 +1,68 @@
+class FixedPointCodec(object):
+    """Per-symbol decimal scales for fixed-point prices and quantities.
+
+    In fixed-point mode a price of 123.456 with a scale of 4 is held as the
+    integer 1234560, and is written to and read from the FIX decimal
+    string without passing through a float.
+    """
+
+    def __init__(self, default_price_scale=4, default_qty_scale=0,
+                 price_scales=None, qty_scales=None):
+        self.default_price_scale = default_price_scale
+        self.default_qty_scale = default_qty_scale
+        self.price_scales = dict(price_scales or {})
+        self.qty_scales = dict(qty_scales or {})
+
+    def set_scales(self, symbol, price_scale, qty_scale=None):
+        self.price_scales[symbol] = price_scale
+        if qty_scale is not None:
+            self.qty_scales[symbol] = qty_scale
+
+    def price_scale(self, symbol):
+        return self.price_scales.get(symbol, self.default_price_scale)
+
+    def qty_scale(self, symbol):
+        return self.qty_scales.get(symbol, self.default_qty_scale)
+
+
+def encode_decimal(value, scale):
+    """Formats a scaled integer as a FIX decimal string."""
+    if scale == 0:
+        return str(value)
+
+    digits = str(abs(value)).rjust(scale + 1, '0')
+    sign = '-' if value < 0 else ''
+    return sign + digits[:-scale] + '.' + digits[-scale:]
+
+
+class ExcessPrecisionError(ValueError):
+    """Raised for a number with more decimal places than its scale holds."""
+    pass
+
+
+def decode_decimal(text, scale, round_excess=False):
+    """Parses a FIX decimal string into an integer at the given scale.
+
+    Raises ExcessPrecisionError if the value has more significant decimal
+    places than the scale can hold, unless round_excess is set, in which
+    case it is rounded half away from zero. Raises ValueError if the text
+    is not a number.
+    """
+    whole, _, fraction = text.partition('.')
+    if len(fraction) > scale:
+        excess = fraction[scale:]
+        fraction = fraction[:scale]
+        if excess.strip('0'):
+            value = int(whole + fraction or '0')
+            if not excess.isdigit():
+                raise ValueError('{} is not a decimal'.format(text))
+            if not round_excess:
+                raise ExcessPrecisionError(
+                    '{} has more than {} decimal places'.format(text, scale))
+            if excess[0] >= '5':
+                value += -1 if whole.lstrip().startswith('-') else 1
+            return value
+
+    # int() accepts the sign and leading zeros, so the digits are joined
+    # and parsed in one call
+    return int(whole + fraction + '0' * (scale - len(fraction)) or '0')
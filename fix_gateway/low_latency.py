@@ -0,0 +1,229 @@
+import gc
+import logging
+import threading
+
+import quickfix as fix
+
+from metrics import NullMetricsRegistry, clock
+
+
+def _read_bool(value):
+    return value == 'Y'
+
+
+_CONVERTERS = (
+    (fix.DoubleField, float),
+    (fix.IntField, int),
+    (fix.BoolField, _read_bool),
+)
+
+
+class NullFieldPool(object):
+    """Reads and writes fields through a new field object per call."""
+
+    def get(self, message, field_type):
+        field = field_type()
+        message.getField(field)
+        return field.getValue()
+
+    def get_optional(self, message, field_type):
+        field = field_type()
+        if message.isSetField(field):
+            message.getField(field)
+            return field.getValue()
+        return None
+
+    def get_string(self, message, field_type):
+        field = field_type()
+        message.getField(field)
+        return field.getString()
+
+    def set(self, message, field_type, value):
+        message.setField(field_type(value))
+
+    def set_string(self, message, field_type, text):
+        message.setField(fix.StringField(field_type().getField(), text))
+
+
+class FieldPool(object):
+    """Reads and writes fields without allocating a field object per call.
+
+    Reads go by tag, which returns the raw string without the binding's
+    overload resolution for field objects, and convert it to the type the
+    field object would have returned. Writes reuse one field object per
+    type and thread.
+    """
+
+    def __init__(self):
+        self.readers = {}
+        self.local = threading.local()
+
+    def _reader(self, field_type):
+        try:
+            return self.readers[field_type]
+        except KeyError:
+            field = field_type()
+            convert = str
+            for base, converter in _CONVERTERS:
+                if isinstance(field, base):
+                    convert = converter
+                    break
+            reader = self.readers[field_type] = (field.getField(), convert)
+            return reader
+
+    def _field(self, field_type):
+        try:
+            fields = self.local.fields
+        except AttributeError:
+            fields = self.local.fields = {}
+
+        field = fields.get(field_type)
+        if field is None:
+            field = fields[field_type] = field_type()
+        return field
+
+    def get(self, message, field_type):
+        tag, convert = self._reader(field_type)
+        return convert(message.getField(tag))
+
+    def get_optional(self, message, field_type):
+        tag, convert = self._reader(field_type)
+        if message.isSetField(tag):
+            return convert(message.getField(tag))
+        return None
+
+    def get_string(self, message, field_type):
+        return message.getField(self._reader(field_type)[0])
+
+    def set(self, message, field_type, value):
+        field = self._field(field_type)
+        field.setValue(value)
+        message.setField(field)
+
+    def set_string(self, message, field_type, text):
+        field = self._field(field_type)
+        field.setString(text)
+        message.setField(field)
+
+
+class NullMessagePool(object):
+    """Creates a new message per call."""
+
+    def acquire(self, msg_type):
+        message = fix.Message()
+        message.getHeader().setField(fix.MsgType(msg_type))
+        return message
+
+    def release(self, message):
+        pass
+
+
+class MessagePool(object):
+    """Reuses outbound messages, one per MsgType and thread.
+
+    A message must be released once sent, and not kept by the caller
+    after that, since the next acquire on the thread clears and reuses it.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def acquire(self, msg_type):
+        try:
+            messages = self.local.messages
+        except AttributeError:
+            messages = self.local.messages = {}
+
+        message = messages.pop(msg_type, None)
+        if message is None:
+            message = fix.Message()
+        else:
+            message.clear()
+        message.getHeader().setField(fix.MsgType(msg_type))
+        return message
+
+    def release(self, message):
+        msg_type = message.getHeader().getField(fix.MsgType().getField())
+        self.local.messages[msg_type] = message
+
+
+class GcScheduler(object):
+    """Moves cyclic garbage collection to quiet moments in the session.
+
+    On start the objects which exist at that point, such as the
+    configuration, session and order store built at startup, are frozen
+    out of the collector where gc.freeze is available, and automatic
+    collection is disabled. A thread then collects the younger
+    generations once last_activity is at least quiet_period old, and all
+    generations every full_interval. A collection is forced if none has
+    run for max_delay, so garbage stays bounded under continuous load.
+    """
+
+    def __init__(self, last_activity, quiet_period=0.002, poll_interval=0.001,
+                 full_interval=60, max_delay=1, metrics=None):
+        self.last_activity = last_activity
+        self.quiet_period = quiet_period
+        self.poll_interval = poll_interval
+        self.full_interval = full_interval
+        self.max_delay = max_delay
+        self.metrics = metrics if metrics is not None \
+            else NullMetricsRegistry()
+
+        self.stopped = threading.Event()
+        self.thread = None
+        self.was_enabled = None
+        self.log = logging.getLogger(__name__)
+
+    def start(self):
+        if self.thread is not None:
+            return
+
+        self.was_enabled = gc.isenabled()
+        gc.disable()
+        if hasattr(gc, 'freeze'):
+            gc.collect()
+            gc.freeze()
+            self.log.info('Froze {} objects out of the garbage collector'
+                          .format(gc.get_freeze_count()))
+
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+        if self.was_enabled:
+            gc.enable()
+
+    def _run(self):
+        last_collection = last_full_collection = clock()
+        threshold = gc.get_threshold()[0]
+
+        while not self.stopped.wait(self.poll_interval):
+            now = clock()
+            overdue = now - last_collection >= self.max_delay
+            quiet = now - self.last_activity() >= self.quiet_period
+
+            if not overdue and not (quiet and gc.get_count()[0] >= threshold):
+                continue
+
+            if now - last_full_collection >= self.full_interval:
+                generation = 2
+                last_full_collection = now
+            else:
+                generation = 1
+
+            gc.collect(generation)
+            last_collection = clock()
+            self.metrics.observe('fix_gc_pause_seconds',
+                                 last_collection - now,
+                                 (('generation', str(generation)),))
@@ -0,0 +1,500 @@
+from abc import abstractmethod
+from array import array
+from collections import defaultdict
+import itertools
+import logging
+import threading
+
+import quickfix as fix
+
+from fixed_point import decode_decimal
+
+MD_ENTRY_BID = '0'
+MD_ENTRY_OFFER = '1'
+MD_ENTRY_TRADE = '2'
+
+MD_UPDATE_NEW = '0'
+MD_UPDATE_CHANGE = '1'
+MD_UPDATE_DELETE = '2'
+
+# Tags read per entry on the market data hot path, as ints for Group
+# reads and as strings for splitting raw messages
+_SYMBOL = fix.Symbol().getField()
+_MD_ENTRY_TYPE = fix.MDEntryType().getField()
+_MD_ENTRY_PX = fix.MDEntryPx().getField()
+_MD_ENTRY_SIZE = fix.MDEntrySize().getField()
+_NO_MD_ENTRIES = fix.NoMDEntries().getField()
+
+_SYMBOL_TAG = str(_SYMBOL)
+_MD_ENTRY_TYPE_TAG = str(_MD_ENTRY_TYPE)
+_MD_ENTRY_PX_TAG = str(_MD_ENTRY_PX)
+_MD_ENTRY_SIZE_TAG = str(_MD_ENTRY_SIZE)
+_MD_UPDATE_ACTION_TAG = str(fix.MDUpdateAction().getField())
+
+# Released QuickFIX bindings name SubscriptionRequestType 1 and 2
+# SNAPSHOT_PLUS_UPDATES and DISABLE_PREVIOUS_SNAPSHOT_PLUS_UPDATE_REQUEST
+SubscriptionRequestType_SNAPSHOT_PLUS_UPDATES = getattr(
+    fix, 'SubscriptionRequestType_SNAPSHOT_PLUS_UPDATES', None) or \
+    getattr(fix, 'SubscriptionRequestType_SNAPSHOT_AND_UPDATES', '1')
+SubscriptionRequestType_DISABLE_PREVIOUS = getattr(
+    fix, 'SubscriptionRequestType_DISABLE_PREVIOUS_SNAPSHOT_PLUS_UPDATE_'
+         'REQUEST', None) or \
+    getattr(fix, 'SubscriptionRequestType_DISABLE_PREVIOUS_SNAPSHOT', '2')
+
+# Fixed-point books hold 64-bit integers, which Python 2 arrays only offer
+# as 'l' on platforms where a C long is 64 bits
+try:
+    array('q')
+    FIXED_POINT_TYPECODE = 'q'
+except ValueError:
+    FIXED_POINT_TYPECODE = 'l'
+
+
+def _index(values, value, count):
+    """Returns the slot of value in the first count values, or -1.
+
+    array.index only takes start and stop arguments from Python 3.10.
+    """
+    for i in range(count):
+        if values[i] == value:
+            return i
+    return -1
+
+
+class _BookSide(object):
+    """Price levels for one side of a book, best first, held in
+    preallocated arrays of depth slots.
+    """
+
+    def __init__(self, depth, descending, typecode):
+        self.depth = depth
+        self.descending = descending
+        self.prices = array(typecode, [0] * depth)
+        self.sizes = array(typecode, [0] * depth)
+        self.count = 0
+
+    def clear(self):
+        for i in range(self.count):
+            self.prices[i] = 0
+            self.sizes[i] = 0
+        self.count = 0
+
+    def update(self, price, size):
+        """Sets the size at a price, inserting the level if it is new and
+        removing it if size is zero.
+        """
+        if size == 0:
+            self.delete(price)
+            return
+
+        count = self.count
+        prices = self.prices
+        i = _index(prices, price, count)
+        if i >= 0:
+            self.sizes[i] = size
+            return
+
+        i = 0
+        if self.descending:
+            while i < count and prices[i] > price:
+                i += 1
+        else:
+            while i < count and prices[i] < price:
+                i += 1
+
+        if i == self.depth:
+            # Worse than every level we hold
+            return
+
+        # Shift worse levels down a slot, dropping the last if full
+        end = min(count, self.depth - 1)
+        prices[i + 1:end + 1] = prices[i:end]
+        self.sizes[i + 1:end + 1] = self.sizes[i:end]
+        prices[i] = price
+        self.sizes[i] = size
+        self.count = end + 1
+
+    def delete(self, price):
+        count = self.count
+        i = _index(self.prices, price, count)
+        if i < 0:
+            return
+
+        self.prices[i:count - 1] = self.prices[i + 1:count]
+        self.sizes[i:count - 1] = self.sizes[i + 1:count]
+        self.prices[count - 1] = 0
+        self.sizes[count - 1] = 0
+        self.count = count - 1
+
+    def levels(self):
+        return list(zip(self.prices[:self.count], self.sizes[:self.count]))
+
+
+class OrderBook(object):
+    """Price-level book for one symbol, to a fixed depth.
+
+    The levels are only changed on the thread applying market data. top is
+    replaced as a whole after each message is applied, so it can be read
+    from any thread in O(1) and is always consistent.
+
+    stale is set when the book is emptied because it can no longer be
+    trusted, such as after an update which could not be decoded, and is
+    cleared by the next snapshot.
+    """
+
+    def __init__(self, symbol, depth=10, typecode='d'):
+        self.symbol = symbol
+        self.bids = _BookSide(depth, True, typecode)
+        self.offers = _BookSide(depth, False, typecode)
+        self.last_price = None
+        self.last_size = None
+        self.updates = 0
+        self.stale = False
+        self.top = (None, None, None, None)
+
+    @property
+    def best_bid(self):
+        return self.top[0], self.top[1]
+
+    @property
+    def best_offer(self):
+        return self.top[2], self.top[3]
+
+    def clear(self):
+        self.bids.clear()
+        self.offers.clear()
+        self.last_price = None
+        self.last_size = None
+        self._publish_top()
+
+    def apply(self, action, entry_type, price, size):
+        if entry_type == MD_ENTRY_TRADE:
+            self.last_price = price
+            self.last_size = size
+            return
+
+        if entry_type == MD_ENTRY_BID:
+            side = self.bids
+        elif entry_type == MD_ENTRY_OFFER:
+            side = self.offers
+        else:
+            # Opening, high, low, volume and other entries venues send
+            # unrequested aren't levels of the book
+            return
+
+        if action == MD_UPDATE_DELETE:
+            side.delete(price)
+        else:
+            side.update(price, size)
+
+    def _publish_top(self):
+        bids = self.bids
+        offers = self.offers
+        self.top = (
+            bids.prices[0] if bids.count else None,
+            bids.sizes[0] if bids.count else None,
+            offers.prices[0] if offers.count else None,
+            offers.sizes[0] if offers.count else None)
+        self.updates += 1
+
+
+def _incremental_entries(message):
+    """Returns the NoMDEntries of a MarketDataIncrementalRefresh as
+    [MDUpdateAction, MDEntryType, Symbol, MDEntryPx, MDEntrySize] lists.
+
+    The message is split once rather than read through Group and getField,
+    which cost a binding call per field. Entries without a Symbol inherit
+    the previous entry's.
+    """
+    entries = []
+    entry = None
+    symbol = None
+
+    for field in message.toString().split('\x01'):
+        tag, _, value = field.partition('=')
+        if tag == _MD_UPDATE_ACTION_TAG:
+            entry = [value, None, symbol, None, None]
+            entries.append(entry)
+        elif entry is None:
+            continue
+        elif tag == _MD_ENTRY_TYPE_TAG:
+            entry[1] = value
+        elif tag == _SYMBOL_TAG:
+            entry[2] = symbol = value
+        elif tag == _MD_ENTRY_PX_TAG:
+            entry[3] = value
+        elif tag == _MD_ENTRY_SIZE_TAG:
+            entry[4] = value
+
+    return entries
+
+
+class MarketDataHandler(object):
+
+    @abstractmethod
+    def on_book_update(self, book):
+        pass
+
+    @abstractmethod
+    def on_market_data_reject(self, md_req_id, reason, text):
+        pass
+
+
+class MarketDataManager(object):
+    """Market data subscriptions and books for an adapter's session.
+
+    subscribe sends a MarketDataRequest for snapshot plus incremental
+    updates, and the resulting MarketDataSnapshotFullRefresh and
+    MarketDataIncrementalRefresh messages are applied to a book per symbol.
+    Subscriptions are sent again on each logon. Books are marked stale when
+    the session is lost or an update for them can't be decoded, and
+    incremental updates are then ignored until a new snapshot arrives.
+
+    With conflate set, books changed while a handler is still busy are
+    delivered once with their latest state, from a dispatcher thread, so a
+    slow handler never holds up the session. Otherwise handlers are called
+    on the session thread after each message.
+    """
+
+    def __init__(self, adapter, depth=10, conflate=True):
+        self.adapter = adapter
+        self.depth = depth
+        self.conflate = conflate
+
+        self.books = {}
+        self.subscriptions = {}
+        self.handlers = defaultdict(list)
+        self.md_req_ids = itertools.count(1)
+
+        self.dirty_symbols = set()
+        self.condition = threading.Condition()
+        self.dispatcher = None
+        self.running = False
+        # Guards subscriptions and handlers, which change on the caller's
+        # thread while resubscribe runs on the session thread
+        self.lock = threading.Lock()
+
+        self.log = logging.getLogger(__name__)
+
+    def subscribe(self, symbols, handler, depth=None):
+        depth = depth or self.depth
+        md_req_id = 'MD_{}'.format(next(self.md_req_ids))
+
+        with self.lock:
+            self.subscriptions[md_req_id] = (list(symbols), handler, depth)
+            for symbol in symbols:
+                if symbol not in self.books:
+                    price_scale, _ = self.adapter._scales(symbol)
+                    self.books[symbol] = OrderBook(
+                        symbol, depth, 'd' if price_scale is None
+                        else FIXED_POINT_TYPECODE)
+                self.handlers[symbol].append(handler)
+
+        if self.conflate and not self.running:
+            self.start()
+
+        self._send_market_data_request(
+            md_req_id, symbols, depth,
+            SubscriptionRequestType_SNAPSHOT_PLUS_UPDATES)
+        return md_req_id
+
+    def unsubscribe(self, md_req_id):
+        symbols, handler, depth = self._remove_subscription(md_req_id)
+        self._send_market_data_request(
+            md_req_id, symbols, depth,
+            SubscriptionRequestType_DISABLE_PREVIOUS)
+
+    def resubscribe(self):
+        with self.lock:
+            subscriptions = list(self.subscriptions.items())
+
+        for md_req_id, (symbols, _, depth) in subscriptions:
+            self._send_market_data_request(
+                md_req_id, symbols, depth,
+                SubscriptionRequestType_SNAPSHOT_PLUS_UPDATES)
+
+    def clear_books(self):
+        """Empties the books, which are stale once the session is lost."""
+        for book in self.books.values():
+            book.clear()
+            book.stale = True
+        self._book_updated(list(self.books))
+
+    def start(self):
+        self.running = True
+        self.dispatcher = threading.Thread(target=self._dispatch)
+        self.dispatcher.daemon = True
+        self.dispatcher.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+            self.dispatcher = None
+
+    def on_snapshot(self, message):
+        symbol = message.getField(_SYMBOL)
+        book = self.books.get(symbol)
+        if book is None:
+            self.log.warn('Snapshot for unsubscribed Symbol: {}'
+                          .format(symbol))
+            return
+
+        book.clear()
+        book.stale = False
+        price_scale, qty_scale = self.adapter._scales(symbol)
+        entry = fix.Group(_NO_MD_ENTRIES, _MD_ENTRY_TYPE)
+
+        try:
+            for i in range(1, message.groupCount(_NO_MD_ENTRIES) + 1):
+                message.getGroup(i, entry)
+                if not entry.isSetField(_MD_ENTRY_PX):
+                    continue
+                book.apply(MD_UPDATE_NEW, entry.getField(_MD_ENTRY_TYPE),
+                           self._decode(entry.getField(_MD_ENTRY_PX),
+                                        price_scale),
+                           self._decode_size(entry, qty_scale))
+        except ValueError as e:
+            self._mark_stale(book, e)
+
+        book._publish_top()
+        self.adapter.metrics.increment('fix_md_snapshots_total')
+        self._book_updated((symbol,))
+
+    def on_incremental(self, message):
+        symbol = None
+        book = None
+        price_scale = qty_scale = None
+        updated = set()
+
+        entries = _incremental_entries(message)
+        for action, entry_type, entry_symbol, price, size in entries:
+            if entry_symbol != symbol:
+                symbol = entry_symbol
+                book = self.books.get(symbol)
+                price_scale, qty_scale = self.adapter._scales(symbol)
+            if book is None or price is None or book.stale:
+                continue
+
+            try:
+                book.apply(action, entry_type,
+                           self._decode(price, price_scale),
+                           0 if size is None
+                           else self._decode(size, qty_scale))
+            except ValueError as e:
+                self._mark_stale(book, e)
+            updated.add(symbol)
+
+        for symbol in updated:
+            self.books[symbol]._publish_top()
+
+        self.adapter.metrics.increment('fix_md_incremental_entries_total',
+                                       value=len(entries))
+        self._book_updated(updated)
+
+    def _mark_stale(self, book, error):
+        # Entries already applied may leave the book wrong, so it is emptied
+        # until the next snapshot
+        book.clear()
+        book.stale = True
+        self.adapter.metrics.increment('fix_md_decode_errors_total')
+        self.log.error('Book for Symbol: {} is stale, unable to decode an '
+                       'update: {}'.format(book.symbol, error))
+
+    def on_request_reject(self, message):
+        md_req_id = message.getField(fix.MDReqID().getField())
+        reason = self.adapter._extract_optional_field(fix.MDReqRejReason(),
+                                                      message)
+        text = self.adapter._extract_optional_field(fix.Text(), message)
+        self.log.error('MarketDataRequest {} rejected: {} {}'
+                       .format(md_req_id, reason, text))
+
+        try:
+            _, handler, _ = self._remove_subscription(md_req_id)
+        except KeyError:
+            return
+        handler.on_market_data_reject(md_req_id, reason, text)
+
+    def dispatch_pending(self):
+        """Delivers the books changed since the last dispatch, once each."""
+        with self.condition:
+            symbols = self.dirty_symbols
+            self.dirty_symbols = set()
+        self._deliver(symbols)
+
+    def _dispatch(self):
+        while True:
+            with self.condition:
+                while self.running and not self.dirty_symbols:
+                    self.condition.wait()
+                # Books changed before stop are still delivered
+                if not self.dirty_symbols:
+                    return
+            self.dispatch_pending()
+
+    def _book_updated(self, symbols):
+        if not symbols:
+            return
+
+        if self.conflate:
+            with self.condition:
+                self.dirty_symbols.update(symbols)
+                self.condition.notify()
+        else:
+            self._deliver(symbols)
+
+    def _deliver(self, symbols):
+        for symbol in symbols:
+            book = self.books[symbol]
+            for handler in self.handlers[symbol]:
+                handler.on_book_update(book)
+        self.adapter.metrics.increment('fix_md_book_callbacks_total',
+                                       value=len(symbols))
+
+    def _remove_subscription(self, md_req_id):
+        with self.lock:
+            symbols, handler, depth = self.subscriptions.pop(md_req_id)
+            for symbol in symbols:
+                self.handlers[symbol].remove(handler)
+        return symbols, handler, depth
+
+    def _send_market_data_request(self, md_req_id, symbols, depth,
+                                  request_type):
+        message = fix.Message()
+        message.getHeader().setField(fix.MsgType(
+            fix.MsgType_MarketDataRequest))
+
+        message.setField(fix.MDReqID(md_req_id))
+        message.setField(fix.SubscriptionRequestType(request_type))
+        message.setField(fix.MarketDepth(depth))
+        message.setField(fix.MDUpdateType(
+            fix.MDUpdateType_INCREMENTAL_REFRESH))
+
+        for entry_type in (MD_ENTRY_BID, MD_ENTRY_OFFER, MD_ENTRY_TRADE):
+            group = fix.Group(fix.NoMDEntryTypes().getField(),
+                              fix.MDEntryType().getField())
+            group.setField(fix.MDEntryType(entry_type))
+            message.addGroup(group)
+
+        for symbol in symbols:
+            group = fix.Group(fix.NoRelatedSym().getField(),
+                              fix.Symbol().getField())
+            group.setField(fix.Symbol(symbol))
+            message.addGroup(group)
+
+        self.adapter._send_message(message)
+
+    @staticmethod
+    def _decode(text, scale):
+        if scale is None:
+            return float(text)
+        return decode_decimal(text, scale)
+
+    @staticmethod
+    def _decode_size(entry, scale):
+        if not entry.isSetField(_MD_ENTRY_SIZE):
+            return 0
+        return MarketDataManager._decode(entry.getField(_MD_ENTRY_SIZE),
+                                         scale)
@@ -0,0 +1,292 @@
+from bisect import bisect_left
+from collections import defaultdict
+import logging
+import os
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qsl, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urlparse import parse_qsl, urlparse
+
+clock = getattr(time, 'perf_counter', time.time)
+
+# Upper bounds in seconds, from 1us to 10s
+LATENCY_BUCKETS = tuple(
+    scale * 10 ** exponent for exponent in range(-6, 1)
+    for scale in (1, 2.5, 5)) + (10.0,)
+
+
+class _ThreadMetrics(object):
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.histograms = {}
+
+
+class _Histogram(object):
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+
+class MetricsRegistry(object):
+    """Counters, gauges and latency histograms for the gateway.
+
+    Counters and histograms are written to a per-thread store so the hot
+    path takes no lock; scrapes merge the per-thread values. Gauges can be
+    set directly or registered as callbacks evaluated at scrape time.
+
+    Labels are passed as a tuple of (name, value) pairs.
+    """
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS):
+        self.latency_buckets = latency_buckets
+        self.local = threading.local()
+        self.thread_metrics = []
+        self.gauges = {}
+        self.gauge_callbacks = {}
+        self.lock = threading.Lock()
+
+    def _thread_metrics(self):
+        try:
+            return self.local.metrics
+        except AttributeError:
+            metrics = _ThreadMetrics()
+            with self.lock:
+                self.thread_metrics.append(metrics)
+            self.local.metrics = metrics
+            return metrics
+
+    def increment(self, name, labels=(), value=1):
+        self._thread_metrics().counters[(name, labels)] += value
+
+    def observe(self, name, seconds, labels=()):
+        histograms = self._thread_metrics().histograms
+        key = (name, labels)
+        if key not in histograms:
+            histograms[key] = _Histogram(self.latency_buckets)
+        histograms[key].observe(seconds)
+
+    def set_gauge(self, name, value, labels=()):
+        self.gauges[(name, labels)] = value
+
+    def register_gauge(self, name, callback, labels=()):
+        """Registers a gauge whose value is read from callback on scrape."""
+        self.gauge_callbacks[(name, labels)] = callback
+
+    def snapshot(self):
+        """Returns merged (counters, gauges, histograms) dicts."""
+        counters = defaultdict(int)
+        histograms = {}
+
+        with self.lock:
+            thread_metrics = list(self.thread_metrics)
+
+        for metrics in thread_metrics:
+            for key, value in list(metrics.counters.items()):
+                counters[key] += value
+            for key, histogram in list(metrics.histograms.items()):
+                if key not in histograms:
+                    histograms[key] = _Histogram(self.latency_buckets)
+                histograms[key].merge(histogram)
+
+        gauges = dict(self.gauges)
+        for key, callback in list(self.gauge_callbacks.items()):
+            gauges[key] = callback()
+
+        return counters, gauges, histograms
+
+    def to_prometheus(self):
+        counters, gauges, histograms = self.snapshot()
+        lines = []
+
+        for metric_type, values in (('counter', counters),
+                                    ('gauge', gauges)):
+            for name, samples in _group_by_name(values):
+                lines.append('# TYPE {} {}'.format(name, metric_type))
+                for labels, value in samples:
+                    lines.append('{}{} {}'.format(name, _format_labels(labels),
+                                                  value))
+
+        for name, samples in _group_by_name(histograms):
+            lines.append('# TYPE {} histogram'.format(name))
+            for labels, histogram in samples:
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.buckets):
+                    cumulative += count
+                    lines.append('{}_bucket{} {}'.format(
+                        name, _format_labels(labels + (('le', repr(bound)),)),
+                        cumulative))
+                lines.append('{}_bucket{} {}'.format(
+                    name, _format_labels(labels + (('le', '+Inf'),)),
+                    histogram.count))
+                lines.append('{}_sum{} {}'.format(
+                    name, _format_labels(labels), histogram.sum))
+                lines.append('{}_count{} {}'.format(
+                    name, _format_labels(labels), histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+
+class NullMetricsRegistry(object):
+    """Drop-in registry which records nothing."""
+
+    def increment(self, name, labels=(), value=1):
+        pass
+
+    def observe(self, name, seconds, labels=()):
+        pass
+
+    def set_gauge(self, name, value, labels=()):
+        pass
+
+    def register_gauge(self, name, callback, labels=()):
+        pass
+
+    def snapshot(self):
+        return {}, {}, {}
+
+    def to_prometheus(self):
+        return ''
+
+
+def _group_by_name(values):
+    grouped = defaultdict(list)
+    for (name, labels), value in values.items():
+        grouped[name].append((labels, value))
+    return sorted((name, sorted(samples, key=lambda sample: sample[0]))
+                  for name, samples in grouped.items())
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, value)
+                          for name, value in labels) + '}'
+
+
+class MetricsServer(object):
+    """Serves the registry in Prometheus text format over local HTTP.
+
+    admin_commands maps further paths to callables, which are called with
+    the query string parameters as keyword arguments. A request with a
+    parameter the command does not take, or a value it can't parse, gets a
+    400 response.
+    """
+
+    def __init__(self, registry, port=9100, host='127.0.0.1',
+                 admin_commands=None):
+        self.registry = registry
+        self.admin_commands = admin_commands or {}
+        self.server = HTTPServer((host, port), self._create_handler())
+        self.thread = None
+
+    def _create_handler(self):
+        registry = self.registry
+        admin_commands = self.admin_commands
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+
+                if url.path == '/metrics':
+                    self._respond(registry.to_prometheus())
+                elif url.path in admin_commands:
+                    try:
+                        result = admin_commands[url.path](
+                            **dict(parse_qsl(url.query)))
+                    except (TypeError, ValueError) as e:
+                        self.send_error(400, str(e))
+                        return
+                    self._respond('{}\n'.format(result))
+                else:
+                    self.send_error(404)
+
+            def _respond(self, text):
+                body = text.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsRequestHandler
+
+    def register_admin_commands(self, admin_commands):
+        """Adds to the admin commands, which may be done while serving."""
+        self.admin_commands.update(admin_commands)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread = None
+        self.server.server_close()
+
+
+class MetricsSnapshotWriter(object):
+    """Periodically writes the registry in Prometheus text format to a file.
+
+    The file is replaced atomically so readers never see a partial
+    snapshot.
+    """
+
+    def __init__(self, registry, path, interval=10):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+        self.log = logging.getLogger(__name__)
+
+    def write(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as snapshot:
+            snapshot.write(self.registry.to_prometheus())
+        os.rename(tmp_path, self.path)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write()
+            except (IOError, OSError) as e:
+                self.log.error('Unable to write metrics snapshot to {}: {}'
+                               .format(self.path, e))
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
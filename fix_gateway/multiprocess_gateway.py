@@ -0,0 +1,375 @@
+import logging
+import multiprocessing
+import threading
+import time
+from collections import Counter
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+import quickfix as fix
+
+from fix_market_gateway import FixMarketAdapter, OrderHandler, RequestType
+from shm_queue import Empty, Full, SharedMemoryQueue, serialise
+
+_STOP = '__stop__'
+_STOP_TIMEOUT = 1
+
+
+class StrategyWorker(OrderHandler):
+    """Strategy code which runs in its own process.
+
+    Requests are passed to the GatewayEngine over a shared memory queue and
+    the engine routes back events only for the orders this worker sent.
+    Subclasses override the on_* callbacks, plus on_start and on_idle.
+    """
+
+    def __init__(self):
+        self.worker_id = None
+        self.request_queue = None
+        self.event_queue = None
+        self.running = False
+        self.log = logging.getLogger(__name__)
+
+    def attach(self, worker_id, request_queue, event_queue):
+        self.worker_id = worker_id
+        self.request_queue = request_queue
+        self.event_queue = event_queue
+
+    def run(self, poll_interval=0.0001):
+        self.running = True
+        self.on_start()
+
+        while self.running:
+            try:
+                event = self.event_queue.get_nowait()
+            except Empty:
+                self.on_idle()
+                time.sleep(poll_interval)
+                continue
+
+            if event == _STOP:
+                self.running = False
+            else:
+                callback, args = event
+                getattr(self, callback)(*args)
+
+        self.on_stop()
+
+    def stop(self):
+        self.running = False
+
+    def process_request(self, request_type, order):
+        self.request_queue.put((self.worker_id, request_type, order))
+
+    def send_new(self, order):
+        self.process_request(RequestType.NEW, order)
+
+    def send_replace(self, order):
+        self.process_request(RequestType.AMEND, order)
+
+    def send_cancel(self, order):
+        self.process_request(RequestType.CANCEL, order)
+
+    def publish_response(self, order):
+        pass
+
+    def on_start(self):
+        pass
+
+    def on_idle(self):
+        pass
+
+    def on_stop(self):
+        pass
+
+    def on_execution(self, order, execution):
+        pass
+
+    def on_execution_correct(self, order, execution):
+        pass
+
+    def on_execution_cancel(self, order, execution):
+        pass
+
+    def on_new_ack(self, order):
+        pass
+
+    def on_new_rej(self, order):
+        pass
+
+    def on_replace_ack(self, order):
+        pass
+
+    def on_replace_rej(self, order):
+        pass
+
+    def on_cancel_ack(self, order):
+        pass
+
+    def on_cancel_rej(self, order):
+        pass
+
+    def on_expired(self, order):
+        pass
+
+    def on_done_for_day(self, order):
+        pass
+
+    def on_restated(self, order):
+        pass
+
+
+def _run_worker(worker, worker_id, request_queue, event_queue):
+    worker.attach(worker_id, request_queue, event_queue)
+    worker.run()
+
+
+class GatewayEngine(OrderHandler):
+    """Owns the FIX session and order store on behalf of worker processes.
+
+    The engine runs in the parent process. Each StrategyWorker is started
+    in a child process with a request queue into the engine and an event
+    queue back out of it, so strategy CPU time no longer competes with fill
+    processing for the GIL.
+
+    The shared memory queues only support a single producer, while events
+    are raised on the session thread, the request thread and by stop. So
+    events are pickled on the thread raising them, capturing the order as
+    it was, and handed to a publisher thread, the only writer to the event
+    queues. It never blocks on a worker which has stopped reading: once a
+    worker's event queue is full, further events for it are dropped and
+    counted in dropped_events.
+    """
+
+    def __init__(self, config_file, workers, queue_slots=4096,
+                 slot_size=1024):
+        self.workers = workers
+        self.request_queues = [SharedMemoryQueue(queue_slots, slot_size)
+                               for _ in workers]
+        self.event_queues = [SharedMemoryQueue(queue_slots, slot_size)
+                             for _ in workers]
+        self.order_owners = {}
+        self.processes = []
+        self.running = False
+
+        self.pending_events = Queue()
+        self.dropped_events = Counter()
+        self.publish_thread = None
+
+        self.adapter = FixMarketAdapter(self)
+        self.initiator = self._create_fix_socket(config_file) \
+            if config_file is not None else None
+        self.request_thread = None
+        self.log = logging.getLogger(__name__)
+
+    def _create_fix_socket(self, config_file):
+        settings = fix.SessionSettings(config_file)
+        store_factory = fix.FileStoreFactory(settings)
+        log_factory = fix.ScreenLogFactory(settings)
+        return fix.SocketInitiator(self.adapter, store_factory, settings,
+                                   log_factory)
+
+    def start(self):
+        self.running = True
+
+        for worker_id, worker in enumerate(self.workers):
+            process = multiprocessing.Process(
+                target=_run_worker,
+                args=(worker, worker_id, self.request_queues[worker_id],
+                      self.event_queues[worker_id]))
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+        if self.initiator is not None:
+            self.initiator.start()
+
+        self.publish_thread = threading.Thread(target=self._publish_events)
+        self.publish_thread.daemon = True
+        self.publish_thread.start()
+
+        self.request_thread = threading.Thread(target=self._process_requests)
+        self.request_thread.daemon = True
+        self.request_thread.start()
+
+    def stop(self, timeout=5):
+        for worker_id in range(len(self.workers)):
+            self.pending_events.put((worker_id, _STOP))
+        if self.publish_thread is not None:
+            self.pending_events.put((None, None))
+            self.publish_thread.join(timeout)
+            self.publish_thread = None
+        else:
+            self.publish_pending()
+
+        for process in self.processes:
+            process.join(timeout)
+
+        self.running = False
+        if self.request_thread is not None:
+            self.request_thread.join(timeout)
+        if self.initiator is not None:
+            self.initiator.stop()
+
+    def _process_requests(self, poll_interval=0.0001):
+        while self.running:
+            idle = True
+
+            for request_queue in self.request_queues:
+                try:
+                    worker_id, request_type, order = \
+                        request_queue.get_nowait()
+                except Empty:
+                    continue
+
+                idle = False
+                # Serialised with inbound messages, which read order_owners
+                # when they raise events
+                with self.adapter.outbound_lock:
+                    self._route_request(worker_id, request_type, order)
+
+            if idle:
+                time.sleep(poll_interval)
+
+    def _route_request(self, worker_id, request_type, order):
+        if request_type == RequestType.NEW:
+            if order.order_id in self.order_owners:
+                self.log.error('Worker {} sent duplicate OrderId: {}'
+                               .format(worker_id, order.order_id))
+                return
+            self.order_owners[order.order_id] = worker_id
+        else:
+            owner = self.order_owners.get(order.order_id)
+            if owner != worker_id:
+                self.log.error('Worker {} does not own OrderId: {}'
+                               .format(worker_id, order.order_id))
+                return
+            order = self._merge_request(order)
+
+        self.process_request(request_type, order)
+
+    def _merge_request(self, order):
+        # Workers hold copies, so apply the requested changes to the order
+        # the store is already tracking
+        stored_order = self.adapter.order_store.order_store.get(order.order_id)
+        if stored_order is None:
+            return order
+
+        stored_order.qty = order.qty
+        stored_order.price = order.price
+        stored_order.time_in_force = order.time_in_force
+        return stored_order
+
+    def process_request(self, request_type, order):
+        if request_type == RequestType.NEW:
+            self.adapter.send_new(order)
+        elif request_type == RequestType.AMEND:
+            self.adapter.send_replace(order)
+        elif request_type == RequestType.CANCEL:
+            self.adapter.send_cancel(order)
+        else:
+            self.log.error('Invalid request type specified: {}'
+                           .format(request_type))
+
+    def _publish(self, callback, order, *args):
+        owner = self.order_owners.get(order.order_id)
+        if owner is None:
+            self.log.warn('No worker owns OrderId: {}, dropping {}'
+                          .format(order.order_id, callback))
+            return
+
+        # Pickled now, as the order may have changed again by the time the
+        # publisher writes the event
+        self.pending_events.put(
+            (owner, (callback, serialise((callback, (order,) + args)))))
+
+    def publish_pending(self):
+        """Writes the events raised so far to the worker event queues on
+        the calling thread, for use when the engine has not been started.
+        """
+        while not self.pending_events.empty():
+            owner, event = self.pending_events.get()
+            self._write_event(owner, event)
+
+    def _publish_events(self):
+        while True:
+            owner, event = self.pending_events.get()
+            if owner is None:
+                return
+            self._write_event(owner, event)
+
+    def _write_event(self, owner, event):
+        event_queue = self.event_queues[owner]
+        if event == _STOP:
+            # The worker keeps reading until it sees the stop, so give it
+            # time to make room rather than dropping it
+            try:
+                event_queue.put(_STOP, _STOP_TIMEOUT)
+            except Full:
+                self.log.error('Worker {} is not reading events, unable to '
+                               'stop it'.format(owner))
+            return
+
+        callback, data = event
+        try:
+            event_queue.put_serialised_nowait(data)
+        except Full:
+            self.dropped_events[owner] += 1
+            self.log.error('Event queue for worker {} is full, dropping {}'
+                           .format(owner, callback))
+
+    def publish_response(self, order):
+        pass
+
+    def send_new(self, order):
+        pass
+
+    def send_replace(self, order):
+        pass
+
+    def send_cancel(self, order):
+        pass
+
+    def on_execution(self, order, execution):
+        self._publish('on_execution', order, execution)
+
+    def on_execution_correct(self, order, execution):
+        self._publish('on_execution_correct', order, execution)
+
+    def on_execution_cancel(self, order, execution):
+        self._publish('on_execution_cancel', order, execution)
+
+    def on_new_ack(self, order):
+        self._publish('on_new_ack', order)
+
+    def on_new_rej(self, order):
+        self._publish('on_new_rej', order)
+
+    def on_replace_ack(self, order):
+        self._publish('on_replace_ack', order)
+
+    def on_replace_rej(self, order):
+        self._publish('on_replace_rej', order)
+
+    def on_cancel_ack(self, order):
+        self._publish('on_cancel_ack', order)
+
+    def on_cancel_rej(self, order):
+        self._publish('on_cancel_rej', order)
+
+    def on_expired(self, order):
+        self._publish('on_expired', order)
+
+    def on_done_for_day(self, order):
+        self._publish('on_done_for_day', order)
+
+    def on_restated(self, order):
+        self._publish('on_restated', order)
+
+    def on_reconciliation_complete(self, report):
+        self.log.info('Reconciliation complete: {} orders checked, {} '
+                      'discrepancies'.format(report.orders_checked,
+                                             len(report.discrepancies)))
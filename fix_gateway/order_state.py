@@ -0,0 +1,110 @@
+from collections import Counter, defaultdict, deque
+import logging
+
+
+class Transition(object):
+    ILLEGAL = 0
+    LEGAL = 1
+    DEFERRED = 2
+
+
+class OrderStateMachine(object):
+    """Validates order status transitions against a precomputed matrix.
+
+    Statuses are coded as small integers when the machine is built so each
+    check is a dict lookup and a bytearray index. A transition from one of
+    pending_statuses which is not directly legal, but which becomes legal
+    once one intermediate status has been reached, is treated as an event
+    which arrived before its predecessor and is deferred rather than
+    rejected. From any other status the order has already moved past the
+    request the event answers, so such a transition is stale and illegal.
+
+    A status of None means no state is known for the order yet, so any
+    transition from it is accepted.
+    """
+
+    def __init__(self, transitions, pending_statuses=(),
+                 max_deferred_per_order=16):
+        self.statuses = self._collect_statuses(transitions)
+        self.status_codes = dict(
+            (status, code) for code, status in enumerate(self.statuses))
+        self.matrix = self._build_matrix(transitions, pending_statuses)
+        self.max_deferred_per_order = max_deferred_per_order
+
+        self.deferred = defaultdict(deque)
+        self.illegal_transitions = Counter()
+        self.deferred_transitions = Counter()
+
+        self.log = logging.getLogger(__name__)
+
+    @staticmethod
+    def _collect_statuses(transitions):
+        statuses = set(transitions)
+        for targets in transitions.values():
+            statuses.update(targets)
+        return sorted(statuses)
+
+    def _build_matrix(self, transitions, pending_statuses):
+        size = len(self.statuses)
+        matrix = bytearray(size * size)
+
+        for from_status, targets in transitions.items():
+            from_code = self.status_codes[from_status]
+            for to_status in targets:
+                matrix[from_code * size + self.status_codes[to_status]] = \
+                    Transition.LEGAL
+
+        for from_status in pending_statuses:
+            from_code = self.status_codes[from_status]
+            for via_code in range(size):
+                if matrix[from_code * size + via_code] != Transition.LEGAL:
+                    continue
+                for to_code in range(size):
+                    index = from_code * size + to_code
+                    if matrix[index] == Transition.ILLEGAL and \
+                            matrix[via_code * size + to_code] == \
+                            Transition.LEGAL:
+                        matrix[index] = Transition.DEFERRED
+
+        return matrix
+
+    def check(self, from_status, to_status):
+        if from_status is None:
+            return Transition.LEGAL
+
+        codes = self.status_codes
+        return self.matrix[codes[from_status] * len(self.statuses) +
+                           codes[to_status]]
+
+    def record_illegal(self, order_id, from_status, to_status):
+        self.illegal_transitions[(from_status, to_status)] += 1
+        self.log.warn('Illegal status transition {} -> {} for order '
+                      '[order id: {}]'.format(from_status, to_status,
+                                              order_id))
+
+    def defer(self, order_id, from_status, to_status, event):
+        events = self.deferred[order_id]
+        if len(events) == self.max_deferred_per_order:
+            _, dropped_to_status = events.popleft()
+            self.record_illegal(order_id, from_status, dropped_to_status)
+
+        events.append((event, to_status))
+        self.deferred_transitions[(from_status, to_status)] += 1
+        self.log.info('Deferring status transition {} -> {} for order '
+                      '[order id: {}]'.format(from_status, to_status,
+                                              order_id))
+
+    def pop_deferred(self, order_id):
+        """Returns the events deferred for an order, oldest first."""
+        if order_id in self.deferred:
+            return [event for event, _ in self.deferred.pop(order_id)]
+        else:
+            return []
+
+    def discard_deferred(self, order_id, status):
+        """Drops events which can no longer apply once an order is done."""
+        for _, to_status in self.deferred.pop(order_id, ()):
+            self.record_illegal(order_id, status, to_status)
+
+    def has_deferred(self, order_id):
+        return order_id in self.deferred
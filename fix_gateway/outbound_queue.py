@@ -0,0 +1,115 @@
+from collections import deque
+import threading
+import time
+
+
+class QueuePolicy(object):
+    HOLD = 'hold'
+    REJECT = 'reject'
+
+
+class QueueResult(object):
+    SEND = 0
+    QUEUED = 1
+    REFUSED = 2
+
+
+class OutboundQueue(object):
+    """Holds order requests while the session is logged out.
+
+    offer tells the caller to send directly only when the session is logged
+    on and nothing is queued or being flushed, so requests always reach the
+    venue in the order they were made. Otherwise the request is held, or
+    refused where the policy for its request type is REJECT or the queue
+    already holds max_depth requests. Held requests which are older than
+    the TTL for their request type are returned by expire.
+
+    TTLs and policies are keyed by request type, falling back to ttl and
+    policy. expiry_interval is how often held requests are checked for
+    expiry.
+    """
+
+    def __init__(self, ttl=30, ttls=None, policy=QueuePolicy.HOLD,
+                 policies=None, max_depth=10000, expiry_interval=1,
+                 clock=time.time):
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self.policy = policy
+        self.policies = dict(policies or {})
+        self.max_depth = max_depth
+        self.expiry_interval = expiry_interval
+        self.clock = clock
+
+        self.entries = deque()
+        self.logged_on = False
+        self.draining = False
+        self.lock = threading.Lock()
+
+    def offer(self, request_type, order):
+        with self.lock:
+            if self.logged_on and not self.draining:
+                return QueueResult.SEND
+            if self.policies.get(request_type, self.policy) == \
+                    QueuePolicy.REJECT or len(self.entries) >= self.max_depth:
+                return QueueResult.REFUSED
+
+            self.entries.append((self.clock(), request_type, order))
+            return QueueResult.QUEUED
+
+    def on_logon(self):
+        """Starts draining the queue, which take then hands out in order."""
+        with self.lock:
+            self.logged_on = True
+            self.draining = bool(self.entries)
+
+    def on_logout(self):
+        with self.lock:
+            self.logged_on = False
+
+    def take(self):
+        """Returns the oldest (enqueued_at, request_type, order) to send, or
+        None once the queue is empty or the session is lost, after which
+        offer lets requests through directly again.
+        """
+        with self.lock:
+            if self.logged_on and self.entries:
+                return self.entries.popleft()
+            self.draining = False
+            return None
+
+    def expire(self):
+        """Removes and returns the held requests which have outlived their
+        TTL, oldest first.
+        """
+        now = self.clock()
+        with self.lock:
+            expired = [entry for entry in self.entries if self.is_expired(
+                entry, now)]
+            if expired:
+                self.entries = deque(entry for entry in self.entries
+                                     if not self.is_expired(entry, now))
+        return expired
+
+    def discard(self, order):
+        """Removes and returns the held requests for an order."""
+        with self.lock:
+            discarded = [entry for entry in self.entries
+                         if entry[2] is order]
+            if discarded:
+                self.entries = deque(entry for entry in self.entries
+                                     if entry[2] is not order)
+        return discarded
+
+    def is_expired(self, entry, now=None):
+        enqueued_at, request_type, _ = entry
+        now = self.clock() if now is None else now
+        return now - enqueued_at >= self.ttls.get(request_type, self.ttl)
+
+    def depth(self):
+        return len(self.entries)
+
+    def oldest_age(self):
+        try:
+            return self.clock() - self.entries[0][0]
+        except IndexError:
+            return 0
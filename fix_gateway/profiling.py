@@ -0,0 +1,214 @@
+from collections import defaultdict
+import inspect
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+PROFILED_METHODS = (
+    'fromApp',
+    '_process_execution_report',
+    'send_new',
+    'send_replace',
+    'send_cancel',
+)
+
+
+class ProfilingHooks(object):
+    """Profiles selected methods of a live object for a bounded window.
+
+    Sampling wraps the methods on the instance so the sampler thread only
+    records stacks of threads currently inside one of them, and writes the
+    samples in the collapsed stack format read by flamegraph.pl and
+    speedscope. Allocation tracking uses tracemalloc and reports the top
+    allocation sites reached through the target's module. Nothing is
+    wrapped or traced while neither is running.
+    """
+
+    def __init__(self, target, output_dir='.', methods=PROFILED_METHODS,
+                 sample_interval=0.001):
+        self.target = target
+        self.output_dir = output_dir
+        self.methods = methods
+        self.sample_interval = sample_interval
+
+        self.active_threads = defaultdict(int)
+        self.samples = defaultdict(int)
+        self.sampling = threading.Event()
+        self.sampler = None
+        self.sampling_timer = None
+        self.tracking_allocations = False
+        self.allocation_snapshot = None
+        self.allocation_timer = None
+        self.lock = threading.Lock()
+
+        self.log = logging.getLogger(__name__)
+
+    def install_signal_handlers(self, duration=10,
+                                sampling_signal=getattr(signal, 'SIGUSR1',
+                                                        None),
+                                allocation_signal=getattr(signal, 'SIGUSR2',
+                                                          None)):
+        """Starts sampling or allocation tracking on a signal.
+
+        Must be called from the main thread.
+        """
+        if sampling_signal is not None:
+            signal.signal(sampling_signal,
+                          lambda signum, frame: self.start_sampling(duration))
+        if allocation_signal is not None:
+            signal.signal(allocation_signal,
+                          lambda signum, frame:
+                          self.start_allocation_tracking(duration))
+
+    def admin_commands(self):
+        """Returns handlers for MetricsServer admin commands."""
+        return {
+            '/profile/cpu': lambda seconds=10: self.start_sampling(
+                float(seconds)),
+            '/profile/memory': lambda seconds=10:
+                self.start_allocation_tracking(float(seconds)),
+        }
+
+    def start_sampling(self, duration=10):
+        with self.lock:
+            if self.sampling.is_set():
+                self.log.warn('Sampling profiler already running')
+                return False
+
+            self.samples = defaultdict(int)
+            self.sampling.set()
+            self._wrap_methods()
+
+            self.sampler = threading.Thread(target=self._sample)
+            self.sampler.daemon = True
+            self.sampler.start()
+            self.sampling_timer = self._stop_after(duration,
+                                                   self.stop_sampling)
+
+        self.log.info('Sampling profiler started for {}s'.format(duration))
+        return True
+
+    def stop_sampling(self):
+        with self.lock:
+            if not self.sampling.is_set():
+                return None
+
+            self.sampling.clear()
+            self.sampling_timer.cancel()
+            self._unwrap_methods()
+
+        self.sampler.join()
+
+        path = self._output_path('profile', 'folded')
+        with open(path, 'w') as profile:
+            for stack, count in sorted(self.samples.items()):
+                profile.write('{} {}\n'.format(stack, count))
+
+        self.log.info('Wrote {} profile samples to {}'
+                      .format(sum(self.samples.values()), path))
+        return path
+
+    def start_allocation_tracking(self, duration=10, frames=25):
+        if tracemalloc is None:
+            self.log.error('Allocation tracking requires tracemalloc')
+            return False
+
+        with self.lock:
+            if self.tracking_allocations:
+                self.log.warn('Allocation tracking already running')
+                return False
+
+            self.tracking_allocations = True
+            tracemalloc.start(frames)
+            self.allocation_snapshot = tracemalloc.take_snapshot()
+            self.allocation_timer = self._stop_after(
+                duration, self.stop_allocation_tracking)
+
+        self.log.info('Allocation tracking started for {}s'.format(duration))
+        return True
+
+    def stop_allocation_tracking(self, top=25):
+        with self.lock:
+            if not self.tracking_allocations:
+                return None
+
+            self.tracking_allocations = False
+            self.allocation_timer.cancel()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+        scope = [tracemalloc.Filter(True, inspect.getsourcefile(
+            type(self.target)), all_frames=True)]
+        statistics = snapshot.filter_traces(scope).compare_to(
+            self.allocation_snapshot.filter_traces(scope), 'lineno')
+        self.allocation_snapshot = None
+
+        path = self._output_path('allocations', 'txt')
+        with open(path, 'w') as report:
+            for statistic in statistics[:top]:
+                report.write('{}\n'.format(statistic))
+
+        self.log.info('Wrote top {} allocation sites to {}'
+                      .format(min(top, len(statistics)), path))
+        return path
+
+    def _stop_after(self, duration, stop):
+        timer = threading.Timer(duration, stop)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def _output_path(self, prefix, extension):
+        return os.path.join(self.output_dir, '{}-{}.{}'.format(
+            prefix, time.strftime('%Y%m%d-%H%M%S'), extension))
+
+    def _wrap_methods(self):
+        for name in self.methods:
+            setattr(self.target, name,
+                    self._wrap(getattr(self.target, name)))
+
+    def _unwrap_methods(self):
+        # Removing the instance attributes exposes the class methods again
+        for name in self.methods:
+            if name in vars(self.target):
+                delattr(self.target, name)
+
+    def _wrap(self, method):
+        active_threads = self.active_threads
+
+        def profiled(*args, **kwargs):
+            ident = threading.current_thread().ident
+            active_threads[ident] += 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                active_threads[ident] -= 1
+
+        return profiled
+
+    def _sample(self):
+        own_ident = threading.current_thread().ident
+
+        while self.sampling.is_set():
+            for ident, frame in sys._current_frames().items():
+                if ident != own_ident and self.active_threads.get(ident):
+                    self.samples[self._collapse(frame)] += 1
+            time.sleep(self.sample_interval)
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('{}:{}'.format(os.path.basename(code.co_filename),
+                                        code.co_name))
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
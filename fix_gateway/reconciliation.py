@@ -0,0 +1,266 @@
+import logging
+import threading
+import time
+
+import quickfix as fix
+
+
+class Discrepancy(object):
+    STATUS = 'status'
+    EXECUTED_QTY = 'executed_qty'
+    MISSING_AT_VENUE = 'missing_at_venue'
+    UNKNOWN_ORDER = 'unknown_order'
+
+    def __init__(self, kind, order_id, local_value=None, venue_value=None):
+        self.kind = kind
+        self.order_id = order_id
+        self.local_value = local_value
+        self.venue_value = venue_value
+
+    def __repr__(self):
+        return 'Discrepancy({}, {}, local={}, venue={})'.format(
+            self.kind, self.order_id, self.local_value, self.venue_value)
+
+
+class ReconciliationReport(object):
+    def __init__(self):
+        self.orders_checked = 0
+        self.reports_received = 0
+        self.discrepancies = []
+        self.unreported = []
+        self.elapsed = None
+        self.complete = False
+
+
+class OrderReconciler(object):
+    """Reconciles the open orders in the store with the venue after logon.
+
+    An OrderMassStatusRequest is sent where the venue supports it, otherwise
+    an OrderStatusRequest per open order from a background thread, paced by
+    the adapter's rate limiter. The status ExecutionReports received are
+    collected and compared with the store in one pass once the last one
+    arrives, or when timeout expires, and the resulting
+    ReconciliationReport is passed to the order handler.
+
+    Reports for a mass status request are only counted if they carry the
+    MassStatusReqID of the current round. If the round ends early, on
+    timeout or logout, the report is marked incomplete and orders the venue
+    has not reported on are listed in unreported rather than flagged as
+    missing at the venue.
+    """
+
+    def __init__(self, adapter, terminal_statuses, mass_status_supported=True,
+                 timeout=60):
+        self.adapter = adapter
+        self.terminal_statuses = terminal_statuses
+        self.mass_status_supported = mass_status_supported
+        self.timeout = timeout
+
+        self.in_progress = False
+        self.open_orders = {}
+        self.venue_states = {}
+        self.unknown_orders = []
+        self.mass_status_req_id = None
+        self.report = None
+        self.started = None
+        self.timer = None
+        self.lock = threading.RLock()
+
+        self.log = logging.getLogger(__name__)
+
+    def start(self):
+        with self.lock:
+            if self.in_progress:
+                self.log.warn('Reconciliation already in progress')
+                return
+
+            self.in_progress = True
+            self.started = time.time()
+            self.open_orders = dict(
+                (order.order_id, order)
+                for order in self.adapter.order_store.open_orders())
+            self.venue_states = {}
+            self.unknown_orders = []
+            self.report = ReconciliationReport()
+            self.mass_status_req_id = 'MSR_{}'.format(
+                int(self.started * 1000))
+
+            self.timer = threading.Timer(self.timeout, self.finish, [False])
+            self.timer.daemon = True
+            self.timer.start()
+
+        self.log.info('Reconciling {} open orders'
+                      .format(len(self.open_orders)))
+
+        if self.mass_status_supported:
+            self._send_mass_status_request()
+        elif self.open_orders:
+            self._start_order_status_requests()
+        else:
+            self.finish()
+
+    def _send_mass_status_request(self):
+        message = fix.Message()
+        message.getHeader().setField(
+            fix.MsgType(fix.MsgType_OrderMassStatusRequest))
+        message.setField(fix.MassStatusReqID(self.mass_status_req_id))
+        message.setField(fix.MassStatusReqType(
+            fix.MassStatusReqType_STATUS_FOR_ALL_ORDERS))
+
+        self.adapter._send_message(message)
+
+    def _start_order_status_requests(self):
+        thread = threading.Thread(target=self._send_order_status_requests,
+                                  args=(list(self.open_orders.values()),))
+        thread.daemon = True
+        thread.start()
+
+    def _send_order_status_requests(self, orders):
+        rate_limiter = self.adapter.rate_limiter
+        cl_ord_ids = self.adapter.order_store.order_id_to_cl_ord_id_map
+
+        for order in orders:
+            if not self.in_progress:
+                return
+
+            rate_limiter.acquire()
+
+            message = fix.Message()
+            message.getHeader().setField(
+                fix.MsgType(fix.MsgType_OrderStatusRequest))
+            message.setField(fix.ClOrdID(cl_ord_ids[order.order_id]))
+            message.setField(fix.Symbol(order.symbol))
+            message.setField(fix.Side(order.side))
+
+            self.adapter._send_message(message)
+
+    def on_mass_status_rejected(self):
+        """Falls back to per-order requests if the venue rejects the mass
+        status request.
+        """
+        if not self.in_progress or not self.mass_status_supported:
+            return
+
+        self.log.warn('OrderMassStatusRequest rejected, falling back to '
+                      'OrderStatusRequest per order')
+        self.mass_status_supported = False
+
+        if self.open_orders:
+            self._start_order_status_requests()
+        else:
+            self.finish()
+
+    def on_status_report(self, order, message):
+        if not self._in_round(message):
+            return
+
+        ord_status = self.adapter._extract_field(fix.OrdStatus(), message)
+        _, qty_scale = self.adapter._scales(order.symbol)
+        executed_qty = self.adapter._extract_optional_decimal_field(
+            fix.CumQty, message, qty_scale)
+
+        with self.lock:
+            self.venue_states[order.order_id] = (ord_status, executed_qty)
+            self.report.reports_received += 1
+
+        self._finish_if_last(message)
+
+    def on_unknown_order(self, cl_ord_id, market_order_id, message):
+        if not self._in_round(message):
+            return
+
+        with self.lock:
+            self.unknown_orders.append((cl_ord_id, market_order_id))
+            self.report.reports_received += 1
+
+        self._finish_if_last(message)
+
+    def _in_round(self, message):
+        if not self.in_progress:
+            return False
+        if not self.mass_status_supported:
+            return True
+
+        mass_status_req_id = self.adapter._extract_optional_field(
+            fix.MassStatusReqID(), message)
+        if mass_status_req_id != self.mass_status_req_id:
+            self.log.warn('Ignoring status report for MassStatusReqID: {}, '
+                          'expected {}'.format(mass_status_req_id,
+                                               self.mass_status_req_id))
+            return False
+        return True
+
+    def _finish_if_last(self, message):
+        if self.mass_status_supported:
+            last = self.adapter._extract_optional_field(
+                fix.LastRptRequested(), message)
+            if last:
+                self.finish()
+        elif len(self.venue_states) >= len(self.open_orders):
+            self.finish()
+
+    def finish(self, complete=True):
+        with self.lock:
+            if not self.in_progress:
+                return
+
+            self.in_progress = False
+            if self.timer is not None:
+                self.timer.cancel()
+
+            report = self.report
+            report.complete = complete
+            report.orders_checked = len(self.open_orders)
+            report.discrepancies = self._compare(complete)
+            report.unreported = [order_id for order_id in self.open_orders
+                                 if order_id not in self.venue_states]
+            report.elapsed = time.time() - self.started
+
+        if complete:
+            self.log.info('Reconciliation finished in {:.3f}s, {} '
+                          'discrepancies'.format(report.elapsed,
+                                                 len(report.discrepancies)))
+        else:
+            self.log.warn('Reconciliation incomplete after {:.3f}s, {} '
+                          'discrepancies, {} orders not reported'.format(
+                              report.elapsed, len(report.discrepancies),
+                              len(report.unreported)))
+        self.adapter.order_handler.on_reconciliation_complete(report)
+
+    def _compare(self, complete):
+        discrepancies = []
+        venue_states = self.venue_states
+
+        for order_id, order in self.open_orders.items():
+            if order_id not in venue_states:
+                # Only a complete round shows the venue doesn't have it
+                if complete:
+                    discrepancies.append(Discrepancy(
+                        Discrepancy.MISSING_AT_VENUE, order_id, order.status))
+                continue
+
+            ord_status, executed_qty = venue_states[order_id]
+            if ord_status in self.terminal_statuses:
+                discrepancies.append(Discrepancy(
+                    Discrepancy.STATUS, order_id, order.status, ord_status))
+            if executed_qty is not None and \
+                    executed_qty != order.executed_qty:
+                discrepancies.append(Discrepancy(
+                    Discrepancy.EXECUTED_QTY, order_id, order.executed_qty,
+                    executed_qty))
+
+        # Orders we consider closed which the venue still has open
+        order_store = self.adapter.order_store.order_store
+        for order_id, (ord_status, _) in venue_states.items():
+            if order_id not in self.open_orders and \
+                    ord_status not in self.terminal_statuses:
+                discrepancies.append(Discrepancy(
+                    Discrepancy.STATUS, order_id,
+                    order_store[order_id].status, ord_status))
+
+        for cl_ord_id, market_order_id in self.unknown_orders:
+            discrepancies.append(Discrepancy(
+                Discrepancy.UNKNOWN_ORDER, None, None,
+                (cl_ord_id, market_order_id)))
+
+        return discrepancies
@@ -0,0 +1,225 @@
+import csv
+import logging
+import os
+import threading
+
+try:
+    from sys import intern
+except ImportError:
+    pass  # intern is a builtin in Python 2
+
+from fixed_point import decode_decimal
+
+# OrdRejReason values for orders rejected locally
+UNKNOWN_SYMBOL = 1
+INCORRECT_QUANTITY = 13
+OTHER = 99
+
+# Fraction of an increment a float price or quantity may be off by, since
+# neither is usually exact in binary. Holds for values up to about 10 ** 9
+# increments, beyond which fixed-point mode is needed.
+_TOLERANCE = 1e-6
+
+
+def _on_increment(value, increment):
+    if increment is None:
+        return True
+    if increment.__class__ is not float:
+        return value % increment == 0
+
+    units = value / increment
+    return -_TOLERANCE <= units - round(units) <= _TOLERANCE
+
+
+class Instrument(object):
+    """Static data for a symbol, with its increments precomputed.
+
+    tick and lot are integers at the symbol's price and quantity scales in
+    fixed-point mode and floats otherwise, so validate needs no parsing.
+    """
+
+    __slots__ = ('symbol', 'symbol_id', 'currency', 'tick_size', 'lot_size',
+                 'tick', 'lot')
+
+    def __init__(self, symbol, symbol_id, currency, tick_size, lot_size,
+                 price_scale=None, qty_scale=None):
+        self.symbol = symbol
+        self.symbol_id = symbol_id
+        self.currency = currency
+        self.tick_size = tick_size
+        self.lot_size = lot_size
+        self.tick = self._increment(tick_size, price_scale)
+        self.lot = self._increment(lot_size, qty_scale)
+
+    @staticmethod
+    def _increment(text, scale):
+        if not text:
+            return None
+        increment = float(text) if scale is None \
+            else decode_decimal(text, scale)
+        if increment <= 0:
+            raise ValueError('Increment must be positive: {}'.format(text))
+        return increment
+
+    def validate(self, qty, price=None, currency=None):
+        """Returns None if an order passes the checks, otherwise an
+        (OrdRejReason, text) tuple.
+        """
+        if currency is not None and currency != self.currency:
+            return OTHER, 'Currency {} is not {} for {}'.format(
+                currency, self.currency, self.symbol)
+        if qty <= 0 or not _on_increment(qty, self.lot):
+            return INCORRECT_QUANTITY, 'Quantity {} is not a multiple of ' \
+                'lot size {} for {}'.format(qty, self.lot_size, self.symbol)
+        if price is not None and not _on_increment(price, self.tick):
+            return OTHER, 'Price {} is not a multiple of tick size {} ' \
+                'for {}'.format(price, self.tick_size, self.symbol)
+        return None
+
+
+class ReferenceDataCache(object):
+    """Instruments loaded from a local CSV file.
+
+    The file has a header row naming the columns symbol, currency,
+    tick_size and lot_size; tick_size and lot_size may be left empty to
+    skip that check. Rows which fail to parse are logged and skipped.
+
+    Each symbol is interned and given a small integer id the first time it
+    is loaded. Ids are never reused, and are kept across reloads, so they
+    can index arrays held by analytics for the life of the process.
+
+    reload replaces the instruments in one assignment, so lookups on other
+    threads see either the old or the new set. start polls the file every
+    refresh_interval and reloads it when it changes. Pass the adapter's
+    FixedPointCodec in fixed-point mode so increments are held at the same
+    scales as order prices and quantities.
+    """
+
+    def __init__(self, path, fixed_point=None, refresh_interval=60):
+        self.path = path
+        self.fixed_point = fixed_point
+        self.refresh_interval = refresh_interval
+
+        self.instruments = {}
+        self.symbol_ids = {}
+        self.symbols = []
+        self.modified = None
+
+        self.stopped = threading.Event()
+        self.thread = None
+        self.log = logging.getLogger(__name__)
+
+        self.reload()
+
+    def reload(self):
+        """Loads the file, raising IOError or OSError if it is unreadable.
+
+        Returns the number of instruments loaded.
+        """
+        modified = os.path.getmtime(self.path)
+        instruments = {}
+
+        with open(self.path) as reference_file:
+            for line, row in enumerate(csv.DictReader(reference_file), 2):
+                try:
+                    instrument = self._create_instrument(row)
+                except (KeyError, TypeError, ValueError) as e:
+                    self.log.error('Skipping line {} of {}: {}'.format(
+                        line, self.path, e))
+                    continue
+                instruments[instrument.symbol] = instrument
+
+        self.instruments = instruments
+        self.modified = modified
+        self.log.info('Loaded {} instruments from {}'.format(
+            len(instruments), self.path))
+        return len(instruments)
+
+    def reload_if_modified(self):
+        try:
+            if os.path.getmtime(self.path) != self.modified:
+                self.reload()
+                return True
+        except (IOError, OSError) as e:
+            self.log.error('Unable to reload reference data from {}: {}'
+                           .format(self.path, e))
+        return False
+
+    def _create_instrument(self, row):
+        symbol = row['symbol'].strip()
+        if not symbol:
+            raise ValueError('Missing symbol')
+
+        price_scale = qty_scale = None
+        if self.fixed_point is not None:
+            price_scale = self.fixed_point.price_scale(symbol)
+            qty_scale = self.fixed_point.qty_scale(symbol)
+
+        # The row is parsed before the symbol is given an id, so a row which
+        # fails to parse never uses one up
+        instrument = Instrument(symbol, None, intern(row['currency'].strip()),
+                                (row['tick_size'] or '').strip(),
+                                (row['lot_size'] or '').strip(),
+                                price_scale, qty_scale)
+        instrument.symbol, instrument.symbol_id = self._assign_id(symbol)
+        return instrument
+
+    def _assign_id(self, symbol):
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is not None:
+            return self.symbols[symbol_id], symbol_id
+
+        # Appended before the id is published so a concurrent lookup never
+        # finds an id without its symbol
+        symbol = intern(symbol)
+        symbol_id = len(self.symbols)
+        self.symbols.append(symbol)
+        self.symbol_ids[symbol] = symbol_id
+        return symbol, symbol_id
+
+    def find(self, symbol):
+        return self.instruments.get(symbol)
+
+    def validate(self, symbol, qty, price=None, currency=None):
+        """Returns None if an order passes the checks for its symbol,
+        otherwise an (OrdRejReason, text) tuple.
+        """
+        instrument = self.instruments.get(symbol)
+        if instrument is None:
+            return UNKNOWN_SYMBOL, 'Unknown symbol {}'.format(symbol)
+        return instrument.validate(qty, price, currency)
+
+    def intern(self, symbol):
+        """Returns the cached string for a symbol, or symbol itself if it
+        has never been loaded.
+        """
+        symbol_id = self.symbol_ids.get(symbol)
+        return symbol if symbol_id is None else self.symbols[symbol_id]
+
+    def symbol_id(self, symbol):
+        """Returns the id for a symbol, or None if it has never been
+        loaded.
+        """
+        return self.symbol_ids.get(symbol)
+
+    def symbol(self, symbol_id):
+        return self.symbols[symbol_id]
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def _run(self):
+        while not self.stopped.wait(self.refresh_interval):
+            self.reload_if_modified()
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
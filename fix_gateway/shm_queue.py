@@ -0,0 +1,94 @@
+import ctypes
+import multiprocessing
+import pickle
+import struct
+import time
+
+try:
+    from queue import Empty, Full
+except ImportError:
+    from Queue import Empty, Full
+
+
+_LENGTH = struct.Struct('<I')
+
+
+def serialise(item):
+    """Returns item pickled as SharedMemoryQueue.put_serialised_nowait
+    expects, so it can be captured on one thread and queued on another.
+    """
+    return pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+
+
+class SharedMemoryQueue(object):
+    """Single producer, single consumer queue between two processes.
+
+    Items are pickled into fixed size slots of a ring buffer held in shared
+    memory. The producer only writes the tail counter and the consumer only
+    writes the head counter, so no lock is needed as long as each end is
+    used by a single thread.
+    """
+
+    def __init__(self, slots=4096, slot_size=1024):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.buffer = multiprocessing.RawArray(ctypes.c_char,
+                                               slots * slot_size)
+        self.head = multiprocessing.RawValue(ctypes.c_ulonglong, 0)
+        self.tail = multiprocessing.RawValue(ctypes.c_ulonglong, 0)
+
+    def qsize(self):
+        return self.tail.value - self.head.value
+
+    def empty(self):
+        return self.tail.value == self.head.value
+
+    def put_nowait(self, item):
+        self.put_serialised_nowait(serialise(item))
+
+    def put_serialised_nowait(self, data):
+        tail = self.tail.value
+        if tail - self.head.value >= self.slots:
+            raise Full
+
+        size = _LENGTH.size + len(data)
+        if size > self.slot_size:
+            raise ValueError('Item of {} bytes exceeds slot size of {} bytes'
+                             .format(size, self.slot_size))
+
+        offset = (tail % self.slots) * self.slot_size
+        self.buffer[offset:offset + size] = _LENGTH.pack(len(data)) + data
+        self.tail.value = tail + 1
+
+    def put(self, item, timeout=None, poll_interval=0.0001):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            try:
+                return self.put_nowait(item)
+            except Full:
+                if deadline is not None and time.time() >= deadline:
+                    raise
+                time.sleep(poll_interval)
+
+    def get_nowait(self):
+        head = self.head.value
+        if head == self.tail.value:
+            raise Empty
+
+        offset = (head % self.slots) * self.slot_size
+        length, = _LENGTH.unpack(
+            self.buffer[offset:offset + _LENGTH.size])
+        start = offset + _LENGTH.size
+        item = pickle.loads(self.buffer[start:start + length])
+        self.head.value = head + 1
+        return item
+
+    def get(self, timeout=None, poll_interval=0.0001):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            try:
+                return self.get_nowait()
+            except Empty:
+                if deadline is not None and time.time() >= deadline:
+                    raise
+                time.sleep(poll_interval)
@@ -11,77 +11,85 @@ class Order(object):
         self._time_in_force = None
         self._status = None
 
-        @property
-        def order_id(self):
-            return self._order_id
+    @property
+    def order_id(self):
+        return self._order_id
 
-        @order_id.setter
-        def order_id(self, value):
-            self._order_id = value
+    @order_id.setter
+    def order_id(self, value):
+        self._order_id = value
 
-        @property
-        def side(self):
-            return self._side
+    @property
+    def side(self):
+        return self._side
 
-        @side.setter
-        def side(self, value):
-            self._side = value
+    @side.setter
+    def side(self, value):
+        self._side = value
 
-        @property
-        def symbol(self):
-            return self._symbol
+    @property
+    def symbol(self):
+        return self._symbol
 
-        @symbol.setter
-        def symbol(self, value):
-            self._symbol = value
+    @symbol.setter
+    def symbol(self, value):
+        self._symbol = value
 
-        @property
-        def qty(self):
-            return self._qty
+    @property
+    def qty(self):
+        return self._qty
 
-        @qty.setter
-        def qty(self, value):
-            self._qty = value
+    @qty.setter
+    def qty(self, value):
+        self._qty = value
 
-        @property
-        def price(self):
-            return self._price
+    @property
+    def executed_qty(self):
+        return self._executed_qty
+
+    @executed_qty.setter
+    def executed_qty(self, value):
+        self._executed_qty = value
+
+    @property
+    def price(self):
+        return self._price
 
-        @price.setter
-        def price(self, value):
-            self._price = value
+    @price.setter
+    def price(self, value):
+        self._price = value
 
-        @property
-        def currency(self):
-            return self._price
+    @property
+    def currency(self):
+        return self._currency
 
-        @currency.setter
-        def currency(self, value):
-            self._currency = value
+    @currency.setter
+    def currency(self, value):
+        self._currency = value
 
-        @property
-        def order_type(self):
-            return self._order_type
+    @property
+    def order_type(self):
+        return self._order_type
 
-        @order_type.setter
-        def order_type(self, value):
-            self._order_type = value
+    @order_type.setter
+    def order_type(self, value):
+        self._order_type = value
 
-        @property
-        def time_in_force(self):
-            return self._time_in_force
+    @property
+    def time_in_force(self):
+        return self._time_in_force
 
-        @time_in_force.setter
-        def time_in_force(self, value):
-            self._time_in_force = value
+    @time_in_force.setter
+    def time_in_force(self, value):
+        self._time_in_force = value
 
-        @property
-        def status(self):
-            return self._status
+    @property
+    def status(self):
+        return self._status
 
-        @status.setter
-        def status(self, value):
-            self._status = value
+    @status.setter
+    def status(self, value):
+        self._status = value
 
 
 class Execution(object):
@@ -0,0 +1,173 @@
+import threading
+import unittest
+
+from mock import Mock
+
+from fix_gateway.batching import BatchingOrderHandler
+from fix_gateway.simple_order import Order
+from fix_gateway.fix_market_gateway import *
+
+
+class TestBatchingOrderHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = BatchingOrderHandler(threaded=False)
+        self.handler.on_events = Mock()
+
+    def test_flush_delivers_events_in_order(self):
+        order = _get_test_order('1')
+        execution = Mock()
+        self.handler.on_new_ack(order)
+        self.handler.on_execution(order, execution)
+        self.handler.on_cancel_ack(order)
+
+        self.handler.flush()
+
+        self.handler.on_events.assert_called_once_with([
+            ('on_new_ack', (order,)),
+            ('on_execution', (order, execution)),
+            ('on_cancel_ack', (order,))])
+
+    def test_flush_without_events(self):
+        self.handler.flush()
+
+        self.assertFalse(self.handler.on_events.called)
+
+    def test_flush_starts_new_batch(self):
+        order = _get_test_order('1')
+        self.handler.on_new_ack(order)
+        self.handler.flush()
+        self.handler.on_cancel_ack(order)
+        self.handler.flush()
+
+        self.assertEqual([(('on_new_ack', (order,)),),
+                          (('on_cancel_ack', (order,)),)],
+                         [tuple(call[0][0]) for call in
+                          self.handler.on_events.call_args_list])
+
+    def test_coalesce_keeps_latest_status_rejects_and_executions(self):
+        self.handler.coalesce = True
+        first = _get_test_order('1')
+        second = _get_test_order('2')
+        executions = [Mock(), Mock()]
+
+        self.handler.on_new_ack(first)
+        self.handler.on_new_ack(second)
+        self.handler.on_replace_ack(first)
+        self.handler.on_execution(first, executions[0])
+        self.handler.on_replace_rej(first)
+        self.handler.on_replace_ack(first)
+        self.handler.on_execution(first, executions[1])
+        self.handler.on_cancel_ack(first)
+        self.handler.flush()
+
+        self.handler.on_events.assert_called_once_with([
+            ('on_new_ack', (second,)),
+            ('on_execution', (first, executions[0])),
+            ('on_replace_rej', (first,)),
+            ('on_execution', (first, executions[1])),
+            ('on_cancel_ack', (first,))])
+
+    def test_handler_error_does_not_stop_batching(self):
+        self.handler.on_events.side_effect = [ValueError(), None]
+        order = _get_test_order('1')
+
+        self.handler.on_new_ack(order)
+        self.handler.flush()
+        self.handler.on_cancel_ack(order)
+        self.handler.flush()
+
+        self.handler.on_events.assert_called_with([
+            ('on_cancel_ack', (order,))])
+
+    def test_dispatcher_delivers_burst_as_one_batch(self):
+        delivered = threading.Event()
+        batches = []
+
+        def on_events(batch):
+            batches.append(batch)
+            delivered.set()
+
+        handler = BatchingOrderHandler(quiet_period=0.05, max_delay=5)
+        handler.on_events = on_events
+        orders = [_get_test_order(str(i)) for i in range(10)]
+        for order in orders:
+            handler.on_new_ack(order)
+
+        self.assertTrue(delivered.wait(5))
+        handler.stop()
+        self.assertEqual([[('on_new_ack', (order,)) for order in orders]],
+                         batches)
+
+    def test_stop_delivers_pending_events(self):
+        handler = BatchingOrderHandler(quiet_period=5, max_delay=5)
+        handler.on_events = Mock()
+        order = _get_test_order('1')
+        handler.on_new_ack(order)
+
+        handler.stop()
+
+        handler.on_events.assert_called_once_with([
+            ('on_new_ack', (order,))])
+
+    def test_events_after_stop_dropped(self):
+        handler = BatchingOrderHandler(quiet_period=5, max_delay=5)
+        handler.on_events = Mock()
+        handler.on_new_ack(_get_test_order('1'))
+        handler.stop()
+
+        handler.on_cancel_ack(_get_test_order('1'))
+
+        self.assertIsNone(handler.dispatcher)
+        self.assertEqual([], handler.events)
+        self.assertEqual(1, handler.on_events.call_count)
+
+    def test_max_batch_closes_batch(self):
+        handler = BatchingOrderHandler(quiet_period=5, max_delay=5,
+                                       max_batch=3)
+        delivered = threading.Event()
+        handler.on_events = Mock(side_effect=lambda batch: delivered.set())
+        for i in range(3):
+            handler.on_new_ack(_get_test_order(str(i)))
+
+        self.assertTrue(delivered.wait(5))
+        handler.stop()
+        self.assertEqual(3, len(handler.on_events.call_args[0][0]))
+
+    def test_adapter_events_batched(self):
+        adapter = FixMarketAdapter(self.handler)
+        adapter._send_message = Mock()
+        order = _get_test_order('1')
+        adapter.send_new(order)
+
+        for text in ('35=8|11=1_1|17=A1|37=O1|39=0|55=TEST|150=0|',
+                     '35=8|11=1_1|14=4|17=F1|31=45.6|32=4|37=O1|39=1|54=1'
+                     '|55=TEST|60=20121105-23:25:25.123|150=F|151=6|',
+                     '35=8|11=1_1|14=10|17=F2|31=45.6|32=6|37=O1|39=2|54=1'
+                     '|55=TEST|60=20121105-23:25:25.456|150=F|151=0|'):
+            adapter.fromApp(fix.Message(text.replace('|', '\x01'), False),
+                            None)
+        self.handler.flush()
+
+        batch = self.handler.on_events.call_args[0][0]
+        self.assertEqual(['on_new_ack', 'on_execution', 'on_execution'],
+                         [callback for callback, _ in batch])
+        self.assertEqual([4, 6], [args[1].last_qty for _, args in batch[1:]])
+        self.assertEqual(OrdStatus.FULLY_FILLED, order.status)
+
+
+def _get_test_order(order_id):
+    order = Order()
+    order.order_id = order_id
+    order.symbol = 'TEST'
+    order.side = Side.BUY
+    order.qty = 10
+    order.type = OrderType.LIMIT
+    order.price = 45.6
+    order.currency = 'GBP'
+    order.time_in_force = TimeInForce.DAY
+    return order
+
+
+if __name__ == '__main__':
+    unittest.main()
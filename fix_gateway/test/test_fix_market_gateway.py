@@ -1,11 +1,26 @@
+import os
+import re
+import shutil
+import tempfile
 import unittest
 
 from mock import Mock
 from mock import patch
 
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+from fix_gateway.fixed_point import FixedPointCodec
+from fix_gateway.outbound_queue import OutboundQueue, QueuePolicy
+from fix_gateway.reference_data import ReferenceDataCache
 from fix_gateway.simple_order import Order
 from fix_gateway.fix_market_gateway import *
 
+# 2012-11-05 23:25:25.123 UTC
+TRANSACT_TIME_NS = 1352157925123000000
+
 
 class TestFixMarketAdapter(unittest.TestCase):
     def setUp(self):
@@ -40,7 +55,9 @@ class TestFixMarketAdapter(unittest.TestCase):
             time.strftime('%Y%m%d-%H:%M:%S', time.gmtime()),
             self.adapter._extract_date_field(fix.TransactTime(), message))
 
-    def test_send_new(self):
+    @patch('fix_gateway.fix_market_gateway.time_ns',
+           return_value=TRANSACT_TIME_NS)
+    def test_send_new(self, time_ns):
         self.adapter._send_message = Mock()
 
         order = Order()
@@ -58,12 +75,205 @@ class TestFixMarketAdapter(unittest.TestCase):
         message = self.adapter._send_message.call_args[0][0]
         self.assertTrue(self.adapter._send_message.called)
         self.assertEqual(
-            '9=63|35=D|11=12345_1|15=GBP|38=10|40=2|44=123.456|54=1|55=TEST'
-            '|59=0'
-            '|10=249|'.replace('|', '\x01'),
+            '9=88|35=D|11=12345_1|15=GBP|38=10|40=2|44=123.456|54=1|55=TEST'
+            '|59=0|60=20121105-23:25:25.123'
+            '|10=200|'.replace('|', '\x01'),
             message.toString())
 
-    def test_send_replace(self):
+    @patch('fix_gateway.fix_market_gateway.time_ns',
+           return_value=TRANSACT_TIME_NS)
+    def test_send_new_low_latency(self, time_ns):
+        self.adapter = FixMarketAdapter(self.handler, low_latency=True)
+        sent = []
+        self.adapter._send_message = lambda message: sent.append(
+            message.toString())
+
+        for order_id in ('12345', '12346'):
+            order = Order()
+            order.order_id = order_id
+            order.symbol = "TEST"
+            order.side = Side.BUY
+            order.qty = 10
+            order.type = OrderType.LIMIT
+            order.price = 123.456
+            order.currency = "GBP"
+            order.time_in_force = TimeInForce.DAY
+            self.adapter.send_new(order)
+
+        self.assertEqual(
+            '9=88|35=D|11=12346_1|15=GBP|38=10|40=2|44=123.456|54=1|55=TEST'
+            '|59=0|60=20121105-23:25:25.123'
+            '|10=201|'.replace('|', '\x01'),
+            sent[1])
+
+    def test_process_execution_report_trade_low_latency(self):
+        self.adapter = FixMarketAdapter(self.handler, low_latency=True)
+        self._fill_test_order()
+
+        execution = self.handler.on_execution.call_args[0][1]
+        self.assertEqual('123', execution.exec_id)
+        self.assertEqual(45.6, execution.last_price)
+        self.assertEqual(5, execution.last_qty)
+
+    def test_send_new_held_while_logged_out(self):
+        self.adapter = FixMarketAdapter(self.handler,
+                                        reconcile_on_logon=False,
+                                        outbound_queue=OutboundQueue())
+        self.adapter._send_message = Mock()
+        orders = [_get_new_order('12345'), _get_new_order('12346')]
+
+        for order in orders:
+            self.adapter.send_new(order)
+
+        self.assertFalse(self.adapter._send_message.called)
+        self.assertEqual(OrdStatus.PENDING_NEW, orders[0].status)
+
+        self.adapter.onLogon(None)
+        deadline = time.time() + 5
+        while self.adapter._send_message.call_count < 2 and \
+                time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(
+            ['12345_1', '12346_1'],
+            [call[0][0].getField(fix.ClOrdID().getField())
+             for call in self.adapter._send_message.call_args_list])
+
+    def test_second_logon_does_not_start_another_flush(self):
+        self.adapter = FixMarketAdapter(self.handler,
+                                        reconcile_on_logon=False,
+                                        outbound_queue=OutboundQueue())
+        pacing = threading.Event()
+        release = threading.Event()
+
+        def acquire():
+            pacing.set()
+            release.wait(5)
+
+        self.adapter.rate_limiter = Mock()
+        self.adapter.rate_limiter.acquire.side_effect = acquire
+        self.adapter._send_message = Mock()
+        orders = [_get_new_order('12345'), _get_new_order('12346')]
+        for order in orders:
+            self.adapter.send_new(order)
+
+        self.adapter.onLogon(None)
+        self.assertTrue(pacing.wait(5))
+        flush = self.adapter.outbound_flush
+        self.adapter.onLogon(None)
+        self.assertIs(flush, self.adapter.outbound_flush)
+
+        release.set()
+        flush.join(5)
+        self.assertEqual(2, self.adapter._send_message.call_count)
+        self.assertIsNone(self.adapter.outbound_flush)
+
+    def test_send_new_waits_for_inbound_processing(self):
+        self.adapter = FixMarketAdapter(self.handler,
+                                        reconcile_on_logon=False)
+        self.adapter._send_message = Mock()
+        order = _get_new_order('12345')
+
+        sender = threading.Thread(target=self.adapter.send_new,
+                                  args=(order,))
+        with self.adapter.outbound_lock:
+            sender.start()
+            sender.join(0.1)
+            self.assertTrue(sender.is_alive())
+            self.assertIsNone(order.status)
+        sender.join(5)
+
+        self.assertEqual(OrdStatus.PENDING_NEW, order.status)
+        self.assertEqual(1, self.adapter._send_message.call_count)
+
+    def test_flush_rejects_request_when_session_lost(self):
+        self.adapter = FixMarketAdapter(self.handler,
+                                        reconcile_on_logon=False,
+                                        outbound_queue=OutboundQueue())
+        self.adapter._send_message = Mock(return_value=False)
+        order = _get_new_order('12345')
+        self.adapter.send_new(order)
+
+        self.adapter.outbound_queue.on_logon()
+        self.adapter._flush_outbound_queue()
+
+        self.handler.on_new_rej.assert_called_once_with(order)
+        self.assertEqual(OrdStatus.NEW_REJECT, order.status)
+
+    def test_send_new_expired_while_logged_out(self):
+        self.adapter = FixMarketAdapter(
+            self.handler, outbound_queue=OutboundQueue(ttl=0.01,
+                                                       expiry_interval=0.01))
+        order = _get_new_order('12345')
+
+        self.adapter.send_new(order)
+        self.adapter.send_cancel(order)
+        deadline = time.time() + 5
+        while not self.handler.on_new_rej.called and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.handler.on_new_rej.assert_called_once_with(order)
+        self.assertFalse(self.handler.on_cancel_rej.called)
+        self.assertEqual(OrdStatus.NEW_REJECT, order.status)
+        self.assertEqual(0, self.adapter.outbound_queue.depth())
+
+    def test_send_cancel_refused_while_logged_out(self):
+        self.adapter = FixMarketAdapter(
+            self.handler, outbound_queue=OutboundQueue(
+                policies={RequestType.CANCEL: QueuePolicy.REJECT}))
+        order = _get_test_order()
+        order.status = OrdStatus.NEW
+
+        self.adapter.send_cancel(order)
+
+        self.handler.on_cancel_rej.assert_called_once_with(order)
+        self.assertEqual(OrdStatus.CANCEL_REJECT, order.status)
+
+    def test_send_new_checked_against_reference_data(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'instruments.csv')
+            with open(path, 'w') as reference_file:
+                reference_file.write('symbol,currency,tick_size,lot_size\n'
+                                     'TEST,GBP,0.001,10\n')
+            self.adapter = FixMarketAdapter(
+                self.handler, reference_data=ReferenceDataCache(path))
+        finally:
+            shutil.rmtree(directory)
+        self.adapter._send_message = Mock()
+
+        order = _get_new_order('12345')
+        order.symbol = ''.join(['TE', 'ST'])
+        self.adapter.send_new(order)
+
+        self.assertTrue(self.adapter._send_message.called)
+        self.assertIs(self.adapter.reference_data.find('TEST').symbol,
+                      order.symbol)
+
+        for order_id, field, value in (('12346', 'price', 123.4565),
+                                       ('12347', 'qty', 15),
+                                       ('12348', 'currency', 'USD'),
+                                       ('12349', 'symbol', 'OTHER')):
+            order = _get_new_order(order_id)
+            setattr(order, field, value)
+            self.adapter.send_new(order)
+
+            self.handler.on_new_rej.assert_called_with(order)
+            self.assertEqual(OrdStatus.NEW_REJECT, order.status)
+        self.assertEqual(1, self.adapter._send_message.call_count)
+
+        order = _get_new_order('12345')
+        order.status = OrdStatus.NEW
+        order.qty = 25
+        self.adapter.send_replace(order)
+
+        self.handler.on_replace_rej.assert_called_once_with(order)
+        self.assertEqual(OrdStatus.REPLACE_REJECT, order.status)
+        self.assertEqual(1, self.adapter._send_message.call_count)
+
+    @patch('fix_gateway.fix_market_gateway.time_ns',
+           return_value=TRANSACT_TIME_NS)
+    def test_send_replace(self, time_ns):
         self.adapter._send_message = Mock()
         self.adapter.order_store.update_order_maps('12345_1',
                                                    _get_test_order())
@@ -83,11 +293,13 @@ class TestFixMarketAdapter(unittest.TestCase):
         message = self.adapter._send_message.call_args[0][0]
         self.assertTrue(self.adapter._send_message.called)
         self.assertEqual(
-            '9=56|35=G|11=12345_2|38=10|40=2|44=123.456|54=1|55=TEST'
-            '|59=0|10=130|'.replace('|', '\x01'),
+            '9=81|35=G|11=12345_2|38=10|40=2|44=123.456|54=1|55=TEST'
+            '|59=0|60=20121105-23:25:25.123|10=072|'.replace('|', '\x01'),
             message.toString())
 
-    def test_send_cancel(self):
+    @patch('fix_gateway.fix_market_gateway.time_ns',
+           return_value=TRANSACT_TIME_NS)
+    def test_send_cancel(self, time_ns):
         self.adapter._send_message = Mock()
         self.adapter.order_store.update_order_maps('12345_1',
                                                    _get_test_order())
@@ -103,8 +315,8 @@ class TestFixMarketAdapter(unittest.TestCase):
         message = self.adapter._send_message.call_args[0][0]
         self.assertTrue(self.adapter._send_message.called)
         self.assertEqual(
-            '9=35|35=F|11=12345_2|38=30|54=1|55=TEST|10=199|'.replace('|',
-                                                                   '\x01'),
+            '9=60|35=F|11=12345_2|38=30|54=1|55=TEST'
+            '|60=20121105-23:25:25.123|10=141|'.replace('|', '\x01'),
             message.toString())
 
     def test_process_execution_report_fill(self):
@@ -128,8 +340,7 @@ class TestFixMarketAdapter(unittest.TestCase):
         self.assertEqual('123', execution.exec_id)
         self.assertEqual(45.6, execution.last_price)
         self.assertEqual(5, execution.last_qty)
-        self.assertEqual('20121105-23:25:25',
-                         execution.transact_time)
+        self.assertEqual(1352157925000000000, execution.transact_time)
 
     def test_process_execution_report_new(self):
         self.adapter.order_store.update_order_maps('12345_1',
@@ -192,6 +403,556 @@ class TestFixMarketAdapter(unittest.TestCase):
         self.assertEqual('12345', order.order_id)
         self.assertEqual(OrdStatus.REPLACED, order.status)
 
+    def test_process_execution_report_expired(self):
+        self.adapter.order_store.update_order_maps('12345_1',
+                                                   _get_test_order())
+
+        message = fix.Message(
+            '35=8|11=12345_1|37=123|55=TEST|150=C|'.replace('|', '\x01'),
+            False)
+        self.adapter._process_execution_report(message)
+
+        self.assertTrue(self.handler.on_expired.called)
+        order = self.handler.on_expired.call_args[0][0]
+
+        self.assertEqual('12345', order.order_id)
+        self.assertEqual(OrdStatus.EXPIRED, order.status)
+
+    def test_process_execution_report_trade_correct(self):
+        self._fill_test_order()
+
+        message = fix.Message(
+            '35=8|11=12345_1|14=3|17=124|19=123|31=45.5|32=3|37=Order1'
+            '|55=TEST|150=G|151=7|'.replace('|', '\x01'), False)
+        self.adapter._process_execution_report(message)
+
+        self.assertTrue(self.handler.on_execution_correct.called)
+        order = self.handler.on_execution_correct.call_args[0][0]
+        execution = self.handler.on_execution_correct.call_args[0][1]
+
+        self.assertEqual(3, order.executed_qty)
+        self.assertEqual(OrdStatus.PARTIALLY_FILLED, order.status)
+        self.assertEqual('124', execution.exec_id)
+        self.assertEqual(45.5, execution.last_price)
+        self.assertEqual(3, execution.last_qty)
+        self.assertEqual(execution,
+                         self.adapter.order_store.find_execution('124'))
+
+    def test_process_execution_report_trade_cancel(self):
+        self._fill_test_order()
+
+        message = fix.Message(
+            '35=8|11=12345_1|17=124|19=123|37=Order1|55=TEST|150=H'
+            '|'.replace('|', '\x01'), False)
+        self.adapter._process_execution_report(message)
+
+        self.assertTrue(self.handler.on_execution_cancel.called)
+        order = self.handler.on_execution_cancel.call_args[0][0]
+        execution = self.handler.on_execution_cancel.call_args[0][1]
+
+        self.assertEqual(0, order.executed_qty)
+        self.assertEqual(OrdStatus.NEW, order.status)
+        self.assertEqual(0, execution.last_qty)
+
+    def test_process_execution_report_trade_cancel_uses_ord_status(self):
+        self._fill_test_order()
+
+        message = fix.Message(
+            '35=8|11=12345_1|14=0|17=124|19=123|37=Order1|39=0|55=TEST|150=H'
+            '|151=10|'.replace('|', '\x01'), False)
+        self.adapter._process_execution_report(message)
+
+        order = self.handler.on_execution_cancel.call_args[0][0]
+        self.assertEqual(OrdStatus.NEW, order.status)
+
+    def test_process_execution_report_trade_cancel_on_canceled_order(self):
+        self._fill_test_order()
+        order = self.adapter.order_store.order_store['12345']
+        self.adapter.order_store.set_status(order, OrdStatus.CANCELED)
+
+        message = fix.Message(
+            '35=8|11=12345_1|17=124|19=123|37=Order1|55=TEST|150=H'
+            '|'.replace('|', '\x01'), False)
+        self.adapter._process_execution_report(message)
+
+        self.assertTrue(self.handler.on_execution_cancel.called)
+        self.assertEqual(0, order.executed_qty)
+        self.assertEqual(OrdStatus.CANCELED, order.status)
+        self.assertNotIn('12345', self.adapter.order_store.open_order_ids)
+
+    def test_process_execution_report_trade_correct_on_filled_order(self):
+        order = _get_test_order()
+        order.qty = 10
+        self.adapter.order_store.update_order_maps('12345_1', order)
+        self.adapter._process_execution_report(fix.Message(
+            '35=8|11=12345_1|14=10|17=123|31=45.6|32=10|37=Order1|39=2'
+            '|55=TEST|60=20121105-23:25:25|150=F|151=0|'.replace('|', '\x01'),
+            False))
+
+        message = fix.Message(
+            '35=8|11=12345_1|14=8|17=124|19=123|31=45.6|32=8|37=Order1|39=1'
+            '|55=TEST|150=G|151=2|'.replace('|', '\x01'), False)
+        self.adapter._process_execution_report(message)
+
+        self.assertTrue(self.handler.on_execution_correct.called)
+        self.assertEqual(8, order.executed_qty)
+        self.assertEqual(OrdStatus.FULLY_FILLED, order.status)
+        self.assertNotIn('12345', self.adapter.order_store.open_order_ids)
+        self.assertEqual(1, self.adapter.state_machine.illegal_transitions[
+            (OrdStatus.FULLY_FILLED, OrdStatus.PARTIALLY_FILLED)])
+
+    def test_send_new_fixed_point(self):
+        self.adapter.fixed_point = FixedPointCodec(default_price_scale=4)
+        self.adapter._send_message = Mock()
+
+        order = Order()
+        order.order_id = '12345'
+        order.symbol = "TEST"
+        order.side = Side.BUY
+        order.qty = 10
+        order.type = OrderType.LIMIT
+        order.price = 1234560
+        order.currency = "GBP"
+        order.time_in_force = TimeInForce.DAY
+
+        self.adapter.send_new(order)
+
+        message = self.adapter._send_message.call_args[0][0]
+        self.assertEqual('123.4560', message.getField(44))
+        self.assertEqual('10', message.getField(38))
+
+    def test_process_execution_report_trade_fixed_point(self):
+        self.adapter.fixed_point = FixedPointCodec(default_price_scale=4)
+        order = _get_test_order()
+        order.symbol = 'TEST'
+        order.qty = 10
+        self.adapter.order_store.update_order_maps('12345_1', order)
+
+        for exec_id, last_qty, cum_qty, last_px in (('1', 3, 3, '0.1'),
+                                                    ('2', 7, 10, '0.2')):
+            message = fix.Message(
+                '35=8|11=12345_1|14={}|17={}|31={}|32={}|37=Order1|55=TEST'
+                '|60=20121105-23:25:25|150=F|151={}|'.format(
+                    cum_qty, exec_id, last_px, last_qty, 10 - cum_qty)
+                .replace('|', '\x01'), False)
+            self.adapter._process_execution_report(message)
+
+        execution = self.handler.on_execution.call_args[0][1]
+        self.assertEqual(2000, execution.last_price)
+        self.assertEqual(7, execution.last_qty)
+        self.assertEqual(10, order.executed_qty)
+        self.assertEqual(
+            3 * 1000 + 7 * 2000,
+            self.adapter.order_store.find_executed_notional('12345'))
+
+    def test_process_execution_report_trade_fixed_point_rounded(self):
+        self.adapter.fixed_point = FixedPointCodec(default_price_scale=4)
+        order = _get_test_order()
+        order.symbol = 'TEST'
+        order.qty = 10
+        self.adapter.order_store.update_order_maps('12345_1', order)
+
+        self.adapter.fromApp(fix.Message(
+            '35=8|11=12345_1|14=10|17=1|31=0.123456|32=10|37=Order1|55=TEST'
+            '|60=20121105-23:25:25|150=F|151=0|'.replace('|', '\x01'),
+            False), None)
+
+        execution = self.handler.on_execution.call_args[0][1]
+        self.assertEqual(1235, execution.last_price)
+        self.assertEqual(OrdStatus.FULLY_FILLED, order.status)
+        counters, _, _ = self.adapter.metrics.snapshot()
+        self.assertEqual(1, counters[('fix_decimals_rounded_total',
+                                      (('tag', '31'),))])
+
+    def test_process_execution_report_invalid_value_dropped(self):
+        self.adapter.fixed_point = FixedPointCodec(default_price_scale=4)
+        order = _get_test_order()
+        order.symbol = 'TEST'
+        order.qty = 10
+        self.adapter.order_store.update_order_maps('12345_1', order)
+
+        self.adapter.fromApp(fix.Message(
+            '35=8|11=12345_1|14=10|17=1|31=1.2x|32=10|37=Order1|55=TEST'
+            '|60=20121105-23:25:25|150=F|151=0|'.replace('|', '\x01'),
+            False), None)
+
+        self.assertFalse(self.handler.on_execution.called)
+        counters, _, _ = self.adapter.metrics.snapshot()
+        self.assertEqual(1, counters[('fix_invalid_messages_total',
+                                      (('msg_type', '8'),))])
+        self.assertNotIn(('fix_decimals_rounded_total', (('tag', '31'),)),
+                         counters)
+
+    def test_process_execution_report_handler_value_error_raised(self):
+        self._fill_test_order()
+        self.handler.on_cancel_ack.side_effect = ValueError('handler')
+
+        with self.assertRaises(ValueError):
+            self.adapter.fromApp(fix.Message(
+                '35=8|11=12345_1|17=2|37=Order1|39=4|55=TEST|150=4'
+                '|'.replace('|', '\x01'), False), None)
+
+        counters, _, _ = self.adapter.metrics.snapshot()
+        self.assertNotIn(('fix_invalid_messages_total', (('msg_type', '8'),)),
+                         counters)
+
+    def test_process_execution_report_trade_correct_notional(self):
+        self._fill_test_order()
+
+        message = fix.Message(
+            '35=8|11=12345_1|14=3|17=124|19=123|31=45.5|32=3|37=Order1'
+            '|55=TEST|150=G|151=7|'.replace('|', '\x01'), False)
+        self.adapter._process_execution_report(message)
+
+        self.assertEqual(
+            45.5 * 3,
+            self.adapter.order_store.find_executed_notional('12345'))
+
+    def test_process_execution_report_trade_cancel_unknown_exec_ref(self):
+        self.adapter.order_store.update_order_maps('12345_1',
+                                                   _get_test_order())
+
+        message = fix.Message(
+            '35=8|11=12345_1|17=124|19=999|37=Order1|55=TEST|150=H'
+            '|'.replace('|', '\x01'), False)
+
+        with self.assertRaises(StoreException):
+            self.adapter._process_execution_report(message)
+
+    def test_process_execution_report_illegal_transition(self):
+        order = _get_test_order()
+        order.status = OrdStatus.FULLY_FILLED
+        self.adapter.order_store.update_order_maps('12345_1', order)
+
+        message = fix.Message(
+            '35=8|11=12345_1|17=54321|37=123|55=TEST|150=0|'.replace('|',
+                                                                   '\x01'),
+            False)
+        self.adapter._process_execution_report(message)
+
+        self.assertFalse(self.handler.on_new_ack.called)
+        self.assertEqual(OrdStatus.FULLY_FILLED, order.status)
+        self.assertEqual(1, self.adapter.state_machine.illegal_transitions[
+            (OrdStatus.FULLY_FILLED, OrdStatus.NEW)])
+
+    def test_process_execution_report_deferred_transition(self):
+        order = _get_test_order()
+        order.status = OrdStatus.PENDING_NEW
+        self.adapter.order_store.update_order_maps('12345_1', order)
+
+        done_for_day = fix.Message(
+            '35=8|11=12345_1|37=123|55=TEST|150=3|'.replace('|', '\x01'),
+            False)
+        self.adapter._process_execution_report(done_for_day)
+
+        self.assertFalse(self.handler.on_done_for_day.called)
+        self.assertEqual(OrdStatus.PENDING_NEW, order.status)
+
+        new_ack = fix.Message(
+            '35=8|11=12345_1|17=54321|37=123|55=TEST|150=0|'.replace('|',
+                                                                   '\x01'),
+            False)
+        self.adapter._process_execution_report(new_ack)
+
+        self.assertTrue(self.handler.on_new_ack.called)
+        self.assertTrue(self.handler.on_done_for_day.called)
+        self.assertEqual(OrdStatus.DONE_FOR_DAY, order.status)
+        self.assertFalse(self.adapter.state_machine.has_deferred('12345'))
+
+    def test_process_execution_report_late_ack_after_fill_dropped(self):
+        self.adapter._send_message = Mock()
+        order = _get_test_order()
+        order.status = OrdStatus.PENDING_NEW
+        self.adapter.order_store.update_order_maps('12345_1', order)
+
+        for text in ('35=8|11=12345_1|14=4|17=1|31=45.6|32=4|37=123|39=1'
+                     '|55=TEST|60=20121105-23:25:25.123|150=F|151=6|',
+                     '35=8|11=12345_1|17=2|37=123|39=0|55=TEST|150=0|'):
+            self.adapter._process_execution_report(
+                fix.Message(text.replace('|', '\x01'), False))
+
+        self.assertEqual(OrdStatus.PARTIALLY_FILLED, order.status)
+        self.assertFalse(self.adapter.state_machine.has_deferred('12345'))
+        self.assertEqual(1, self.adapter.state_machine.illegal_transitions[
+            (OrdStatus.PARTIALLY_FILLED, OrdStatus.NEW)])
+
+        self.adapter.send_cancel(order)
+        self.adapter._process_execution_report(fix.Message(
+            '35=8|11=12345_2|17=3|37=123|39=6|55=TEST|150=6|'.replace(
+                '|', '\x01'), False))
+
+        self.assertEqual(OrdStatus.PENDING_CANCEL, order.status)
+        self.assertFalse(self.handler.on_new_ack.called)
+
+    def test_process_execution_report_replace_ack_after_fill(self):
+        self.adapter._send_message = Mock()
+        order = _get_new_order('12345')
+        order.status = OrdStatus.NEW
+        self.adapter.order_store.update_order_maps('12345_1', order)
+
+        self.adapter.send_replace(order)
+        for text in ('35=8|11=12345_2|14=4|17=1|31=45.6|32=4|37=123|39=1'
+                     '|55=TEST|60=20121105-23:25:25.123|150=F|151=6|',
+                     '35=8|11=12345_2|17=2|37=123|39=5|55=TEST|150=5|'):
+            self.adapter._process_execution_report(
+                fix.Message(text.replace('|', '\x01'), False))
+
+        self.assertTrue(self.handler.on_execution.called)
+        self.assertTrue(self.handler.on_replace_ack.called)
+        self.assertEqual(OrdStatus.REPLACED, order.status)
+        self.assertEqual({}, self.adapter.order_store.outstanding_requests)
+        self.assertFalse(self.adapter.state_machine.illegal_transitions)
+
+    def test_process_execution_report_replace_ack_after_new_ack(self):
+        self.adapter._send_message = Mock()
+        order = _get_new_order('12345')
+
+        self.adapter.send_new(order)
+        self.adapter.send_replace(order)
+        for text in ('35=8|11=12345_1|17=1|37=123|39=0|55=TEST|150=0|',
+                     '35=8|11=12345_2|17=2|37=123|39=5|55=TEST|150=5|'):
+            self.adapter._process_execution_report(
+                fix.Message(text.replace('|', '\x01'), False))
+
+        self.assertTrue(self.handler.on_new_ack.called)
+        self.assertTrue(self.handler.on_replace_ack.called)
+        self.assertEqual(OrdStatus.REPLACED, order.status)
+        self.assertFalse(self.adapter.state_machine.illegal_transitions)
+
+    def test_process_order_cancel_reject_after_new_ack(self):
+        self.adapter._send_message = Mock()
+        order = _get_new_order('12345')
+
+        self.adapter.send_new(order)
+        self.adapter.send_cancel(order)
+        self.adapter._process_execution_report(fix.Message(
+            '35=8|11=12345_1|17=1|37=123|39=0|55=TEST|150=0|'.replace(
+                '|', '\x01'), False))
+        self.adapter._process_order_cancel_reject(fix.Message(
+            '35=9|11=12345_2|37=123|39=0|41=12345_1|434=1|'.replace(
+                '|', '\x01'), False))
+
+        self.assertTrue(self.handler.on_new_ack.called)
+        self.assertTrue(self.handler.on_cancel_rej.called)
+        self.assertEqual(OrdStatus.CANCEL_REJECT, order.status)
+        self.assertFalse(self.adapter.state_machine.illegal_transitions)
+
+    def test_process_order_cancel_reject_after_fill(self):
+        self.adapter._send_message = Mock()
+        order = _get_test_order()
+        order.status = OrdStatus.NEW
+        self.adapter.order_store.update_order_maps('12345_1', order)
+
+        self.adapter.send_cancel(order)
+        self.adapter._process_execution_report(fix.Message(
+            '35=8|11=12345_2|14=4|17=1|31=45.6|32=4|37=123|39=1|55=TEST'
+            '|60=20121105-23:25:25.123|150=F|151=6|'.replace('|', '\x01'),
+            False))
+        self.adapter._process_order_cancel_reject(fix.Message(
+            '35=9|11=12345_2|37=123|39=1|41=12345_1|434=1|'.replace(
+                '|', '\x01'), False))
+
+        self.assertTrue(self.handler.on_cancel_rej.called)
+        self.assertEqual(OrdStatus.CANCEL_REJECT, order.status)
+        self.assertFalse(self.adapter.state_machine.illegal_transitions)
+
+        # Once answered, a second answer is stale again
+        self.adapter._process_order_cancel_reject(fix.Message(
+            '35=9|11=12345_2|37=123|39=1|41=12345_1|434=1|'.replace(
+                '|', '\x01'), False))
+        self.assertEqual(1, self.handler.on_cancel_rej.call_count)
+
+    def test_send_replace_illegal_transition(self):
+        self.adapter._send_message = Mock()
+        order = _get_test_order()
+        order.status = OrdStatus.FULLY_FILLED
+        self.adapter.order_store.update_order_maps('12345_1', order)
+
+        self.adapter.send_replace(order)
+
+        self.assertFalse(self.adapter._send_message.called)
+        self.assertEqual(OrdStatus.FULLY_FILLED, order.status)
+
+    def test_send_mass_cancel(self):
+        self.adapter._send_message = Mock()
+        orders = _store_open_orders(self.adapter.order_store)
+
+        cancelled = self.adapter.send_mass_cancel(symbol='TEST')
+
+        self.assertEqual(['1', '2'], sorted(o.order_id for o in cancelled))
+        self.assertEqual(1, self.adapter._send_message.call_count)
+        message = self.adapter._send_message.call_args[0][0]
+        self.assertEqual(
+            fix.MsgType_OrderMassCancelRequest,
+            message.getHeader().getField(fix.MsgType().getField()))
+        self.assertEqual('1', message.getField(fix.MassCancelRequestType()
+                                               .getField()))
+        self.assertEqual('TEST', message.getField(fix.Symbol().getField()))
+        self.assertTrue(re.match(
+            r'^\d{8}-\d\d:\d\d:\d\d\.\d{3}$',
+            message.getField(fix.TransactTime().getField())))
+        self.assertEqual(OrdStatus.PENDING_CANCEL, orders['1'].status)
+        self.assertEqual(OrdStatus.NEW, orders['3'].status)
+
+    def test_send_mass_cancel_rejected(self):
+        self.adapter._send_message = Mock()
+        orders = _store_open_orders(self.adapter.order_store)
+        self.adapter.send_mass_cancel()
+
+        message = self.adapter._send_message.call_args[0][0]
+        cl_ord_id = message.getField(fix.ClOrdID().getField())
+        report = fix.Message(
+            '35=r|11={}|37=M1|530=7|531=0|532=99|'.format(cl_ord_id)
+            .replace('|', '\x01'), False)
+        self.adapter.fromApp(report, None)
+
+        self.assertEqual(3, self.handler.on_cancel_rej.call_count)
+        self.assertEqual(OrdStatus.CANCEL_REJECT, orders['1'].status)
+
+    def test_send_mass_cancel_expired_on_logout(self):
+        self.adapter._send_message = Mock()
+        orders = _store_open_orders(self.adapter.order_store)
+        self.adapter.send_mass_cancel()
+
+        self.adapter.onLogout(None)
+
+        self.assertEqual({}, self.adapter.mass_cancels)
+        self.assertEqual(3, self.handler.on_cancel_rej.call_count)
+        self.assertEqual(OrdStatus.CANCEL_REJECT, orders['1'].status)
+
+        # The orders can then be cancelled again
+        self.adapter.send_mass_cancel()
+        self.assertEqual(OrdStatus.PENDING_CANCEL, orders['1'].status)
+
+    def test_send_mass_cancel_expired_after_timeout(self):
+        self.adapter._send_message = Mock()
+        self.adapter.mass_cancel_timeout = 0.05
+        orders = _store_open_orders(self.adapter.order_store)
+        self.adapter.send_mass_cancel(symbol='TEST')
+
+        deadline = time.time() + 5
+        while self.adapter.mass_cancels and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual({}, self.adapter.mass_cancels)
+        self.assertEqual(2, self.handler.on_cancel_rej.call_count)
+        self.assertEqual(OrdStatus.CANCEL_REJECT, orders['1'].status)
+        self.assertEqual(OrdStatus.NEW, orders['3'].status)
+
+    def test_send_mass_cancel_again_after_timeout(self):
+        self.adapter._send_message = Mock()
+        orders = _store_open_orders(self.adapter.order_store)
+        self.adapter.send_mass_cancel()
+        first = list(self.adapter.mass_cancels)
+
+        # Age the first mass cancel past the timeout
+        sent_at, first_orders = self.adapter.mass_cancels[first[0]]
+        self.adapter.mass_cancels[first[0]] = (
+            sent_at - self.adapter.mass_cancel_timeout - 1, first_orders)
+        cancelled = self.adapter.send_mass_cancel()
+
+        self.assertEqual(['1', '2', '3'],
+                         sorted(o.order_id for o in cancelled))
+        self.assertNotIn(first[0], self.adapter.mass_cancels)
+        _, tracked = list(self.adapter.mass_cancels.values())[0]
+        self.assertEqual(3, len(tracked))
+        self.assertEqual(OrdStatus.PENDING_CANCEL, orders['1'].status)
+
+    def test_cancel_report_with_mass_cancel_cl_ord_id(self):
+        self.adapter._send_message = Mock()
+        orders = _store_open_orders(self.adapter.order_store)
+        self.adapter.order_store.store_market_order_id('X', '1')
+        self.adapter.send_mass_cancel()
+
+        message = self.adapter._send_message.call_args[0][0]
+        cl_ord_id = message.getField(fix.ClOrdID().getField())
+        self.adapter.fromApp(fix.Message(
+            '35=8|11={}|17=1|37=X|39=4|55=TEST|150=4|'.format(cl_ord_id)
+            .replace('|', '\x01'), False), None)
+
+        self.handler.on_cancel_ack.assert_called_once_with(orders['1'])
+        self.assertEqual(OrdStatus.CANCELED, orders['1'].status)
+
+    def test_send_mass_cancel_unsupported(self):
+        with patch('fix_gateway.fix_market_gateway.OrderHandler') as handler:
+            adapter = FixMarketAdapter(handler, mass_cancel_supported=False)
+        adapter._send_message = Mock()
+        orders = _store_open_orders(adapter.order_store)
+
+        adapter.send_mass_cancel(side=Side.BUY)
+        deadline = time.time() + 5
+        while adapter._send_message.call_count < 2 and \
+                time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(2, adapter._send_message.call_count)
+        for message in adapter._send_message.call_args_list:
+            self.assertEqual(
+                fix.MsgType_OrderCancelRequest,
+                message[0][0].getHeader().getField(fix.MsgType().getField()))
+        self.assertEqual(OrdStatus.PENDING_CANCEL, orders['1'].status)
+        self.assertEqual(OrdStatus.PENDING_CANCEL, orders['3'].status)
+        self.assertEqual(OrdStatus.NEW, orders['2'].status)
+
+    def test_from_app_metrics(self):
+        self.adapter.order_store.update_order_maps('12345_1',
+                                                   _get_test_order())
+
+        self.adapter.fromApp(fix.Message(
+            '35=8|11=12345_1|17=54321|37=123|55=TEST|150=0|'.replace('|',
+                                                                   '\x01'),
+            False), None)
+        self.adapter.fromApp(fix.Message(
+            '35=B|148=Headline|'.replace('|', '\x01'), False), None)
+
+        counters, gauges, histograms = self.adapter.metrics.snapshot()
+        self.assertEqual(1, counters[('fix_messages_received_total',
+                                      (('msg_type', '8'),))])
+        self.assertEqual(1, counters[('fix_unsupported_messages_total',
+                                      (('msg_type', 'B'),))])
+        self.assertEqual(1, histograms[('fix_exec_type_handler_seconds',
+                                        (('exec_type', '0'),))].count)
+        self.assertEqual(1, gauges[('fix_open_orders', ())])
+
+    def test_from_app_store_exception_metrics(self):
+        with self.assertRaises(StoreException):
+            self.adapter.fromApp(fix.Message(
+                '35=8|11=Unknown_1|37=123|55=TEST|150=0|'.replace('|',
+                                                                '\x01'),
+                False), None)
+
+        counters, _, _ = self.adapter.metrics.snapshot()
+        self.assertEqual(1, counters[('fix_store_exceptions_total',
+                                      (('msg_type', '8'),))])
+
+    def test_register_exec_type_handler(self):
+        self.adapter.order_store.update_order_maps('12345_1',
+                                                   _get_test_order())
+        custom_handler = Mock()
+        self.adapter.register_exec_type_handler(fix.ExecType_NEW,
+                                                custom_handler)
+
+        message = fix.Message(
+            '35=8|11=12345_1|17=54321|37=123|55=TEST|150=0|'.replace('|',
+                                                                   '\x01'),
+            False)
+        self.adapter._process_execution_report(message)
+
+        self.assertTrue(custom_handler.called)
+        self.assertEqual('12345', custom_handler.call_args[0][0].order_id)
+        self.assertFalse(self.handler.on_new_ack.called)
+
+    def _fill_test_order(self):
+        order = _get_test_order()
+        order.qty = 10
+        self.adapter.order_store.update_order_maps('12345_1', order)
+
+        message = fix.Message(
+            '35=8|6=0|11=12345_1|14=5|17=123|31=45.6|32=5|37=Order1|38=10'
+            '|39=1|54=1|55=TEST|60=20121105-23:25:25|150=F|151=5'
+            '|'.replace('|', '\x01'), False)
+        self.adapter._process_execution_report(message)
+
     def test_process_order_cancel_reject_cancel_replace(self):
         self.adapter.order_store.update_order_maps('12345_2',
                                                    _get_test_order())
@@ -307,11 +1068,154 @@ class TestFixOrderStore(unittest.TestCase):
             self.store.find_order('Unknown', None)
 
 
+    def test_find_open_orders(self):
+        _store_open_orders(self.store)
+
+        self.assertEqual(['1', '2', '3'], sorted(
+            o.order_id for o in self.store.find_open_orders()))
+        self.assertEqual(['1', '2'], sorted(
+            o.order_id for o in self.store.find_open_orders(symbol='TEST')))
+        self.assertEqual(['1'], sorted(
+            o.order_id for o in self.store.find_open_orders(symbol='TEST',
+                                                            side=Side.BUY)))
+        self.assertEqual([], self.store.find_open_orders(symbol='UNKNOWN'))
+
+    def test_set_status_updates_indexes(self):
+        orders = _store_open_orders(self.store)
+
+        self.store.set_status(orders['1'], OrdStatus.CANCELED)
+
+        self.assertEqual(['2'], sorted(
+            o.order_id for o in self.store.find_open_orders(symbol='TEST')))
+        self.assertEqual([orders['1']],
+                         self.store.find_orders_by_status(OrdStatus.CANCELED))
+        self.assertEqual(['2', '3'], sorted(
+            o.order_id for o in self.store.open_orders()))
+
+    def test_store_order_reindexes(self):
+        _store_open_orders(self.store)
+
+        order = _get_test_order()
+        order.order_id = '1'
+        order.symbol = 'OTHER'
+        order.side = Side.BUY
+        order.status = OrdStatus.NEW
+        self.store.store_order(order)
+
+        self.assertEqual(['2'], sorted(
+            o.order_id for o in self.store.find_open_orders(symbol='TEST')))
+        self.assertEqual(['1', '3'], sorted(
+            o.order_id for o in self.store.find_open_orders(symbol='OTHER')))
+
+
+class TestFixMarketGateway(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _create_gateway(self, **kwargs):
+        with patch.object(FixMarketGateway, '_create_fix_socket'):
+            return FixMarketGateway(None, **kwargs)
+
+    def test_metrics_not_served_by_default(self):
+        gateway = self._create_gateway()
+
+        self.assertIsNone(gateway.metrics_server)
+        self.assertIsNone(gateway.metrics_snapshot_writer)
+
+    def test_metrics_served_while_running(self):
+        path = os.path.join(self.directory, 'metrics.prom')
+        gateway = self._create_gateway(metrics_port=0,
+                                       metrics_snapshot_path=path,
+                                       metrics_snapshot_interval=0.01)
+        gateway.start()
+        try:
+            response = urlopen('http://127.0.0.1:{}/metrics'.format(
+                gateway.metrics_server.port))
+            self.assertIn('fix_logged_on 0', response.read().decode('utf-8'))
+
+            deadline = time.time() + 5
+            while not os.path.exists(path) and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(os.path.exists(path))
+        finally:
+            gateway.stop()
+
+        gateway.initiator.start.assert_called_once_with()
+        gateway.initiator.stop.assert_called_once_with()
+
+    def test_stop_stops_reference_data_polling(self):
+        path = os.path.join(self.directory, 'instruments.csv')
+        with open(path, 'w') as reference_file:
+            reference_file.write('symbol,currency,tick_size,lot_size\n'
+                                 'TEST,GBP,0.001,10\n')
+        gateway = self._create_gateway(reference_data_file=path)
+        thread = gateway.reference_data.thread
+        gateway.start()
+
+        gateway.stop()
+
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(gateway.reference_data.thread)
+
+    def test_profiling_commands_registered_on_start(self):
+        gateway = self._create_gateway(metrics_port=0)
+        gateway.profiling.start_sampling = Mock(return_value=True)
+        gateway.start()
+        try:
+            response = urlopen('http://127.0.0.1:{}/profile/cpu?seconds=5'
+                               .format(gateway.metrics_server.port))
+            self.assertEqual('True\n', response.read().decode('utf-8'))
+        finally:
+            gateway.stop()
+
+        gateway.profiling.start_sampling.assert_called_once_with(5.0)
+
+def _store_open_orders(store):
+    orders = {}
+    for order_id, symbol, side in (('1', 'TEST', Side.BUY),
+                                   ('2', 'TEST', Side.SELL),
+                                   ('3', 'OTHER', Side.BUY)):
+        order = Order()
+        order.order_id = order_id
+        order.symbol = symbol
+        order.side = side
+        order.qty = 10
+        order.status = OrdStatus.NEW
+        store.update_order_maps(order_id + '_1', order)
+        orders[order_id] = order
+
+    closed = Order()
+    closed.order_id = '4'
+    closed.symbol = 'TEST'
+    closed.side = Side.BUY
+    closed.status = OrdStatus.FULLY_FILLED
+    store.update_order_maps('4_1', closed)
+
+    return orders
+
+
 def _get_test_order():
     order = Order()
     order.order_id = '12345'
     return order
 
 
+def _get_new_order(order_id):
+    order = Order()
+    order.order_id = order_id
+    order.symbol = "TEST"
+    order.side = Side.BUY
+    order.qty = 10
+    order.type = OrderType.LIMIT
+    order.price = 123.456
+    order.currency = "GBP"
+    order.time_in_force = TimeInForce.DAY
+    return order
+
+
 if __name__ == '__main__':
     unittest.main()
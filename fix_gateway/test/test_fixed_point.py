@@ -0,0 +1,59 @@
+import unittest
+
+from fix_gateway.fixed_point import ExcessPrecisionError, FixedPointCodec, \
+    decode_decimal, encode_decimal
+
+
+class TestFixedPoint(unittest.TestCase):
+
+    def test_encode_decimal(self):
+        self.assertEqual('123.4560', encode_decimal(1234560, 4))
+        self.assertEqual('0.0005', encode_decimal(5, 4))
+        self.assertEqual('-0.05', encode_decimal(-5, 2))
+        self.assertEqual('100', encode_decimal(100, 0))
+
+    def test_decode_decimal(self):
+        self.assertEqual(1234560, decode_decimal('123.456', 4))
+        self.assertEqual(5, decode_decimal('.0005', 4))
+        self.assertEqual(-5, decode_decimal('-0.05', 2))
+        self.assertEqual(1000000, decode_decimal('100', 4))
+        self.assertEqual(100, decode_decimal('100.000', 0))
+
+    def test_decode_decimal_too_precise(self):
+        with self.assertRaises(ExcessPrecisionError):
+            decode_decimal('1.23456', 4)
+
+    def test_decode_decimal_not_a_number(self):
+        for text in ('abc', '1.2x', '1.2345x', 'x.23456'):
+            with self.assertRaises(ValueError) as context:
+                decode_decimal(text, 4)
+            self.assertNotIsInstance(context.exception, ExcessPrecisionError)
+
+    def test_decode_decimal_round_excess(self):
+        self.assertEqual(12346, decode_decimal('1.23456', 4,
+                                               round_excess=True))
+        self.assertEqual(12345, decode_decimal('1.23454', 4,
+                                               round_excess=True))
+        self.assertEqual(-12346, decode_decimal('-1.23456', 4,
+                                                round_excess=True))
+        self.assertEqual(-1, decode_decimal('-0.00005', 4,
+                                            round_excess=True))
+        self.assertEqual(1, decode_decimal('.5', 0, round_excess=True))
+
+    def test_round_trip(self):
+        for value in (0, 1, -1, 99999, 123456789, -10000):
+            self.assertEqual(value, decode_decimal(encode_decimal(value, 4),
+                                                   4))
+
+    def test_scales(self):
+        codec = FixedPointCodec(default_price_scale=4, default_qty_scale=0)
+        codec.set_scales('EURUSD', 5, 2)
+
+        self.assertEqual(5, codec.price_scale('EURUSD'))
+        self.assertEqual(2, codec.qty_scale('EURUSD'))
+        self.assertEqual(4, codec.price_scale('TEST'))
+        self.assertEqual(0, codec.qty_scale('TEST'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import gc
+import time
+import unittest
+
+import quickfix as fix
+
+from fix_gateway.low_latency import FieldPool, GcScheduler, MessagePool, \
+    NullFieldPool
+from fix_gateway.metrics import MetricsRegistry
+
+
+class TestFieldPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = FieldPool()
+        self.message = fix.Message(
+            '35=8|11=12345_1|14=5|31=45.6|150=F|912=Y|911=3|'.replace(
+                '|', '\x01'), False)
+
+    def test_get_matches_field_objects(self):
+        for field_type in (fix.ClOrdID, fix.CumQty, fix.LastPx, fix.ExecType,
+                           fix.LastRptRequested, fix.TotNumReports):
+            self.assertEqual(
+                NullFieldPool().get(self.message, field_type),
+                self.pool.get(self.message, field_type))
+
+    def test_get_optional(self):
+        self.assertEqual(None, self.pool.get_optional(self.message,
+                                                      fix.OrderID))
+        self.assertEqual(5.0, self.pool.get_optional(self.message,
+                                                     fix.CumQty))
+
+    def test_set_reuses_field(self):
+        first = fix.Message()
+        second = fix.Message()
+
+        self.pool.set(first, fix.Symbol, 'ONE')
+        self.pool.set(second, fix.Symbol, 'TWO')
+        self.pool.set_string(second, fix.Price, '1.2500')
+
+        self.assertEqual('ONE', first.getField(55))
+        self.assertEqual('TWO', second.getField(55))
+        self.assertEqual('1.2500', second.getField(44))
+        self.assertEqual(2, len(self.pool.local.fields))
+
+
+class TestMessagePool(unittest.TestCase):
+
+    def test_acquire_reuses_released_message(self):
+        pool = MessagePool()
+
+        message = pool.acquire(fix.MsgType_NewOrderSingle)
+        message.setField(fix.Symbol('TEST'))
+        pool.release(message)
+        reused = pool.acquire(fix.MsgType_NewOrderSingle)
+
+        self.assertIs(message, reused)
+        self.assertFalse(reused.isSetField(55))
+        self.assertEqual(fix.MsgType_NewOrderSingle,
+                         reused.getHeader().getField(35))
+        self.assertIsNot(reused, pool.acquire(fix.MsgType_NewOrderSingle))
+
+
+class TestGcScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        self.last_activity = time.time()
+        self.scheduler = GcScheduler(lambda: self.last_activity,
+                                     quiet_period=0.01, max_delay=10,
+                                     metrics=self.metrics)
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def test_start_disables_and_stop_restores_gc(self):
+        self.scheduler.start()
+        self.assertFalse(gc.isenabled())
+
+        self.scheduler.stop()
+        self.assertTrue(gc.isenabled())
+
+    def test_collects_when_quiet(self):
+        self.scheduler.last_activity = lambda: 0
+        self.scheduler.start()
+
+        # Reference cycles, which only the collector can free
+        for _ in range(gc.get_threshold()[0] * 2):
+            cycle = []
+            cycle.append(cycle)
+
+        deadline = time.time() + 5
+        while time.time() < deadline and not self._collections():
+            time.sleep(0.01)
+
+        self.assertTrue(self._collections())
+
+    def _collections(self):
+        _, _, histograms = self.metrics.snapshot()
+        return sum(histogram.count for histogram in histograms.values())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,256 @@
+import os
+import threading
+import unittest
+
+from mock import Mock
+from mock import patch
+
+from fix_gateway.fix_market_gateway import *
+from fix_gateway.fixed_point import FixedPointCodec
+from fix_gateway.market_data import FIXED_POINT_TYPECODE, \
+    MarketDataHandler, OrderBook
+
+DATA_DICTIONARY = fix.DataDictionary(os.path.join(
+    os.path.dirname(__file__), '..', '..', 'spec', 'FIX44.xml'))
+
+
+class TestOrderBook(unittest.TestCase):
+
+    def setUp(self):
+        self.book = OrderBook('TEST', depth=3)
+
+    def test_levels_sorted_best_first(self):
+        for price in (10.0, 12.0, 11.0):
+            self.book.apply('0', '0', price, 100)
+            self.book.apply('0', '1', price + 10, 200)
+        self.book._publish_top()
+
+        self.assertEqual([(12.0, 100), (11.0, 100), (10.0, 100)],
+                         self.book.bids.levels())
+        self.assertEqual([(20.0, 200), (21.0, 200), (22.0, 200)],
+                         self.book.offers.levels())
+        self.assertEqual((12.0, 100), self.book.best_bid)
+        self.assertEqual((20.0, 200), self.book.best_offer)
+
+    def test_levels_beyond_depth_dropped(self):
+        for price in (10.0, 11.0, 12.0, 13.0, 9.0):
+            self.book.apply('0', '0', price, 100)
+
+        self.assertEqual([13.0, 12.0, 11.0],
+                         [price for price, _ in self.book.bids.levels()])
+
+    def test_change_and_delete(self):
+        for price in (10.0, 11.0, 12.0):
+            self.book.apply('0', '0', price, 100)
+
+        self.book.apply('1', '0', 11.0, 50)
+        self.book.apply('2', '0', 12.0, 0)
+        self.book._publish_top()
+
+        self.assertEqual([(11.0, 50), (10.0, 100)], self.book.bids.levels())
+        self.assertEqual((11.0, 50, None, None), self.book.top)
+
+    def test_other_entry_types_ignored(self):
+        self.book.apply('0', '0', 99.0, 100)
+        self.book.apply('0', '4', 95.0, 0)
+        self.book.apply('0', 'B', 5000, 0)
+        self.book._publish_top()
+
+        self.assertEqual((99.0, 100, None, None), self.book.top)
+        self.assertEqual(0, self.book.offers.count)
+
+    def test_fixed_point_change_and_delete(self):
+        book = OrderBook('TEST', depth=3, typecode=FIXED_POINT_TYPECODE)
+        for price in (100000, 110000, 120000):
+            book.apply('0', '1', price, 100)
+
+        book.apply('1', '1', 110000, 50)
+        book.apply('2', '1', 100000, 0)
+        book.apply('2', '1', 0, 0)
+
+        self.assertEqual([(110000, 50), (120000, 100)], book.offers.levels())
+
+    def test_trade(self):
+        self.book.apply('0', '2', 10.5, 300)
+
+        self.assertEqual(10.5, self.book.last_price)
+        self.assertEqual(300, self.book.last_size)
+        self.assertEqual(0, self.book.bids.count)
+
+
+class TestMarketDataManager(unittest.TestCase):
+
+    def setUp(self):
+        with patch('fix_gateway.fix_market_gateway.OrderHandler') as \
+                self.order_handler:
+            self.adapter = FixMarketAdapter(self.order_handler)
+        self.adapter._send_message = Mock()
+        self.market_data = self.adapter.market_data
+        self.market_data.conflate = False
+        self.handler = Mock(spec=MarketDataHandler)
+
+    def tearDown(self):
+        self.market_data.stop()
+
+    def test_subscribe(self):
+        md_req_id = self.market_data.subscribe(['TEST', 'OTHER'],
+                                               self.handler, depth=5)
+
+        message = self.adapter._send_message.call_args[0][0]
+        self.assertEqual(
+            fix.MsgType_MarketDataRequest,
+            message.getHeader().getField(fix.MsgType().getField()))
+        self.assertEqual(md_req_id, message.getField(262))
+        self.assertEqual('1', message.getField(263))
+        self.assertEqual('5', message.getField(264))
+        self.assertEqual(2, message.groupCount(146))
+        self.assertEqual(3, message.groupCount(267))
+        self.assertEqual(5, self.market_data.books['TEST'].bids.depth)
+
+    def test_unsubscribe(self):
+        md_req_id = self.market_data.subscribe(['TEST'], self.handler)
+        self.market_data.unsubscribe(md_req_id)
+
+        message = self.adapter._send_message.call_args[0][0]
+        self.assertEqual('2', message.getField(263))
+        self.assertEqual([], self.market_data.handlers['TEST'])
+
+    def test_resubscribe_on_logon(self):
+        md_req_id = self.market_data.subscribe(['TEST'], self.handler)
+        self.adapter._send_message.reset_mock()
+        self.adapter.reconcile_on_logon = False
+
+        self.adapter.onLogon(None)
+
+        message = self.adapter._send_message.call_args[0][0]
+        self.assertEqual(md_req_id, message.getField(262))
+
+    def test_snapshot(self):
+        self.market_data.subscribe(['TEST'], self.handler)
+
+        self._receive(
+            '35=W|262=MD_1|55=TEST|268=3|269=0|270=10.5|271=100'
+            '|269=0|270=10.4|271=200|269=1|270=10.6|271=300|')
+
+        book = self.market_data.books['TEST']
+        self.assertEqual((10.5, 100, 10.6, 300), book.top)
+        self.assertEqual(2, book.bids.count)
+        self.handler.on_book_update.assert_called_once_with(book)
+
+    def test_incremental(self):
+        self.market_data.subscribe(['TEST'], self.handler)
+        self._receive(
+            '35=W|262=MD_1|55=TEST|268=2|269=0|270=10.5|271=100'
+            '|269=1|270=10.6|271=300|')
+
+        self._receive(
+            '35=X|262=MD_1|268=3|279=0|269=0|55=TEST|270=10.55|271=50'
+            '|279=2|269=1|270=10.6|279=0|269=2|270=10.6|271=300|')
+
+        book = self.market_data.books['TEST']
+        self.assertEqual((10.55, 50, None, None), book.top)
+        self.assertEqual(10.6, book.last_price)
+        self.assertEqual(2, self.handler.on_book_update.call_count)
+
+    def test_incremental_fixed_point(self):
+        self.adapter.fixed_point = FixedPointCodec(default_price_scale=4)
+        self.market_data.subscribe(['TEST'], self.handler)
+
+        self._receive(
+            '35=X|262=MD_1|268=1|279=0|269=0|55=TEST|270=10.55|271=50|')
+
+        self.assertEqual((105500, 50, None, None),
+                         self.market_data.books['TEST'].top)
+
+    def test_incremental_decode_error_marks_book_stale(self):
+        self.adapter.fixed_point = FixedPointCodec(default_price_scale=2)
+        self.market_data.subscribe(['TEST'], self.handler)
+        self._receive(
+            '35=W|262=MD_1|55=TEST|268=1|269=0|270=10.5|271=100|')
+
+        self._receive(
+            '35=X|262=MD_1|268=1|279=0|269=0|55=TEST|270=10.555|271=50|')
+        self._receive(
+            '35=X|262=MD_1|268=1|279=0|269=0|55=TEST|270=10.6|271=50|')
+
+        book = self.market_data.books['TEST']
+        self.assertTrue(book.stale)
+        self.assertEqual((None, None, None, None), book.top)
+        counters, _, _ = self.adapter.metrics.snapshot()
+        self.assertEqual(1, counters[('fix_md_decode_errors_total', ())])
+        self.assertNotIn(('fix_invalid_messages_total', (('msg_type', 'X'),)),
+                         counters)
+
+        self._receive(
+            '35=W|262=MD_1|55=TEST|268=1|269=0|270=10.4|271=100|')
+
+        self.assertFalse(book.stale)
+        self.assertEqual((1040, 100, None, None), book.top)
+
+    def test_resubscribe_copies_subscriptions(self):
+        self.market_data.subscribe(['TEST'], self.handler)
+        other = Mock(spec=MarketDataHandler)
+
+        def send_message(message):
+            # A subscription made on another thread while resubscribing
+            if message.getField(262) == 'MD_1':
+                self.market_data.subscribe(['OTHER'], other)
+
+        self.adapter._send_message.side_effect = send_message
+        self.market_data.resubscribe()
+
+        self.assertEqual(['MD_1', 'MD_2'],
+                         sorted(self.market_data.subscriptions))
+
+    def test_incremental_unsubscribed_symbol_ignored(self):
+        self._receive(
+            '35=X|262=MD_1|268=1|279=0|269=0|55=TEST|270=10.55|271=50|')
+
+        self.assertNotIn('TEST', self.market_data.books)
+
+    def test_request_reject(self):
+        md_req_id = self.market_data.subscribe(['TEST'], self.handler)
+
+        self._receive('35=Y|262={}|281=0|58=Unknown symbol|'.format(
+            md_req_id))
+
+        self.handler.on_market_data_reject.assert_called_once_with(
+            md_req_id, '0', 'Unknown symbol')
+        self.assertNotIn(md_req_id, self.market_data.subscriptions)
+
+    def test_conflated_callbacks(self):
+        self.market_data.conflate = True
+        entered = threading.Event()
+        release = threading.Event()
+        tops = []
+
+        def on_book_update(book):
+            tops.append(book.top)
+            entered.set()
+            release.wait(5)
+
+        self.handler.on_book_update.side_effect = on_book_update
+        self.market_data.subscribe(['TEST'], self.handler)
+
+        self._receive(
+            '35=X|262=MD_1|268=1|279=0|269=0|55=TEST|270=10.1|271=10|')
+        self.assertTrue(entered.wait(5))
+        for price in ('10.2', '10.3', '10.4'):
+            self._receive(
+                '35=X|262=MD_1|268=1|279=0|269=0|55=TEST|270={}|271=10|'
+                .format(price))
+        release.set()
+        self.market_data.stop()
+
+        self.assertEqual([(10.1, 10, None, None), (10.4, 10, None, None)],
+                         tops)
+
+    def _receive(self, body):
+        message = fix.Message(
+            ('8=FIX.4.4|9=0|' + body + '10=000|').replace('|', '\x01'),
+            DATA_DICTIONARY, False)
+        self.adapter.fromApp(message, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
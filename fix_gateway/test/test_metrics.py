@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mock import Mock
+
+try:
+    from urllib.error import HTTPError
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import HTTPError, urlopen
+
+from fix_gateway.metrics import *
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry(latency_buckets=(0.001, 0.01))
+
+    def test_counters_merged_across_threads(self):
+        def count():
+            for _ in range(100):
+                self.registry.increment('messages', (('msg_type', '8'),))
+
+        threads = [threading.Thread(target=count) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.registry.increment('messages', (('msg_type', '9'),), 2)
+
+        counters, _, _ = self.registry.snapshot()
+        self.assertEqual(400, counters[('messages', (('msg_type', '8'),))])
+        self.assertEqual(2, counters[('messages', (('msg_type', '9'),))])
+
+    def test_gauges(self):
+        self.registry.set_gauge('logged_on', 1)
+        self.registry.register_gauge('open_orders', lambda: 42)
+
+        _, gauges, _ = self.registry.snapshot()
+        self.assertEqual(1, gauges[('logged_on', ())])
+        self.assertEqual(42, gauges[('open_orders', ())])
+
+    def test_histogram(self):
+        for seconds in (0.0005, 0.005, 0.005, 1.0):
+            self.registry.observe('latency', seconds)
+
+        _, _, histograms = self.registry.snapshot()
+        histogram = histograms[('latency', ())]
+        self.assertEqual([1, 2, 1], histogram.buckets)
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(1.0105, histogram.sum)
+
+    def test_to_prometheus(self):
+        self.registry.increment('messages_total', (('msg_type', '8'),))
+        self.registry.set_gauge('logged_on', 1)
+        self.registry.observe('latency_seconds', 0.005)
+
+        self.assertEqual(
+            '# TYPE messages_total counter\n'
+            'messages_total{msg_type="8"} 1\n'
+            '# TYPE logged_on gauge\n'
+            'logged_on 1\n'
+            '# TYPE latency_seconds histogram\n'
+            'latency_seconds_bucket{le="0.001"} 0\n'
+            'latency_seconds_bucket{le="0.01"} 1\n'
+            'latency_seconds_bucket{le="+Inf"} 1\n'
+            'latency_seconds_sum 0.005\n'
+            'latency_seconds_count 1\n',
+            self.registry.to_prometheus())
+
+    def test_metrics_server(self):
+        self.registry.increment('messages_total')
+        server = MetricsServer(self.registry, port=0)
+        server.start()
+        try:
+            response = urlopen(
+                'http://127.0.0.1:{}/metrics'.format(server.port))
+            self.assertEqual(self.registry.to_prometheus(),
+                             response.read().decode('utf-8'))
+        finally:
+            server.stop()
+
+    def test_metrics_server_admin_command(self):
+        command = Mock(return_value=True)
+        server = MetricsServer(self.registry, port=0,
+                               admin_commands={'/command': command})
+        server.start()
+        try:
+            response = urlopen(
+                'http://127.0.0.1:{}/command?seconds=5'.format(server.port))
+            self.assertEqual('True\n', response.read().decode('utf-8'))
+            command.assert_called_once_with(seconds='5')
+        finally:
+            server.stop()
+
+    def test_metrics_server_admin_command_bad_parameter(self):
+        server = MetricsServer(self.registry, port=0, admin_commands={
+            '/command': lambda seconds=10: float(seconds)})
+        server.start()
+        try:
+            for query in ('unknown=1', 'seconds=abc'):
+                with self.assertRaises(HTTPError) as context:
+                    urlopen('http://127.0.0.1:{}/command?{}'.format(
+                        server.port, query))
+                self.assertEqual(400, context.exception.code)
+        finally:
+            server.stop()
+
+    def test_snapshot_writer(self):
+        self.registry.increment('messages_total')
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'metrics.prom')
+            MetricsSnapshotWriter(self.registry, path).write()
+
+            with open(path) as snapshot:
+                self.assertEqual(self.registry.to_prometheus(),
+                                 snapshot.read())
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
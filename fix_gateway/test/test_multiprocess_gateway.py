@@ -0,0 +1,134 @@
+import threading
+import unittest
+
+from mock import Mock
+
+from fix_gateway.simple_order import Order
+from fix_gateway.fix_market_gateway import OrdStatus, RequestType
+from fix_gateway.multiprocess_gateway import *
+
+
+class TestGatewayEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = GatewayEngine(None, [StrategyWorker(),
+                                           StrategyWorker()])
+        self.engine.process_request = Mock()
+
+    def test_route_new_records_owner(self):
+        order = _get_test_order()
+        self.engine._route_request(1, RequestType.NEW, order)
+
+        self.assertEqual(1, self.engine.order_owners['12345'])
+        self.engine.process_request.assert_called_with(RequestType.NEW,
+                                                       order)
+
+    def test_route_duplicate_new(self):
+        self.engine._route_request(0, RequestType.NEW, _get_test_order())
+        self.engine._route_request(1, RequestType.NEW, _get_test_order())
+
+        self.assertEqual(0, self.engine.order_owners['12345'])
+        self.assertEqual(1, self.engine.process_request.call_count)
+
+    def test_route_cancel_from_other_worker(self):
+        self.engine._route_request(0, RequestType.NEW, _get_test_order())
+        self.engine._route_request(1, RequestType.CANCEL, _get_test_order())
+
+        self.assertEqual(1, self.engine.process_request.call_count)
+
+    def test_route_replace_updates_stored_order(self):
+        stored_order = _get_test_order()
+        self.engine.adapter.order_store.store_order(stored_order)
+        self.engine._route_request(0, RequestType.NEW, stored_order)
+
+        order = _get_test_order()
+        order.qty = 20
+        order.price = 1.5
+        order.time_in_force = '0'
+        self.engine._route_request(0, RequestType.AMEND, order)
+
+        self.engine.process_request.assert_called_with(RequestType.AMEND,
+                                                       stored_order)
+        self.assertEqual(20, stored_order.qty)
+        self.assertEqual(1.5, stored_order.price)
+
+    def test_events_go_to_owner(self):
+        order = _get_test_order()
+        self.engine._route_request(1, RequestType.NEW, order)
+        self.engine.on_new_ack(order)
+        self.engine.publish_pending()
+
+        self.assertTrue(self.engine.event_queues[0].empty())
+        callback, args = self.engine.event_queues[1].get_nowait()
+        self.assertEqual('on_new_ack', callback)
+        self.assertEqual('12345', args[0].order_id)
+
+    def test_events_capture_order_when_raised(self):
+        order = _get_test_order()
+        self.engine._route_request(0, RequestType.NEW, order)
+        order.status = OrdStatus.NEW
+        self.engine.on_new_ack(order)
+        order.status = OrdStatus.FULLY_FILLED
+        self.engine.publish_pending()
+
+        _, args = self.engine.event_queues[0].get_nowait()
+        self.assertEqual(OrdStatus.NEW, args[0].status)
+
+    def test_events_for_unowned_order_dropped(self):
+        self.engine.on_new_ack(_get_test_order())
+        self.engine.publish_pending()
+
+        self.assertTrue(self.engine.event_queues[0].empty())
+        self.assertTrue(self.engine.event_queues[1].empty())
+
+    def test_events_dropped_when_queue_full(self):
+        engine = GatewayEngine(None, [StrategyWorker()], queue_slots=2)
+        order = _get_test_order()
+        engine.order_owners[order.order_id] = 0
+        for _ in range(3):
+            engine.on_new_ack(order)
+        engine.publish_pending()
+
+        self.assertEqual(2, engine.event_queues[0].qsize())
+        self.assertEqual(1, engine.dropped_events[0])
+
+    def test_events_from_several_threads_published_in_full(self):
+        engine = GatewayEngine(None, [StrategyWorker()])
+        engine.publish_thread = threading.Thread(
+            target=engine._publish_events)
+        engine.publish_thread.start()
+        orders = []
+        for i in range(4):
+            order = _get_test_order()
+            order.order_id = str(i)
+            engine.order_owners[order.order_id] = 0
+            orders.append(order)
+
+        def publish(order):
+            for _ in range(100):
+                engine.on_execution(order, None)
+
+        threads = [threading.Thread(target=publish, args=(order,))
+                   for order in orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        engine.stop()
+
+        events = []
+        while not engine.event_queues[0].empty():
+            events.append(engine.event_queues[0].get_nowait())
+        self.assertEqual('__stop__', events[-1])
+        self.assertEqual(400, len(events) - 1)
+        self.assertEqual(0, engine.dropped_events[0])
+
+
+def _get_test_order():
+    order = Order()
+    order.order_id = '12345'
+    return order
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+from fix_gateway.order_state import OrderStateMachine, Transition
+
+
+TRANSITIONS = {
+    'pending': ['live', 'rejected'],
+    'live': ['pending_cancel', 'done'],
+    'pending_cancel': ['live', 'done'],
+    'rejected': [],
+    'done': [],
+}
+
+
+class TestOrderStateMachine(unittest.TestCase):
+
+    def setUp(self):
+        self.state_machine = OrderStateMachine(
+            TRANSITIONS, pending_statuses=('pending', 'pending_cancel'),
+            max_deferred_per_order=2)
+
+    def test_check_legal(self):
+        self.assertEqual(Transition.LEGAL,
+                         self.state_machine.check('pending', 'live'))
+        self.assertEqual(Transition.LEGAL,
+                         self.state_machine.check('live', 'done'))
+
+    def test_check_from_unknown_status(self):
+        self.assertEqual(Transition.LEGAL,
+                         self.state_machine.check(None, 'done'))
+
+    def test_check_deferred(self):
+        self.assertEqual(Transition.DEFERRED,
+                         self.state_machine.check('pending',
+                                                  'pending_cancel'))
+
+    def test_check_stale_transition_illegal(self):
+        # Reachable through pending_cancel, but live is not pending, so a
+        # second live report is stale rather than early
+        self.assertEqual(Transition.ILLEGAL,
+                         self.state_machine.check('live', 'live'))
+
+    def test_check_illegal(self):
+        self.assertEqual(Transition.ILLEGAL,
+                         self.state_machine.check('done', 'live'))
+        self.assertEqual(Transition.ILLEGAL,
+                         self.state_machine.check('rejected', 'pending'))
+
+    def test_record_illegal(self):
+        self.state_machine.record_illegal('1', 'done', 'live')
+        self.state_machine.record_illegal('2', 'done', 'live')
+
+        self.assertEqual(
+            2, self.state_machine.illegal_transitions[('done', 'live')])
+
+    def test_defer_and_pop(self):
+        self.state_machine.defer('1', 'pending', 'pending_cancel', 'event1')
+        self.state_machine.defer('1', 'pending', 'pending_cancel', 'event2')
+
+        self.assertTrue(self.state_machine.has_deferred('1'))
+        self.assertEqual(['event1', 'event2'],
+                         self.state_machine.pop_deferred('1'))
+        self.assertFalse(self.state_machine.has_deferred('1'))
+        self.assertEqual([], self.state_machine.pop_deferred('1'))
+
+    def test_defer_overflow_drops_oldest(self):
+        for event in ('event1', 'event2', 'event3'):
+            self.state_machine.defer('1', 'pending', 'pending_cancel', event)
+
+        self.assertEqual(['event2', 'event3'],
+                         self.state_machine.pop_deferred('1'))
+        self.assertEqual(1, self.state_machine.illegal_transitions[
+            ('pending', 'pending_cancel')])
+
+    def test_discard_deferred(self):
+        self.state_machine.defer('1', 'pending', 'pending_cancel', 'event1')
+        self.state_machine.discard_deferred('1', 'done')
+
+        self.assertFalse(self.state_machine.has_deferred('1'))
+        self.assertEqual(1, self.state_machine.illegal_transitions[
+            ('done', 'pending_cancel')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from fix_gateway.outbound_queue import OutboundQueue, QueuePolicy, \
+    QueueResult
+
+
+class TestOutboundQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.queue = OutboundQueue(ttl=10, ttls={'2': 30},
+                                   policies={'1': QueuePolicy.REJECT},
+                                   max_depth=3, clock=lambda: self.now)
+
+    def test_offer_held_while_logged_out(self):
+        self.assertEqual(QueueResult.QUEUED, self.queue.offer('0', 'A'))
+        self.assertEqual(1, self.queue.depth())
+
+    def test_offer_refused_by_policy(self):
+        self.assertEqual(QueueResult.REFUSED, self.queue.offer('1', 'A'))
+        self.assertEqual(0, self.queue.depth())
+
+    def test_offer_refused_when_full(self):
+        for order in ('A', 'B', 'C'):
+            self.queue.offer('0', order)
+
+        self.assertEqual(QueueResult.REFUSED, self.queue.offer('0', 'D'))
+
+    def test_offer_sent_when_logged_on_and_empty(self):
+        self.queue.on_logon()
+
+        self.assertEqual(QueueResult.SEND, self.queue.offer('0', 'A'))
+
+    def test_offer_held_while_draining(self):
+        self.queue.offer('0', 'A')
+        self.queue.on_logon()
+
+        self.assertEqual(QueueResult.QUEUED, self.queue.offer('0', 'B'))
+        self.assertEqual('A', self.queue.take()[2])
+        self.assertEqual('B', self.queue.take()[2])
+        self.assertEqual(None, self.queue.take())
+        self.assertEqual(QueueResult.SEND, self.queue.offer('0', 'C'))
+
+    def test_take_stops_on_logout(self):
+        self.queue.offer('0', 'A')
+        self.queue.on_logon()
+        self.queue.on_logout()
+
+        self.assertEqual(None, self.queue.take())
+        self.assertEqual(1, self.queue.depth())
+
+    def test_expire_uses_ttl_per_request_type(self):
+        self.queue.offer('0', 'A')
+        self.queue.offer('2', 'B')
+        self.now += 15
+
+        self.assertEqual([(100.0, '0', 'A')], self.queue.expire())
+        self.assertEqual(1, self.queue.depth())
+        self.assertEqual(15, self.queue.oldest_age())
+
+    def test_discard(self):
+        self.queue.offer('0', 'A')
+        self.queue.offer('2', 'B')
+        self.queue.offer('2', 'A')
+
+        self.assertEqual(2, len(self.queue.discard('A')))
+        self.assertEqual('B', self.queue.entries[0][2])
+
+
+if __name__ == '__main__':
+    unittest.main()
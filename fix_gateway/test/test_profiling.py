@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from fix_gateway.profiling import ProfilingHooks, tracemalloc
+
+
+class _Target(object):
+
+    def busy(self, iterations):
+        return sum(i * i for i in range(iterations))
+
+    def allocate(self, count):
+        return [str(i) * 10 for i in range(count)]
+
+
+class TestProfilingHooks(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.target = _Target()
+        self.hooks = ProfilingHooks(self.target, self.output_dir,
+                                    methods=('busy', 'allocate'),
+                                    sample_interval=0.0005)
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_methods_not_wrapped_when_disabled(self):
+        self.assertNotIn('busy', vars(self.target))
+
+    def test_sampling(self):
+        self.assertTrue(self.hooks.start_sampling(duration=60))
+        self.assertIn('busy', vars(self.target))
+        self.assertFalse(self.hooks.start_sampling(duration=60))
+
+        thread = threading.Thread(target=self.target.busy, args=(2000000,))
+        thread.start()
+        thread.join()
+
+        path = self.hooks.stop_sampling()
+
+        self.assertNotIn('busy', vars(self.target))
+        with open(path) as profile:
+            lines = profile.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertIn('test_profiling.py:busy', stack)
+            self.assertTrue(int(count) > 0)
+
+    def test_stop_sampling_when_not_running(self):
+        self.assertEqual(None, self.hooks.stop_sampling())
+
+    @unittest.skipIf(tracemalloc is None, 'tracemalloc not available')
+    def test_allocation_tracking(self):
+        self.assertTrue(self.hooks.start_allocation_tracking(duration=60))
+        data = self.target.allocate(10000)
+
+        path = self.hooks.stop_allocation_tracking(top=5)
+
+        self.assertFalse(tracemalloc.is_tracing())
+        with open(path) as report:
+            lines = report.read().splitlines()
+        self.assertTrue(0 < len(lines) <= 5)
+        self.assertIn('test_profiling.py', lines[0])
+        self.assertEqual(10000, len(data))
+
+    def test_admin_commands(self):
+        commands = self.hooks.admin_commands()
+
+        self.assertTrue(commands['/profile/cpu'](seconds='60'))
+        self.assertTrue(os.path.exists(self.hooks.stop_sampling()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import time
+import unittest
+
+from mock import Mock
+from mock import patch
+
+from fix_gateway.simple_order import Order
+from fix_gateway.fix_market_gateway import *
+from fix_gateway.reconciliation import Discrepancy
+
+
+class TestOrderReconciler(unittest.TestCase):
+
+    def setUp(self):
+        with patch('fix_gateway.fix_market_gateway.OrderHandler') as \
+                self.handler:
+            self.adapter = FixMarketAdapter(self.handler)
+        self.adapter._send_message = Mock()
+        self.reconciler = self.adapter.reconciler
+
+        self._store_order('1', OrdStatus.NEW, 0)
+        self._store_order('2', OrdStatus.PARTIALLY_FILLED, 5)
+        self._store_order('3', OrdStatus.NEW, 0)
+        self._store_order('4', OrdStatus.CANCELED, 0)
+
+    def test_start_sends_mass_status_request(self):
+        self.reconciler.start()
+
+        message = self.adapter._send_message.call_args[0][0]
+        self.assertEqual(
+            fix.MsgType_OrderMassStatusRequest,
+            message.getHeader().getField(fix.MsgType().getField()))
+        self.assertEqual(3, len(self.reconciler.open_orders))
+        self.reconciler.finish()
+
+    def test_reconcile_mass_status(self):
+        self.reconciler.start()
+
+        self._status_report('1', OrdStatus.NEW, 0)
+        self._status_report('2', OrdStatus.PARTIALLY_FILLED, 7)
+        self._status_report('4', OrdStatus.NEW, 0)
+        self._status_report('9', OrdStatus.NEW, 0, last=True)
+
+        self.assertTrue(self.handler.on_reconciliation_complete.called)
+        report = self.handler.on_reconciliation_complete.call_args[0][0]
+
+        self.assertTrue(report.complete)
+        self.assertEqual(3, report.orders_checked)
+        self.assertEqual(4, report.reports_received)
+        self.assertEqual(
+            sorted([(Discrepancy.EXECUTED_QTY, '2'),
+                    (Discrepancy.MISSING_AT_VENUE, '3'),
+                    (Discrepancy.STATUS, '4'),
+                    (Discrepancy.UNKNOWN_ORDER, None)]),
+            sorted((d.kind, d.order_id) for d in report.discrepancies))
+
+    def test_reconcile_venue_closed_order(self):
+        self.reconciler.start()
+
+        self._status_report('1', OrdStatus.CANCELED, 0)
+        self._status_report('2', OrdStatus.PARTIALLY_FILLED, 5)
+        self._status_report('3', OrdStatus.NEW, 0, last=True)
+
+        report = self.handler.on_reconciliation_complete.call_args[0][0]
+        self.assertEqual(1, len(report.discrepancies))
+        self.assertEqual(Discrepancy.STATUS, report.discrepancies[0].kind)
+        self.assertEqual(OrdStatus.CANCELED,
+                         report.discrepancies[0].venue_value)
+
+    def test_mass_status_rejected_falls_back_to_order_status(self):
+        self.reconciler.start()
+
+        message = fix.Message(
+            '35=j|45=2|372=AF|380=3|'.replace('|', '\x01'), False)
+        self.adapter.fromApp(message, None)
+        self._wait_for_sends(4)
+
+        sent = [call[0][0] for call in
+                self.adapter._send_message.call_args_list[1:]]
+        self.assertEqual(
+            [fix.MsgType_OrderStatusRequest] * 3,
+            [m.getHeader().getField(fix.MsgType().getField()) for m in sent])
+
+        self._status_report('1', OrdStatus.NEW, 0)
+        self._status_report('2', OrdStatus.PARTIALLY_FILLED, 5)
+        self.assertFalse(self.handler.on_reconciliation_complete.called)
+        self._status_report('3', OrdStatus.NEW, 0)
+
+        report = self.handler.on_reconciliation_complete.call_args[0][0]
+        self.assertEqual([], report.discrepancies)
+
+    def test_logout_finishes_incomplete(self):
+        self.reconciler.start()
+        self.adapter.onLogout(None)
+
+        report = self.handler.on_reconciliation_complete.call_args[0][0]
+        self.assertFalse(report.complete)
+        self.assertEqual([], report.discrepancies)
+        self.assertEqual(['1', '2', '3'], sorted(report.unreported))
+
+    def test_timeout_does_not_flag_unreported_orders_missing(self):
+        self.reconciler.timeout = 0.01
+        self.reconciler.start()
+        self._status_report('1', OrdStatus.CANCELED, 0)
+
+        deadline = time.time() + 5
+        while not self.handler.on_reconciliation_complete.called and \
+                time.time() < deadline:
+            time.sleep(0.01)
+
+        report = self.handler.on_reconciliation_complete.call_args[0][0]
+        self.assertFalse(report.complete)
+        self.assertEqual([(Discrepancy.STATUS, '1')],
+                         [(d.kind, d.order_id) for d in report.discrepancies])
+        self.assertEqual(['2', '3'], sorted(report.unreported))
+
+    def test_report_for_other_mass_status_request_ignored(self):
+        self.reconciler.start()
+
+        self._status_report('1', OrdStatus.CANCELED, 0, last=True,
+                            mass_status_req_id='MSR_0')
+
+        self.assertFalse(self.handler.on_reconciliation_complete.called)
+        self.assertEqual({}, self.reconciler.venue_states)
+        self.reconciler.finish()
+
+    def test_logon_does_not_reconcile_by_default(self):
+        self.adapter.onLogon(None)
+
+        self.assertFalse(self.reconciler.in_progress)
+        self.assertFalse(self.adapter._send_message.called)
+
+    def test_status_report_ignored_when_idle(self):
+        self._status_report('1', OrdStatus.NEW, 0, last=True)
+
+        self.assertFalse(self.handler.on_reconciliation_complete.called)
+
+    def _store_order(self, order_id, status, executed_qty):
+        order = Order()
+        order.order_id = order_id
+        order.symbol = 'TEST'
+        order.side = Side.BUY
+        order.status = status
+        order.executed_qty = executed_qty
+        self.adapter.order_store.update_order_maps(order_id + '_1', order)
+
+    def _status_report(self, order_id, ord_status, executed_qty, last=False,
+                       mass_status_req_id=None):
+        if mass_status_req_id is None and \
+                self.reconciler.mass_status_supported:
+            mass_status_req_id = self.reconciler.mass_status_req_id
+        message = fix.Message(
+            '35=8|11={}_1|14={}|37=M{}|39={}|55=TEST|150=I|{}{}'.format(
+                order_id, executed_qty, order_id, ord_status,
+                '584={}|'.format(mass_status_req_id)
+                if mass_status_req_id else '',
+                '912=Y|' if last else '').replace('|', '\x01'), False)
+        self.adapter._process_execution_report(message)
+
+    def _wait_for_sends(self, count, timeout=5):
+        deadline = time.time() + timeout
+        while self.adapter._send_message.call_count < count and \
+                time.time() < deadline:
+            time.sleep(0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
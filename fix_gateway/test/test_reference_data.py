@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from fix_gateway.fixed_point import FixedPointCodec
+from fix_gateway.reference_data import *
+
+REFERENCE_DATA = '''symbol,currency,tick_size,lot_size
+TEST,GBP,0.01,100
+FREE,USD,,
+'''
+
+
+class TestReferenceDataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'instruments.csv')
+        self._write(REFERENCE_DATA)
+        self.cache = ReferenceDataCache(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, text):
+        with open(self.path, 'w') as reference_file:
+            reference_file.write(text)
+
+    def test_load(self):
+        instrument = self.cache.find('TEST')
+
+        self.assertEqual(2, len(self.cache))
+        self.assertEqual('GBP', instrument.currency)
+        self.assertEqual(0.01, instrument.tick)
+        self.assertEqual(100.0, instrument.lot)
+        self.assertEqual(0, self.cache.symbol_id('TEST'))
+        self.assertEqual('FREE', self.cache.symbol(1))
+        self.assertIsNone(self.cache.find('OTHER'))
+
+    def test_intern_returns_cached_symbol(self):
+        symbol = ''.join(['TE', 'ST'])
+
+        self.assertIs(self.cache.find('TEST').symbol,
+                      self.cache.intern(symbol))
+        self.assertEqual('OTHER', self.cache.intern('OTHER'))
+
+    def test_validate(self):
+        self.assertIsNone(self.cache.validate('TEST', 200, 123.45, 'GBP'))
+        self.assertIsNone(self.cache.validate('TEST', 200))
+        self.assertIsNone(self.cache.validate('FREE', 7, 1.23456))
+
+        self.assertEqual(UNKNOWN_SYMBOL,
+                         self.cache.validate('OTHER', 100, 1.0)[0])
+        self.assertEqual(OTHER,
+                         self.cache.validate('TEST', 100, 1.0, 'USD')[0])
+        self.assertEqual(INCORRECT_QUANTITY,
+                         self.cache.validate('TEST', 150, 1.0)[0])
+        self.assertEqual(INCORRECT_QUANTITY,
+                         self.cache.validate('FREE', 0)[0])
+        self.assertEqual(OTHER, self.cache.validate('TEST', 100, 123.455)[0])
+
+    def test_validate_fixed_point(self):
+        cache = ReferenceDataCache(self.path, fixed_point=FixedPointCodec(
+            default_price_scale=4, default_qty_scale=0))
+
+        self.assertEqual(100, cache.find('TEST').tick)
+        self.assertIsNone(cache.validate('TEST', 200, 1234500))
+        self.assertEqual(OTHER, cache.validate('TEST', 200, 1234550)[0])
+
+    def test_invalid_rows_skipped(self):
+        self._write(REFERENCE_DATA + 'BAD,GBP,abc,1\nZERO,GBP,0,1\n,GBP,,\n')
+
+        self.assertEqual(2, self.cache.reload())
+        self.assertIsNone(self.cache.find('BAD'))
+        self.assertIsNone(self.cache.find('ZERO'))
+        self.assertIsNone(self.cache.symbol_id('BAD'))
+        self.assertEqual(['TEST', 'FREE'], self.cache.symbols)
+
+    def test_reload_keeps_symbol_ids(self):
+        self._write('symbol,currency,tick_size,lot_size\n'
+                    'NEW,EUR,0.5,1\nTEST,GBP,0.05,100\n')
+
+        self.assertEqual(2, self.cache.reload())
+        self.assertEqual(0, self.cache.symbol_id('TEST'))
+        self.assertEqual(2, self.cache.symbol_id('NEW'))
+        self.assertEqual(0.05, self.cache.find('TEST').tick)
+        self.assertIsNone(self.cache.find('FREE'))
+        self.assertEqual(1, self.cache.symbol_id('FREE'))
+
+    def test_reload_if_modified(self):
+        self.assertFalse(self.cache.reload_if_modified())
+
+        self._write('symbol,currency,tick_size,lot_size\nNEW,EUR,0.5,1\n')
+        os.utime(self.path, (0, self.cache.modified + 10))
+
+        self.assertTrue(self.cache.reload_if_modified())
+        self.assertIsNotNone(self.cache.find('NEW'))
+
+    def test_reload_if_modified_keeps_instruments_when_file_missing(self):
+        os.remove(self.path)
+
+        self.assertFalse(self.cache.reload_if_modified())
+        self.assertEqual(2, len(self.cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import multiprocessing
+import unittest
+
+from fix_gateway.shm_queue import Empty, Full, SharedMemoryQueue, \
+    serialise
+
+
+def _produce(queue, count):
+    for i in range(count):
+        queue.put(('item', i))
+
+
+class TestSharedMemoryQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = SharedMemoryQueue(slots=4, slot_size=128)
+
+    def test_put_get(self):
+        self.queue.put_nowait(('on_new_ack', {'order_id': '12345'}))
+
+        self.assertEqual(1, self.queue.qsize())
+        self.assertEqual(('on_new_ack', {'order_id': '12345'}),
+                         self.queue.get_nowait())
+        self.assertTrue(self.queue.empty())
+
+    def test_put_serialised(self):
+        data = serialise(('on_new_ack', {'order_id': '12345'}))
+        self.queue.put_serialised_nowait(data)
+
+        self.assertEqual(('on_new_ack', {'order_id': '12345'}),
+                         self.queue.get_nowait())
+
+    def test_get_empty(self):
+        with self.assertRaises(Empty):
+            self.queue.get_nowait()
+
+    def test_put_full(self):
+        for i in range(4):
+            self.queue.put_nowait(i)
+
+        with self.assertRaises(Full):
+            self.queue.put_nowait(4)
+
+    def test_wraps_around(self):
+        for i in range(10):
+            self.queue.put_nowait(i)
+            self.assertEqual(i, self.queue.get_nowait())
+
+    def test_put_oversized_item(self):
+        with self.assertRaises(ValueError):
+            self.queue.put_nowait('x' * 256)
+
+    def test_get_timeout(self):
+        with self.assertRaises(Empty):
+            self.queue.get(timeout=0.01)
+
+    def test_across_processes(self):
+        process = multiprocessing.Process(target=_produce,
+                                          args=(self.queue, 100))
+        process.start()
+
+        received = [self.queue.get(timeout=5) for _ in range(100)]
+        process.join()
+
+        self.assertEqual([('item', i) for i in range(100)], received)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import calendar
+import unittest
+
+from fix_gateway.timestamps import UtcTimestampCodec
+
+NOV_5_2012 = calendar.timegm((2012, 11, 5, 23, 25, 25)) * 10 ** 9
+
+
+class TestUtcTimestampCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = UtcTimestampCodec()
+
+    def test_parse(self):
+        self.assertEqual(NOV_5_2012, self.codec.parse('20121105-23:25:25'))
+        self.assertEqual(NOV_5_2012 + 123000000,
+                         self.codec.parse('20121105-23:25:25.123'))
+        self.assertEqual(NOV_5_2012 + 123456000,
+                         self.codec.parse('20121105-23:25:25.123456'))
+        self.assertEqual(NOV_5_2012 + 123456789,
+                         self.codec.parse('20121105-23:25:25.123456789'))
+
+    def test_parse_across_days(self):
+        self.assertEqual(0, self.codec.parse('19700101-00:00:00'))
+        self.assertEqual(NOV_5_2012, self.codec.parse('20121105-23:25:25'))
+        self.assertEqual(NOV_5_2012 + 3600 * 10 ** 9,
+                         self.codec.parse('20121106-00:25:25'))
+
+    def test_format(self):
+        self.assertEqual('20121105-23:25:25',
+                         self.codec.format(NOV_5_2012, precision=0))
+        self.assertEqual('20121105-23:25:25.123',
+                         self.codec.format(NOV_5_2012 + 123456789))
+        self.assertEqual('20121105-23:25:25.123456789',
+                         self.codec.format(NOV_5_2012 + 123456789,
+                                           precision=9))
+        self.assertEqual('20121106-00:00:00.000',
+                         self.codec.format(NOV_5_2012 + 2075 * 10 ** 9))
+
+    def test_round_trip(self):
+        nanos = NOV_5_2012 + 1000001
+        self.assertEqual(nanos,
+                         self.codec.parse(self.codec.format(nanos, 9)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import threading
+import time
+
+
+class RateLimiter(object):
+    """Token bucket limiting how many messages are sent per second.
+
+    Up to burst messages may be sent back to back, after which callers are
+    paced to max_per_second.
+    """
+
+    def __init__(self, max_per_second, burst=None, clock=time.time,
+                 sleep=time.sleep):
+        self.max_per_second = float(max_per_second)
+        self.burst = float(burst if burst is not None else max_per_second)
+        self.tokens = self.burst
+        self.clock = clock
+        self.sleep = sleep
+        self.last_refill = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens +
+                          (now - self.last_refill) * self.max_per_second)
+        self.last_refill = now
+
+    def try_acquire(self, count=1):
+        with self.lock:
+            self._refill()
+            if self.tokens >= count:
+                self.tokens -= count
+                return True
+            return False
+
+    def acquire(self, count=1):
+        """Blocks until count messages may be sent."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= count:
+                    self.tokens -= count
+                    return
+                wait = (count - self.tokens) / self.max_per_second
+            self.sleep(wait)
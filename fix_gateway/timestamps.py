@@ -0,0 +1,79 @@
+from datetime import date
+import time
+
+NANOS_PER_SECOND = 10 ** 9
+NANOS_PER_MINUTE = 60 * NANOS_PER_SECOND
+NANOS_PER_DAY = 1440 * NANOS_PER_MINUTE
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+if hasattr(time, 'time_ns'):
+    time_ns = time.time_ns
+else:
+    def time_ns():
+        return int(time.time() * NANOS_PER_SECOND)
+
+
+class UtcTimestampCodec(object):
+    """Converts FIX UTCTimestamps to and from integer epoch nanoseconds.
+
+    Accepts YYYYMMDD-HH:MM:SS with an optional fraction of up to nine
+    digits. Timestamps arriving together almost always share a date and
+    minute, so the last date and minute seen are cached in each direction
+    and usually only the seconds and fraction are converted per call.
+    """
+
+    def __init__(self):
+        # Cache entries are replaced as whole tuples so concurrent callers
+        # never see a prefix paired with another prefix's offset
+        self._parse_day = (None, 0)
+        self._parse_minute = (None, 0)
+        self._format_minute = (None, '')
+
+    def parse(self, text):
+        minute, minute_nanos = self._parse_minute
+        if text[:14] != minute:
+            minute = text[:14]
+            minute_nanos = self._day_nanos(minute[:8]) + (
+                int(minute[9:11]) * 60 + int(minute[12:14])) * \
+                NANOS_PER_MINUTE
+            self._parse_minute = (minute, minute_nanos)
+
+        nanos = minute_nanos + int(text[15:17]) * NANOS_PER_SECOND
+
+        fraction = text[18:27]
+        if fraction:
+            nanos += int(fraction) * 10 ** (9 - len(fraction))
+        return nanos
+
+    def _day_nanos(self, day):
+        cached_day, day_nanos = self._parse_day
+        if day != cached_day:
+            day_nanos = (date(int(day[:4]), int(day[4:6]),
+                              int(day[6:8])).toordinal() -
+                         _EPOCH_ORDINAL) * NANOS_PER_DAY
+            self._parse_day = (day, day_nanos)
+        return day_nanos
+
+    def format(self, nanos, precision=3):
+        """Formats epoch nanoseconds with precision fractional digits,
+        truncating any finer digits.
+        """
+        minutes, minute_nanos = divmod(nanos, NANOS_PER_MINUTE)
+        minute, prefix = self._format_minute
+        if minutes != minute:
+            days, minute_of_day = divmod(minutes, 1440)
+            prefix = '%s%02d:%02d:' % (
+                date.fromordinal(days + _EPOCH_ORDINAL).strftime('%Y%m%d-'),
+                minute_of_day // 60, minute_of_day % 60)
+            self._format_minute = (minutes, prefix)
+
+        seconds, fraction = divmod(minute_nanos, NANOS_PER_SECOND)
+        if precision:
+            return '%s%02d.%0*d' % (prefix, seconds, precision,
+                                    fraction // 10 ** (9 - precision))
+        return '%s%02d' % (prefix, seconds)
+
+_codec = UtcTimestampCodec()
+parse_utc_timestamp = _codec.parse
+format_utc_timestamp = _codec.format